@@ -30,8 +30,18 @@ and the class_schedule (a str giving details regarding the blocking of the class
 example, next 10 minutes class discussion etc)
 """
 
-def run_agent():
-    with llm_config:
+def stage_summary(stage, on_stage=None):
+    # Same summary as "last_msg", but reports each chat as soon as it finishes
+    def summary_method(sender, recipient, summary_args):
+        summary = ConversableAgent._last_msg_as_summary(sender, recipient, summary_args)
+        if on_stage is not None:
+            on_stage(stage, summary)
+        return summary
+    return summary_method
+
+def run_agent(on_stage=None):
+    # runs on several worker threads at once, each enters its own copy of the config
+    with llm_config.copy():
         lesson_curriculum = ConversableAgent(
             name="curriculm_agent",
             system_message=curriculum_message,
@@ -58,19 +68,19 @@ def run_agent():
                 "recipient": lesson_curriculum,
                 "message": "Let's create a science lesson, what's a good topic?",
                 "max_turns": 1,
-                "summary_method": "last_msg",
+                "summary_method": stage_summary("curriculum", on_stage),
             },
             {
                 "recipient": lesson_planner,
                 "message": "Create a lesson plan.",
                 "max_turns": 2, # One revision
-                "summary_method": "last_msg",
+                "summary_method": stage_summary("planner", on_stage),
             },
             {
                 "recipient": lesson_formatter,
                 "message": "Format the lesson plan.",
                 "max_turns": 1,
-                "summary_method": "last_msg",
+                "summary_method": stage_summary("formatter", on_stage),
             },
         ]
     )
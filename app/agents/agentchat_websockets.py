@@ -1,32 +1,324 @@
+import json
+import math
+import socket
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from tempfile import TemporaryDirectory
 from websockets.sync.client import connect as ws_connect
 from autogen.io.websockets import IOWebsockets
-from app.core.config import llm_config
-from app.agents.financial_group import run_group
-from app.agents.tech_support_group import tech_support_group
-from app.agents.heirerarchical_research import research_group
+from app.core.config import lazy, llm_config, MAX_ACTIVE_RUNS, FLOW_POOL_SIZE, FLOW_WARMUP, TRACE_DIR, RESEARCH_BRANCH_WORKERS
+from app.core.config import SESSION_WORKERS, SESSION_WORKER_RUNS, ADMISSION_MAX_PENDING, ADMISSION_MAX_WAIT, FLOW_CONCURRENCY
+from app.core.config import RUN_DEADLINE_SECONDS, CHECKPOINT_DIR, CHECKPOINT_TTL, CHECKPOINT_MAX_MB, ACCOUNT_KEYS
+from app.core.config import CLUSTER_BROKER, CLUSTER_NODES, CLUSTER_HEARTBEAT_MS, SESSION_DETACH_SECONDS
+from app.core.config import LLM_CACHE_FLOWS, LLM_CACHE_DIR, LLM_CACHE_MEMORY_MB, LLM_CACHE_DISK_MB, LLM_CACHE_TTL
+from app.core.config import HISTORY_FLOWS, HISTORY_KEEP_RECENT, HISTORY_MAX_MESSAGES
+from app.core.config import STREAM_FLOWS, STREAM_CHUNK_BYTES, STREAM_CHUNK_MS, WS_BATCH_MS, WS_BATCH_BYTES
+from app.core.admission import AdmissionController
+from app.core.broker import LocalBroker
+from app.core.cancellation import watch_turns
+from app.core.checkpoints import CheckpointStore, checkpoint_rounds
+from app.core.cluster import SessionGateway, SessionNode
+from app.core.flow_events import FlowEventEncoder, INLINE_PAYLOAD_BYTES, MAX_INLINE_PAYLOAD_BYTES
+from app.core.flow_pool import FlowPool
+from app.core.flow_registry import flows
+from app.core.framing import FrameWriter
+from app.core.history import CompactionStats, compact_history
+from app.core.layout import LayoutEngine
+from app.core.llm_cache import ResponseCache
+from app.core.sessions import SessionEngine
+from app.core.streaming import mark_turns
+from app.core.trace_store import TraceStore
+from app.core.workers import WorkerPool
+from app.agents.replay import replay_run
+
+# Every event of every run is recorded, see app/core/trace_store.py
+trace_store = TraceStore(TRACE_DIR) if TRACE_DIR else None
+
+# Repeated prompts are answered from the response cache, for the flows in LLM_CACHE_FLOWS
+response_cache = ResponseCache(
+    LLM_CACHE_DIR,
+    memory_bytes=LLM_CACHE_MEMORY_MB * 1024 * 1024,
+    disk_bytes=LLM_CACHE_DISK_MB * 1024 * 1024,
+    ttl=LLM_CACHE_TTL,
+) if LLM_CACHE_FLOWS else None
+
+# Runs are checkpointed after every round so a client can resume them, see app/core/checkpoints.py
+checkpoint_store = CheckpointStore(
+    CHECKPOINT_DIR, ttl=CHECKPOINT_TTL, max_bytes=CHECKPOINT_MAX_MB * 1024 * 1024,
+) if CHECKPOINT_DIR else None
+
+# Prompt tokens saved by history compaction, for the flows in HISTORY_FLOWS
+history_stats = CompactionStats()
+
+# Flow modules are imported on first use, see app/core/flow_registry.py
+def build_flow(flow):
+    spec = flows.load(flow)
+    config = llm_config.copy()
+    if flow in STREAM_FLOWS:
+        for entry in config.config_list:
+            entry.stream = True
+    pattern = spec.build(config)
+    # a cancelled run stops before the next agent turn, see app/core/cancellation.py
+    watch_turns([*pattern.agents, pattern.user_agent])
+    if checkpoint_store is not None:
+        checkpoint_rounds(pattern)
+    if flow in STREAM_FLOWS:
+        mark_turns(pattern.agents)
+    if response_cache is not None and flow in LLM_CACHE_FLOWS:
+        response_cache.attach([*pattern.agents, pattern.user_agent])
+    if flow in HISTORY_FLOWS:
+        compact_history(
+            pattern,
+            keep_recent=HISTORY_KEEP_RECENT,
+            max_messages=HISTORY_MAX_MESSAGES,
+            # hierarchies whose agents only see their own branch
+            branches=getattr(spec, "branches", None),
+            stats=history_stats,
+            flow=flow,
+        )
+    return pattern
+
+# With SESSION_WORKERS the session flows run in worker processes, see app/core/workers.py;
+# the workers import this module too and run FLOW_RUNNERS on their own pools
+session_workers = WorkerPool(
+    SESSION_WORKERS,
+    runs_per_worker=SESSION_WORKER_RUNS,
+    flows=["tech_support", "research"],
+    warmup=FLOW_WARMUP,
+) if SESSION_WORKERS else None
+
+def split_limit(limit, parts, index):
+    # part `index` of `limit` split over `parts`, at least 1 each; 0 (no limit) stays 0
+    if not limit:
+        return limit
+    return max(1, limit // parts + (index < limit % parts))
+
+def make_engine(index=0, engines=1):
+    """The session engine of one of `engines` engines in this process: they share the process,
+    its flow pool, HTTP pool and workers, so they split MAX_ACTIVE_RUNS, the flow limits and
+    the admission queue between them rather than each getting all of it."""
+    max_active_runs = split_limit(MAX_ACTIVE_RUNS, engines, index)
+    return SessionEngine(
+        max_active_runs=max_active_runs,
+        trace_store=trace_store,
+        chunk_bytes=STREAM_CHUNK_BYTES,
+        chunk_seconds=STREAM_CHUNK_MS / 1000,
+        workers=session_workers,
+        # runs beyond the queue or wait limits are turned away, see app/core/admission.py
+        admission=AdmissionController(
+            max_active_runs,
+            max_pending=split_limit(ADMISSION_MAX_PENDING, engines, index) or None,
+            flow_limits={flow: split_limit(limit, engines, index) for flow, limit in FLOW_CONCURRENCY.items()},
+            max_wait=ADMISSION_MAX_WAIT or None,
+            thread_name_prefix="session-run",
+        ),
+        run_deadline=RUN_DEADLINE_SECONDS or None,
+        checkpoints=checkpoint_store,
+    )
+
+engine = make_engine()
+
+# Group topologies are built ahead of time; a run takes a ready instance from the pool.
+# Builds run on several threads and `with llm_config:` keeps its reset token on the config
+# object, so every build enters its own copy.
+flow_pool = FlowPool()
+flow_pool.register("tech_support", partial(build_flow, "tech_support"), size=FLOW_POOL_SIZE)
+flow_pool.register("research", partial(build_flow, "research"), size=FLOW_POOL_SIZE)
+
+def warm_flows(names):
+    # imports the flow modules, then pre-builds the pooled ones in the background
+    flows.warm(*names)
+    flow_pool.warm(*(name for name in names if name in flow_pool))
+
+# Research specialists and managers of every session share this bounded pool in parallel mode
+research_branches = ThreadPoolExecutor(
+    max_workers=RESEARCH_BRANCH_WORKERS, thread_name_prefix="research-branch"
+) if RESEARCH_BRANCH_WORKERS else None
+
+def run_tech_support(initial_msg):
+    # the tier the LLM scheduler queues this run's calls under (current_caller, set by the
+    # session engine), so the agents' premium handoff and the call priority always agree
+    account_tier = lazy("llm_scheduler").tier()
+    return flows.load("tech_support").run(
+        llm_config, initial_msg, pattern=flow_pool.acquire("tech_support"), account_tier=account_tier,
+    )
+
+def run_research(initial_msg):
+    return flows.load("research").run(llm_config, initial_msg, pattern=flow_pool.acquire("research"), executor=research_branches)
+
+FLOW_RUNNERS = {"tech_support": run_tech_support, "research": run_research}
+
+def handle_control(session, msg):
+    # Protocol messages are JSON objects with an "op" key; anything else is chat input
+    if not msg.startswith("{"):
+        return False
+    try:
+        control = json.loads(msg)
+    except ValueError:
+        return False
+    if not isinstance(control, dict) or "op" not in control:
+        return False
+
+    op = control["op"]
+    if op == "hello":
+        # a hello with a bad value is not applied at all, the client gets an error and can resend it
+        try:
+            inline_limit = min(max(int(control.get("inline_limit", INLINE_PAYLOAD_BYTES)), 0), MAX_INLINE_PAYLOAD_BYTES)
+        except (TypeError, ValueError, OverflowError):
+            session.emit({"type": "error", "content": {"content": "inline_limit must be a number of bytes."}})
+            return True
+        if "deadline_s" in control:
+            try:
+                deadline = float(control["deadline_s"])
+            except (TypeError, ValueError):
+                deadline = None
+            if deadline is None or not 0 <= deadline < math.inf:
+                session.emit({"type": "error", "content": {"content": "deadline_s must be a number of seconds, 0 for none."}})
+                return True
+        try:
+            batch_delay = float(control.get("batch_ms", WS_BATCH_MS)) / 1000
+        except (TypeError, ValueError):
+            batch_delay = None
+        if batch_delay is None or not 0 <= batch_delay < math.inf:
+            session.emit({"type": "error", "content": {"content": "batch_ms must be a number of milliseconds."}})
+            return True
+        if "account_key" in control:
+            # the tier comes from the server's ACCOUNT_KEYS, the client only says who it is
+            tier = ACCOUNT_KEYS.get(control["account_key"]) if isinstance(control["account_key"], str) else None
+            if tier is None:
+                session.emit({"type": "error", "content": {"content": "Unknown account_key."}})
+                return True
+        # {"op": "hello", "format": "flow"} switches the session to compact flow events,
+        # with node positions unless "layout" is null ("layered" by default, or "force").
+        # "batch": true groups events into array frames (flushed after "batch_ms"), and
+        # "encoding": "msgpack" sends binary frames, see app/core/framing.py
+        try:
+            writer = FrameWriter(
+                session.iostream.websocket,
+                encoding=control.get("encoding", "json"),
+                batch=bool(control.get("batch")),
+                max_delay=batch_delay,
+                max_bytes=WS_BATCH_BYTES,
+            )
+        except ValueError as e:
+            print(f" - on_connect(): {e}, sending JSON", flush=True)
+            writer = FrameWriter(session.iostream.websocket, batch=bool(control.get("batch")), max_delay=batch_delay)
+        session.set_writer(writer)
+        # "account_key": ... puts the session's LLM calls in its account's priority class, and
+        # sets the account_tier context variable the support agents hand premium users on with
+        if "account_key" in control:
+            session.account_tier = tier
+        # "deadline_s": 120 cancels the session's runs after that many seconds
+        if "deadline_s" in control:
+            session.deadline = deadline or None
+        if control.get("format") == "flow":
+            layout_mode = control.get("layout", "layered")
+            session.encoder = FlowEventEncoder(
+                session.write,
+                inline_limit=inline_limit,
+                layout=LayoutEngine(mode=layout_mode, levels=session.layout_levels) if layout_mode else None,
+            )
+        else:
+            session.encoder = None
+    elif op == "payload" and session.encoder is not None:
+        # refs are the "p" of flow events, sequence numbers
+        ref = control.get("ref")
+        if not isinstance(ref, int):
+            session.emit({"type": "error", "content": {"content": "ref must be the p of a flow event."}})
+            return True
+        session.encoder.send_payload(ref)
+    elif op == "graph" and session.encoder is not None:
+        # full node and edge list as deltas, for a client that lost its copy
+        session.encoder.send_graph()
+    elif op == "cancel":
+        # stops the run in progress (after the current turn, its LLM calls aborted) and drops
+        # the messages queued behind it; the client gets {"type": "cancelled", ...}
+        session.engine.cancel(session, "client")
+    elif op == "resume":
+        # {"op": "resume", "session": id} continues the last run of an earlier session of this
+        # client from its checkpoint; the cluster gateway reattaches a session that is still
+        # running instead, and only forwards this when its node is gone
+        session.engine.resume(session, control.get("session"))
+    elif op == "replay" and trace_store is not None:
+        # {"op": "replay", "run_id": ..., "speed": 4} streams a recorded run instead of running
+        # the flow; speed 0 is as fast as possible, no run_id replays the latest run
+        try:
+            speed = float(control.get("speed", 1.0))
+        except (TypeError, ValueError):
+            speed = -1.0
+        if not 0 <= speed < math.inf:
+            session.emit({"type": "error", "content": {"content": "speed must be a number, 0 for as fast as possible."}})
+            return True
+        runs = trace_store.runs()
+        run_id = control.get("run_id") or (runs[-1]["run"] if runs else None)
+        if run_id is None:
+            # without a run id the trace store would read back the records of every run
+            session.emit({"type": "error", "content": {"content": "There is no recorded run to replay."}})
+            return True
+        replay = partial(replay_run, trace_store, speed=speed)
+        session.engine.deliver(session, run_id, run=replay, traced=False, flow="replay")
+    else:
+        print(f" - on_connect(): Ignoring control message {control}", flush=True)
+    return True
+
+def setup_session(session):
+    # run_weather_agents(llm_config, initial_msg)
+    # run_group(llm_config)
+    # session.run, session.flow, session.layout_levels = run_research, "research", flows.load("research").levels
+    session.run, session.flow, session.layout_levels = run_tech_support, "tech_support", flows.load("tech_support").levels
+
+def receive(session, message):
+    # one client message: a control op, or chat input for the session's engine
+    if handle_control(session, message):
+        return
+    session.engine.deliver(session, message)
 
 def on_connect(iostream: IOWebsockets) -> None:
     print(f" - on_connect(): Connected to client using IOWebsockets {iostream}", flush=True)
+    session = engine.open(iostream)
+    setup_session(session)
+    if checkpoint_store is not None:
+        # what the client sends back in {"op": "resume"} after a reconnect
+        session.emit({"type": "session", "content": {"id": session.id, "resumed": False}})
 
-    while True:
-        print(" - on_connect(): Receiving message from client.", flush=True)
+    try:
+        while True:
+            print(" - on_connect(): Receiving message from client.", flush=True)
 
-        # 1. Receive Initial Message
-        initial_msg = iostream.input()
-        print(f"{initial_msg=}")
-        if(initial_msg=="TERMINATE"):
-            break
-        try:
-            # run_weather_agents(llm_config, initial_msg)
-            # run_group(llm_config)
-            tech_support_group(llm_config, initial_msg)
-            # research_group(llm_config, initial_msg)
-            
-        except Exception as e:
-            print(f" - on_connect(): Exception: {e}", flush=True)
-            raise e
-    
+            # 1. Receive Initial Message
+            # This thread only reads the socket; the group chat itself runs on the engine's worker pool
+            initial_msg = iostream.input()
+            print(f"{initial_msg=}")
+            if(initial_msg=="TERMINATE"):
+                break
+            receive(session, initial_msg)
+    finally:
+        engine.close(session)
+
+# Sharded sessions, see app/core/cluster.py: the gateway keeps the sockets and places every
+# session on the least loaded node, each node runs its sessions on its own engine, with its
+# share of the run slots (see make_engine)
+if CLUSTER_BROKER == "local":
+    broker = LocalBroker()
+    cluster_nodes = [
+        SessionNode(
+            f"{socket.gethostname()}-{index}", broker, make_engine(index, CLUSTER_NODES), setup_session, receive,
+            heartbeat=CLUSTER_HEARTBEAT_MS / 1000, detach_seconds=SESSION_DETACH_SECONDS,
+        )
+        for index in range(CLUSTER_NODES)
+    ]
+    gateway = SessionGateway(broker, node_ttl=3 * CLUSTER_HEARTBEAT_MS / 1000)
+elif CLUSTER_BROKER:
+    raise ValueError(f"Unknown CLUSTER_BROKER {CLUSTER_BROKER!r}")
+else:
+    broker, cluster_nodes, gateway = None, [], None
+
+def start_cluster():
+    for node in cluster_nodes:
+        node.start()
+
+# what the websocket server calls for every connection
+client_handler = gateway.on_connect if gateway is not None else on_connect
 
 # TESTING WEBSOCKET
 
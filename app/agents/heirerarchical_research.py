@@ -1,19 +1,49 @@
 # Example task: Research and create a comprehensive report on renewable energy technologies
 
 import json
+import threading
+from concurrent.futures import as_completed
+from contextvars import copy_context
 from autogen import (
     ConversableAgent,
     ContextExpression,
     UserProxyAgent,
 )
 from autogen.agentchat.group import AgentNameTarget, AgentTarget, ContextVariables, ReplyResult, OnContextCondition, ExpressionContextCondition, TerminateTarget, ExpressionAvailableCondition, RevertToUserTarget, OnCondition, StringLLMCondition
+from autogen.agentchat.group.group_tool_executor import GroupToolExecutor
 from autogen.agentchat.group.patterns import DefaultPattern
 from autogen.agentchat import initiate_group_chat
+from autogen.io.base import IOStream
 
 # Setup LLM configuration
 
+# Rows of the executive -> manager -> specialist hierarchy, used by the server-side graph layout
+LAYOUT_LEVELS = {
+    "user": 0,
+    "executive_agent": 1,
+    "renewable_manager": 2,
+    "storage_manager": 2,
+    "alternative_manager": 2,
+    "solar_specialist": 3,
+    "wind_specialist": 3,
+    "hydro_specialist": 3,
+    "geothermal_specialist": 3,
+    "biofuel_specialist": 3,
+}
+
+# Each manager and the specialists reporting to it; branches share nothing until the executive joins them
+RESEARCH_BRANCHES = {
+    "renewable_manager": ["solar_specialist", "wind_specialist"],
+    "storage_manager": ["hydro_specialist", "geothermal_specialist"],
+    "alternative_manager": ["biofuel_specialist"],
+}
+
+# Replies a parallel branch agent gets to call its tool before the branch fails
+TOOL_CALL_ATTEMPTS = 3
+
 # Shared context for all agents in the group chat
-def research_group(llm_config, initial_msg):
+def build_research_group(llm_config):
+    # Builds a fresh agent topology; it is single use, so every run needs its own
     shared_context = ContextVariables(data={
         # Project state
         "task_started": False,
@@ -472,13 +502,6 @@ def research_group(llm_config, initial_msg):
     specialist_b2.handoffs.set_after_work(AgentTarget(storage_manager))
     specialist_c1.handoffs.set_after_work(AgentTarget(alternative_manager))
 
-    # ========================
-    # INITIATE THE GROUP CHAT
-    # ========================
-
-    """Run the hierarchical group chat to generate a renewable energy report"""
-    print("Initiating Hierarchical Group Chat for Renewable Energy Report...")
-
     agent_pattern = DefaultPattern(
         initial_agent=executive_agent,
         agents=[
@@ -493,13 +516,127 @@ def research_group(llm_config, initial_msg):
         group_after_work=TerminateTarget(),  # Default fallback if agent doesn't specify
         user_agent=user,
     )
+    return agent_pattern
+
+# ========================
+# INITIATE THE GROUP CHAT
+# ========================
+
+class ParallelResearch:
+    """Runs the research hierarchy with independent branches at the same time.
+
+    In the group chat every specialist waits for the one before it, although their work only
+    meets in the executive's report. Here every specialist turn is submitted to `executor` at
+    once, each manager compiles its section as soon as its own specialists are done, and the
+    executive writes the report when all managers are in, so the wall time is about that of
+    the longest branch.
+
+    Tools run through the group's tool executor, as in the group chat: on a copy of the context
+    variables, with the returned copy merged back, and their results go back to the agent as
+    tool messages answering its calls. Call and merge happen under one lock, so concurrent
+    branches never lose each other's writes and completion flags see every branch finished
+    before them.
+    """
+
+    def __init__(self, pattern, executor):
+        self.agents = {agent.name: agent for agent in pattern.agents}
+        self.user = pattern.user_agent
+        self.context = pattern.context_variables
+        self.executor = executor
+        # strips context_variables from the tool schemas and injects the shared context instead
+        self.tools = GroupToolExecutor()
+        self.tools.register_agents_functions(pattern.agents, self.context)
+        # where the executor merges the context variables the tools return
+        self.tools.context_variables = self.context
+        self.speakers = []
+        self._lock = threading.Lock()
+        # branch threads send to the same client as the thread that started the run
+        self.stream = IOStream.get_default()
+
+    def run(self, initial_msg):
+        executive = self.agents["executive_agent"]
+        self.turn(self.user, executive, f"{initial_msg}\n\nStart the research with initiate_research.", "initiate_research")
+
+        # branches run in a copy of this thread's context, so their LLM calls are queued for
+        # the same session (app/core/llm_scheduler.py)
+        specialists = {}
+        for manager, names in RESEARCH_BRANCHES.items():
+            for name in names:
+                task = f"{initial_msg}\n\nResearch your area and submit your findings with {self.agents[name].tools[0].name}."
+                future = self.executor.submit(copy_context().run, self.turn, self.agents[manager], self.agents[name], task)
+                specialists[future] = manager
+
+        waiting = {manager: len(names) for manager, names in RESEARCH_BRANCHES.items()}
+        managers = []
+        for future in as_completed(specialists):
+            future.result()
+            manager = specialists[future]
+            waiting[manager] -= 1
+            if not waiting[manager]:
+                managers.append(self.executor.submit(copy_context().run, self.turn, executive, self.agents[manager], self.section_task(manager)))
+        for future in as_completed(managers):
+            future.result()
+
+        sections = "\n\n".join(f"{name}:\n{text}" for name, text in self.context["report_sections"].items())
+        self.turn(self.user, executive, f"All sections are in.\n\n{sections}\n\nCompile the final report with compile_final_report.", "compile_final_report")
+        return self.context
+
+    def section_task(self, manager):
+        research = "\n\n".join(
+            f"{name}:\n{self.context[name.replace('_specialist', '_research')]}" for name in RESEARCH_BRANCHES[manager]
+        )
+        return f"Your specialists have finished.\n\n{research}\n\nCompile your section with {self.agents[manager].tools[0].name}."
+
+    def turn(self, caller, agent, task, tool=None):
+        """One LLM turn of `agent` on `task` from `caller`, then the tool it called.
+
+        An agent that answers in text instead of calling one of its tools is asked again, up to
+        TOOL_CALL_ATTEMPTS replies; after that its branch fails with a RuntimeError.
+        """
+        own = {t.name for t in agent.tools}
+        # the tool to ask for: `tool`, or the agent's first one
+        expected = tool or agent.tools[0].name
+        with IOStream.set_default(self.stream):
+            caller.send(task, agent, request_reply=False)
+            for _ in range(TOOL_CALL_ATTEMPTS):
+                reply = agent.generate_reply(sender=caller) or ""
+                agent.send(reply, caller, request_reply=False)
+                calls = reply.get("tool_calls") if isinstance(reply, dict) else None
+                if calls:
+                    with self._lock:
+                        self.speakers.append(agent.name)
+                        # the group's tool executor runs the calls and merges the context
+                        # variables the tools return, as in the group chat
+                        response = self.tools.generate_reply(messages=[reply], sender=agent)
+                    # one tool message per call id, which the API wants before the agent's next turn
+                    caller.send(response, agent, request_reply=False)
+                    if any(call["function"]["name"] in own for call in calls):
+                        return
+                caller.send(f"Call {expected} to submit your work.", agent, request_reply=False)
+        raise RuntimeError(f"{agent.name} did not call {expected} in {TOOL_CALL_ATTEMPTS} replies")
+
+
+def research_group(llm_config, initial_msg, pattern=None, executor=None):
+    """Run the hierarchical group chat to generate a renewable energy report"""
+    # Pass a pattern taken from the flow pool to skip building the agents here
+    agent_pattern = pattern if pattern is not None else build_research_group(llm_config)
 
-    # Provide default after_work option that aligns with hierarchical pattern
-    chat_result, final_context, last_agent = initiate_group_chat(
-        pattern=agent_pattern,
-        messages=initial_msg,
-        max_rounds=50,
-    )
+    print("Initiating Hierarchical Group Chat for Renewable Energy Report...")
+
+    if executor is not None:
+        # Independent specialists and managers run side by side on the executor
+        research = ParallelResearch(agent_pattern, executor)
+        final_context = research.run(initial_msg)
+        speakers = research.speakers
+    else:
+        # Provide default after_work option that aligns with hierarchical pattern
+        chat_result, final_context, last_agent = initiate_group_chat(
+            pattern=agent_pattern,
+            messages=initial_msg,
+            max_rounds=50,
+        )
+        speakers = [message["name"] for message in chat_result.chat_history
+                    if "name" in message and message["name"] != "_Group_Tool_Executor"]
 
     # The final report will be stored in final_context["final_report"]
     if final_context["task_completed"]:
@@ -509,8 +646,7 @@ def research_group(llm_config, initial_msg):
         print("\n\n===== FINAL CONTEXT VARIABLES =====\n")
         print(json.dumps(final_context.to_dict(), indent=2))
         print("\n\n===== SPEAKER ORDER =====\n")
-        for message in chat_result.chat_history:
-            if "name" in message and message["name"] != "_Group_Tool_Executor":
-                print(f"{message['name']}")
+        for speaker in speakers:
+            print(f"{speaker}")
     else:
         print("Report generation did not complete successfully.")
\ No newline at end of file
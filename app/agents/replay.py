@@ -0,0 +1,29 @@
+import time
+from autogen.io.base import IOStream
+
+# Replay a recorded run
+# Streams the events of a run from the trace store to the connected client through the
+# normal session output path (flow encoder, graph, layout), without building any agents or
+# calling any model. Useful to debug the visualizer and to load test the websocket path.
+
+def replay_run(trace_store, run_id, speed=1.0):
+    """Send the run's events with their original spacing divided by `speed`.
+
+    A `speed` of 0 sends them as fast as the socket takes them. Returns the number of events sent.
+    """
+    iostream = IOStream.get_default()
+    started = time.monotonic()
+    first_ts = None
+    sent = 0
+    for record in trace_store.read(run_id=run_id):
+        if speed:
+            if first_ts is None:
+                first_ts = record["ts"]
+            # sleep until the event's scheduled time, so delays don't add up over a long run
+            delay = (record["ts"] - first_ts) / speed - (time.monotonic() - started)
+            if delay > 0:
+                time.sleep(delay)
+        iostream.send(record["event"])
+        sent += 1
+    print(f" - replay_run(): sent {sent} events of run {run_id} in {time.monotonic() - started:.2f}s", flush=True)
+    return sent
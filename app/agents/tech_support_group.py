@@ -1,3 +1,4 @@
+import re
 from typing import Annotated
 from autogen import ConversableAgent, UserProxyAgent
 from autogen.agentchat import initiate_group_chat
@@ -9,7 +10,43 @@ from autogen.agentchat.group import (
     RevertToUserTarget
 )
 
-def tech_support_group(llm_config, initial_msg):
+# Rows of the support hierarchy, used by the server-side graph layout
+LAYOUT_LEVELS = {
+    "user_proxy": 0,
+    "triage_agent": 1,
+    "tech_agent": 2,
+    "general_agent": 2,
+    "computer_agent": 3,
+    "smartphone_agent": 3,
+    "advanced_troubleshooting_agent": 4,
+}
+
+# Keywords that make a query technical, matched as one compiled pattern
+TECHNICAL_KEYWORDS = ["error", "bug", "broken", "crash", "not working", "shutting down",
+                      "frozen", "blue screen", "won't start", "slow", "virus"]
+TECHNICAL_PATTERN = re.compile("|".join(re.escape(keyword) for keyword in TECHNICAL_KEYWORDS), re.IGNORECASE)
+
+def route_query(query):
+    """The agent classify_query hands a query to: tech_agent or general_agent."""
+    return "tech_agent" if TECHNICAL_PATTERN.search(query) else "general_agent"
+
+def preroute(pattern, initial_msg):
+    """Start the group at the agent classify_query would pick, skipping triage.
+
+    Triage only asks the model to call classify_query, which routes on keywords alone, so for
+    a plain text first message the outcome is already known. Anything else still goes
+    through triage_agent.
+    """
+    if not isinstance(initial_msg, str) or not initial_msg.strip():
+        return None
+    route = route_query(initial_msg)
+    agents = {agent.name: agent for agent in pattern.agents}
+    pattern.initial_agent = agents[route]
+    pattern.context_variables["query_count"] += 1
+    return route
+
+def build_tech_support_group(llm_config):
+    # Builds a fresh agent topology; it is single use, so every run needs its own
     # Initialize context variables for our support system
     support_context = ContextVariables(data={
         "query_count": 0,
@@ -17,6 +54,7 @@ def tech_support_group(llm_config, initial_msg):
         "previous_solutions": [],
         "issue_type": "",
         "issue_subtype": "",
+        "account_tier": "standard",
     })
 
     # Configure the LLM
@@ -110,10 +148,7 @@ def tech_support_group(llm_config, initial_msg):
         context_variables["query_count"] += 1
 
         # Simple classification logic
-        technical_keywords = ["error", "bug", "broken", "crash", "not working", "shutting down",
-                            "frozen", "blue screen", "won't start", "slow", "virus"]
-
-        if any(keyword in query.lower() for keyword in technical_keywords):
+        if route_query(query) == "tech_agent":
             return ReplyResult(
                 message="This appears to be a technical issue. Let me route you to our tech support team.",
                 target=AgentTarget(tech_agent),
@@ -209,6 +244,18 @@ def tech_support_group(llm_config, initial_msg):
         group_manager_args = {"llm_config": llm_config},
     )
 
+    return pattern
+
+def tech_support_group(llm_config, initial_msg, pattern=None, fast_path=True, account_tier=None):
+    # Pass a pattern taken from the flow pool to skip building the agents here
+    if pattern is None:
+        pattern = build_tech_support_group(llm_config)
+    if account_tier is not None:
+        # the user's tier as the server knows it, for the premium handoff
+        pattern.context_variables["account_tier"] = account_tier
+    if fast_path:
+        preroute(pattern, initial_msg)
+
     # Run the chat
     result, final_context, last_agent = initiate_group_chat(
         pattern=pattern,
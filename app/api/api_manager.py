@@ -1,9 +1,178 @@
-from fastapi import Request  # You can delete FastAPI and APIRouter
-from app.agents.agent_manager import run_agent
+import asyncio
+import json
+from fastapi import HTTPException, Request  # You can delete FastAPI and APIRouter
+from fastapi.responses import JSONResponse, StreamingResponse
+from app.core import config
+from app.core.config import MAX_ACTIVE_RUNS, ADMISSION_MAX_PENDING, ADMISSION_MAX_WAIT, FLOW_CONCURRENCY
+from app.core.admission import AdmissionController, Busy
+from app.core.flow_registry import flows
+from app.core.jobs import JobManager
+
+class StackStartup:
+    """How far app/main.py got bringing up the agent stack and the websocket server."""
+
+    def __init__(self):
+        self.state = "starting"
+        self.error = None
+        self.stack = None
+
+    def ready(self, stack):
+        self.stack, self.state = stack, "ready"
+
+    def failed(self, error):
+        self.state, self.error = "failed", f"{type(error).__name__}: {error}"
+
+    def to_dict(self):
+        return {"status": self.state, "error": self.error}
+
+startup = StackStartup()
+
+def agent_stack():
+    # the websocket side (sessions, flow pool, caches) loads autogen, which takes seconds:
+    # app/main.py imports it on its own thread at startup, and until it is up the routes that
+    # need it answer 503 rather than import it on the event loop
+    if startup.stack is None:
+        detail = f"The agent stack failed to start: {startup.error}" if startup.error else "The agent stack is still starting"
+        raise HTTPException(status_code=503, detail=detail)
+    return startup.stack
+
+def run_agent(on_stage=None):
+    # the flow module is imported by the job thread, not the event loop
+    return flows.load("agent_manager").run(on_stage=on_stage)
+
+# run_agent blocks for the whole initiate_chats sequence, so it runs as a background job
+jobs = JobManager(admission=AdmissionController(
+    MAX_ACTIVE_RUNS,
+    max_pending=ADMISSION_MAX_PENDING or None,
+    flow_limits=FLOW_CONCURRENCY,
+    max_wait=ADMISSION_MAX_WAIT or None,
+    thread_name_prefix="job",
+))
+
+def get_job(job_id):
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job {job_id}")
+    return job
 
 # Just a standalone route handler
+# Returns a job id right away; poll /chat/{job_id} or stream /chat/{job_id}/stream for the result.
+# Under load it answers 503 with Retry-After at once instead of queueing the job.
 async def chat():
     # data = await request.json()
     # user_input = data.get("input")
-    result = run_agent()
-    return {"response": result}
\ No newline at end of file
+    try:
+        job = jobs.submit(run_agent, flow="agent_manager")
+    except Busy as busy:
+        return JSONResponse(
+            {"status": "busy", "reason": busy.reason, "retry_after": busy.retry_after},
+            status_code=503,
+            headers={"Retry-After": str(busy.retry_after)},
+        )
+    return JSONResponse({"job_id": job.id, "status": job.status}, status_code=202)
+
+
+async def chat_status(job_id: str):
+    return get_job(job_id).to_dict()
+
+
+# Server-sent events: one "stage" event per finished chat (curriculum, planner, formatter), then "done"
+async def chat_stream(job_id: str):
+    job = get_job(job_id)
+
+    async def events():
+        seen = 0
+        while True:
+            await asyncio.to_thread(job.wait_for_change, seen, 5)
+            stages = job.stages[seen:]
+            for stage in stages:
+                yield f"event: stage\ndata: {json.dumps(stage)}\n\n"
+            seen += len(stages)
+            if job.done and seen == len(job.stages):
+                yield f"event: done\ndata: {json.dumps(job.to_dict())}\n\n"
+                return
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+# Whether the agent stack and the websocket server are up: 503 while starting or after they failed to
+async def health():
+    return JSONResponse(startup.to_dict(), status_code=200 if startup.state == "ready" else 503)
+
+
+# Live and idle websocket sessions, and how many group chat runs are queued versus running
+async def session_stats():
+    return agent_stack().engine.stats()
+
+
+# Warm flow pool: ready instances, hit rate and per-session setup time per flow
+async def flow_stats():
+    return agent_stack().flow_pool.stats()
+
+
+# Registered flows: whether each module is imported yet and how long the import took
+async def flow_registry_stats():
+    return flows.stats()
+
+
+# LLM response cache: tier sizes and hit/miss counters per agent
+async def cache_stats():
+    response_cache = agent_stack().response_cache
+    if response_cache is None:
+        raise HTTPException(status_code=404, detail="Response cache is disabled")
+    return response_cache.stats()
+
+
+# Sharded sessions: live nodes and their load, placements and resumes, broker traffic
+async def cluster_stats():
+    stack = agent_stack()
+    if stack.gateway is None:
+        raise HTTPException(status_code=404, detail="Session sharding is disabled")
+    return {
+        "gateway": stack.gateway.stats(),
+        "nodes": [node.stats() for node in stack.cluster_nodes],
+        "broker": stack.broker.stats(),
+    }
+
+
+# Shared LLM connection pool: connection reuse and time spent waiting for a connection
+async def http_pool_stats():
+    return config.http_pool.stats()
+
+
+# Admission control: runs active and pending per flow, queue waits, projected waits, runs turned away
+async def admission_stats():
+    return {"sessions": agent_stack().engine.admission.stats(), "chat": jobs.admission.stats()}
+
+
+# LLM call scheduler: queue depth and wait times per priority class, rate limit buckets, 429s
+async def llm_scheduler_stats():
+    return config.llm_scheduler.stats()
+
+
+# LLM deployments: latency and error rate estimates, circuit states, failovers and hedges
+async def llm_router_stats():
+    router = config.llm_router
+    return router.stats() if router is not None else {"deployments": []}
+
+
+# Prompt tokens before and after history compaction, per flow and agent
+async def compaction_stats():
+    return agent_stack().history_stats.stats()
+
+
+# Recorded runs, newest last
+async def list_traces():
+    trace_store = agent_stack().trace_store
+    if trace_store is None:
+        raise HTTPException(status_code=404, detail="Tracing is disabled")
+    return {"runs": trace_store.runs(), "store": trace_store.stats()}
+
+
+# Events of one recorded run, optionally only one agent or event type, a page at a time
+async def get_trace(run_id: str, agent: str | None = None, event_type: str | None = None, start: int = 0, limit: int = 500):
+    trace_store = agent_stack().trace_store
+    if trace_store is None:
+        raise HTTPException(status_code=404, detail="Tracing is disabled")
+    records = list(trace_store.read(run_id=run_id, agent=agent, event_type=event_type, start=start, limit=limit))
+    return {"run_id": run_id, "start": start, "records": records}
@@ -0,0 +1,130 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+
+import numpy as np
+
+from app.benchmarks.flows import wait_for_mock
+
+# Admission control benchmark
+# A spike of websocket sessions (tech support and research runs) all sending their message at
+# once, against the mock LLM, with the session engine's admission control off and on:
+#
+#   python -m app.benchmarks.admission --spike 24 --research 0.25 --max-wait 5 --research-limit 1
+#
+#   off   every run is queued, as before admission control
+#   on    ADMISSION_MAX_WAIT=--max-wait and FLOW_CONCURRENCY research=--research-limit
+#
+# A few runs go first in each setting so the run time estimates are warm, as on a server
+# that has been up for a while. Per setting and flow it reports how many runs were admitted
+# and turned away, the completion time of the admitted runs (p50/p95/max), and how long a
+# turned away client waited for its "busy, retry after" answer.
+
+
+def session(uri, flow, message, results):
+    from websockets.sync.client import connect as ws_connect
+
+    with ws_connect(uri, max_size=None) as websocket:
+        websocket.send(flow)
+        sent = time.perf_counter()
+        websocket.send(message)
+        outcome = None
+        while outcome is None:
+            raw = websocket.recv()
+            try:
+                event = json.loads(raw)
+            except ValueError:
+                event = None
+            if not isinstance(event, dict):
+                # a human input prompt
+                websocket.send("exit")
+            elif event.get("type") == "busy":
+                outcome = "busy"
+            elif event.get("type") == "bench_done":
+                outcome = "done"
+        results.append({"flow": flow, "outcome": outcome, "seconds": time.perf_counter() - sent})
+        websocket.send("TERMINATE")
+
+
+def wave(uri, flows, message):
+    results = []
+    threads = [threading.Thread(target=session, args=(uri, flow, message, results)) for flow in flows]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def summary(results, flow):
+    done = [r["seconds"] for r in results if r["flow"] == flow and r["outcome"] == "done"]
+    busy = [r["seconds"] for r in results if r["flow"] == flow and r["outcome"] == "busy"]
+    return {
+        "admitted": len(done),
+        "turned_away": len(busy),
+        "done_s": {
+            "p50": round(float(np.percentile(done, 50)), 2),
+            "p95": round(float(np.percentile(done, 95)), 2),
+            "max": round(max(done), 2),
+        } if done else None,
+        "busy_answer_ms": round(float(np.percentile(busy, 50)) * 1000, 1) if busy else None,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--spike", type=int, default=24, help="sessions that send at once")
+    parser.add_argument("--research", type=float, default=0.25, help="fraction of them running the research flow")
+    parser.add_argument("--max-wait", type=float, default=5, help="ADMISSION_MAX_WAIT for the 'on' setting")
+    parser.add_argument("--research-limit", type=int, default=1, help="research runs at once in the 'on' setting")
+    parser.add_argument("--message", default="My laptop won't turn on after the last update.")
+    parser.add_argument("--profile", default="fast", help="mock LLM latency profile")
+    parser.add_argument("--mock-port", type=int, default=8902)
+    parser.add_argument("--ws-port", type=int, default=8769)
+    args = parser.parse_args()
+
+    mock_url = f"http://127.0.0.1:{args.mock_port}/v1"
+    os.environ["LLM_BACKEND"] = "mock"
+    os.environ["MOCK_LLM_URL"] = mock_url
+    os.environ.setdefault("TRACE_DIR", "")
+
+    mock = subprocess.Popen(
+        [sys.executable, "-m", "app.core.mock_llm", "--port", str(args.mock_port), "--profile", args.profile],
+        stdout=subprocess.DEVNULL,
+    )
+    try:
+        wait_for_mock(mock_url)
+        from autogen.io.websockets import IOWebsockets
+        from app.agents.agentchat_websockets import engine, warm_flows
+        from app.benchmarks.flows import flow_runners, make_on_connect
+        from app.core.admission import AdmissionController
+        from app.core.config import MAX_ACTIVE_RUNS
+
+        warm_flows(["tech_support", "research"])
+        research = round(args.spike * args.research)
+        spike = ["research"] * research + ["tech_support"] * (args.spike - research)
+        settings = {
+            "off": {},
+            "on": {"max_wait": args.max_wait, "flow_limits": {"research": args.research_limit}},
+        }
+        report = {"spike": args.spike, "research": research, "max_active_runs": MAX_ACTIVE_RUNS, "settings": {}}
+        with IOWebsockets.run_server_in_thread(on_connect=make_on_connect(flow_runners()), port=args.ws_port) as uri:
+            for name, limits in settings.items():
+                engine.admission = AdmissionController(MAX_ACTIVE_RUNS, thread_name_prefix="session-run", **limits)
+                wave(uri, ["tech_support", "research"] * 2, args.message)
+                started = time.perf_counter()
+                results = wave(uri, spike, args.message)
+                report["settings"][name] = {
+                    "wall_s": round(time.perf_counter() - started, 2),
+                    "tech_support": summary(results, "tech_support"),
+                    "research": summary(results, "research"),
+                    "admission": {k: v for k, v in engine.admission.stats().items() if k in ("rejected",)},
+                }
+        print(json.dumps(report, indent=2))
+    finally:
+        mock.terminate()
+        mock.wait()
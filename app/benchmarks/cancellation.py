@@ -0,0 +1,144 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+
+import numpy as np
+
+from app.benchmarks.flows import wait_for_mock
+
+# Run cancellation benchmark
+# Research runs over websocket sessions against a slow mock LLM, each stopped partway through
+# one of the three ways a run is cancelled (app/core/cancellation.py):
+#
+#   python -m app.benchmarks.cancellation --runs 3 --after 6 --profile slow
+#
+#   complete     the run is left alone: its length and LLM calls, the work a cancel can save
+#   client       the client sends {"op": "cancel"} after --after seconds
+#   disconnect   the client closes the socket after --after seconds
+#   deadline     the client's hello sets "deadline_s": --after
+#
+# Per trigger it reports how long the run took to give its slot back after the cancel
+# (p50/max), how many LLM calls were aborted mid-flight, how many LLM calls were still made
+# after the cancel, and the session engine's estimate of the run time reclaimed.
+# LLM calls are counted in this process's HTTP pool: with SESSION_WORKERS they happen in the
+# workers and only the aborted calls are reported.
+
+
+def llm_requests():
+    from app.core import config
+
+    return config.http_pool.stats()["requests"]
+
+
+def session(uri, trigger, after, message, results):
+    from websockets.sync.client import connect as ws_connect
+
+    websocket = ws_connect(uri, max_size=None)
+    websocket.send("research")
+    if trigger == "deadline":
+        websocket.send(json.dumps({"op": "hello", "deadline_s": after}))
+    started = time.perf_counter()
+    websocket.send(message)
+    result = {"trigger": trigger}
+    cancel_at = started + after if trigger in ("client", "disconnect") else None
+    while True:
+        if cancel_at is not None and time.perf_counter() >= cancel_at:
+            cancel_at = None
+            result["requests_at_cancel"] = llm_requests()
+            if trigger == "disconnect":
+                websocket.close()
+                break
+            websocket.send(json.dumps({"op": "cancel"}))
+        try:
+            raw = websocket.recv(timeout=0.05)
+        except TimeoutError:
+            continue
+        try:
+            event = json.loads(raw)
+        except ValueError:
+            event = None
+        if not isinstance(event, dict):
+            # a human input prompt
+            websocket.send("exit")
+        elif event.get("type") == "bench_done":
+            break
+    result["seconds"] = time.perf_counter() - started
+    if trigger != "disconnect":
+        websocket.send("TERMINATE")
+        websocket.close()
+    results.append(result)
+
+
+def run_trigger(uri, engine, trigger, runs, after, message):
+    before = engine.cancellation_stats()
+    requests = llm_requests()
+    results = []
+    threads = [threading.Thread(target=session, args=(uri, trigger, after, message, results)) for _ in range(runs)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # disconnected runs finish on their own, after the client is gone
+    while engine.stats()["running"] or engine.stats()["queued"]:
+        time.sleep(0.05)
+    after_stats = engine.cancellation_stats()
+    report = {
+        "run_s": round(float(np.mean([r["seconds"] for r in results])), 2),
+        "llm_requests_per_run": round((llm_requests() - requests) / runs, 1),
+    }
+    if trigger == "complete":
+        return report
+    cancelled = sum(after_stats["cancelled_runs"].values()) - sum(before["cancelled_runs"].values())
+    reclaim = list(engine.reclaim_times)[-cancelled:] if cancelled else []
+    report.update({
+        "cancelled": cancelled,
+        "reclaim_ms": {
+            "p50": round(float(np.percentile(reclaim, 50)) * 1000, 1),
+            "max": round(max(reclaim) * 1000, 1),
+        } if reclaim else None,
+        "aborted_llm_calls": after_stats["aborted_llm_calls"] - before["aborted_llm_calls"],
+        "reclaimed_run_s": round(after_stats["reclaimed_run_s"] - before["reclaimed_run_s"], 1),
+    })
+    if trigger != "deadline":
+        report["llm_requests_after_cancel"] = llm_requests() - min(r["requests_at_cancel"] for r in results)
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=3, help="research sessions per trigger, at once")
+    parser.add_argument("--after", type=float, default=6, help="seconds into the run to cancel it")
+    parser.add_argument("--message", default="Research the impact of remote work on urban housing markets.")
+    parser.add_argument("--profile", default="slow", help="mock LLM latency profile")
+    parser.add_argument("--mock-port", type=int, default=8903)
+    parser.add_argument("--ws-port", type=int, default=8770)
+    args = parser.parse_args()
+
+    mock_url = f"http://127.0.0.1:{args.mock_port}/v1"
+    os.environ["LLM_BACKEND"] = "mock"
+    os.environ["MOCK_LLM_URL"] = mock_url
+    os.environ.setdefault("TRACE_DIR", "")
+
+    mock = subprocess.Popen(
+        [sys.executable, "-m", "app.core.mock_llm", "--port", str(args.mock_port), "--profile", args.profile],
+        stdout=subprocess.DEVNULL,
+    )
+    try:
+        wait_for_mock(mock_url)
+        from autogen.io.websockets import IOWebsockets
+        from app.agents.agentchat_websockets import engine, warm_flows
+        from app.benchmarks.flows import flow_runners, make_on_connect
+
+        warm_flows(["research"])
+        report = {"runs": args.runs, "after_s": args.after, "profile": args.profile, "triggers": {}}
+        with IOWebsockets.run_server_in_thread(on_connect=make_on_connect(flow_runners()), port=args.ws_port) as uri:
+            for trigger in ("complete", "client", "disconnect", "deadline"):
+                report["triggers"][trigger] = run_trigger(uri, engine, trigger, args.runs, args.after, args.message)
+        print(json.dumps(report, indent=2))
+    finally:
+        mock.terminate()
+        mock.wait()
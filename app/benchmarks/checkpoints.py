@@ -0,0 +1,161 @@
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from app.benchmarks.flows import wait_for_mock
+
+# Checkpoint and resume benchmark
+# A research run over a websocket session against the mock LLM, whose client disconnects
+# --after seconds in and reconnects, either way (app/core/checkpoints.py):
+#
+#   python -m app.benchmarks.checkpoints --runs 3 --after 8
+#
+#   restart      the new session sends the question again: the run starts over
+#   resume       the new session sends {"op": "resume", "session": old id}
+#
+# Per mode it reports the time from the disconnect to the end of the run and the LLM calls
+# made after it. For the checkpoints it reports the rounds saved before the disconnect and
+# the bytes written per round, against the bytes per round of full snapshots (the history and
+# context variables whole, every round).
+
+
+def llm_requests():
+    from app.core import config
+
+    return config.http_pool.stats()["requests"]
+
+
+def full_snapshot_bytes(path):
+    # what the same rounds would have cost written whole, every one of them
+    from app.core.checkpoints import Checkpoint
+
+    checkpoint, total, rounds = None, 0, 0
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            record = json.loads(line)
+            if checkpoint is None:
+                checkpoint = Checkpoint(record.get("flow"), record.get("message"), record.get("started"))
+                continue
+            checkpoint.apply(record)
+            snapshot = {"round": checkpoint.rounds, "speaker": checkpoint.speaker,
+                        "messages": checkpoint.messages, "context": checkpoint.context}
+            total += len(json.dumps(snapshot, separators=(",", ":"), default=str)) + 1
+            rounds += 1
+    return total, rounds
+
+
+def wait_idle(engine):
+    while engine.stats()["running"] or engine.stats()["queued"]:
+        time.sleep(0.05)
+
+
+def drain(websocket, seconds):
+    until = time.perf_counter() + seconds
+    while time.perf_counter() < until:
+        try:
+            raw = websocket.recv(timeout=0.05)
+        except TimeoutError:
+            continue
+        try:
+            event = json.loads(raw)
+        except ValueError:
+            event = None
+        if not isinstance(event, dict):
+            # a human input prompt
+            websocket.send("exit")
+
+
+def session_id(websocket):
+    return json.loads(websocket.recv())["content"]["id"]
+
+
+def run_mode(uri, engine, store, mode, after, message):
+    from websockets.sync.client import connect as ws_connect
+
+    websocket = ws_connect(uri, max_size=None)
+    old = session_id(websocket)
+    websocket.send(message)
+    drain(websocket, after)
+    websocket.close()
+    # the closed session's run stops at its next turn and keeps its checkpoint
+    wait_idle(engine)
+    result = {}
+    if mode == "resume":
+        checkpoint = store.load(old)
+        written = os.path.getsize(store.directory / f"{old}.jsonl")
+        full, rounds = full_snapshot_bytes(store.directory / f"{old}.jsonl")
+        result.update({
+            "rounds_saved": checkpoint.rounds if checkpoint is not None else 0,
+            "bytes_per_round": round(written / max(rounds, 1)),
+            "full_snapshot_bytes_per_round": round(full / max(rounds, 1)),
+        })
+    started, requests = time.perf_counter(), llm_requests()
+    websocket = ws_connect(uri, max_size=None)
+    session_id(websocket)
+    websocket.send(json.dumps({"op": "resume", "session": old}) if mode == "resume" else message)
+    # the run is queued right away: wait for the engine to go idle again
+    drain(websocket, 0.5)
+    while engine.stats()["running"] or engine.stats()["queued"]:
+        drain(websocket, 0.1)
+    result.update({
+        "seconds_after_reconnect": round(time.perf_counter() - started, 2),
+        "llm_requests_after_reconnect": llm_requests() - requests,
+    })
+    websocket.send("TERMINATE")
+    websocket.close()
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=3, help="disconnected runs per mode, one at a time")
+    parser.add_argument("--after", type=float, default=8, help="seconds into the run to disconnect")
+    parser.add_argument("--message", default="Research the impact of remote work on urban housing markets.")
+    parser.add_argument("--profile", default="gpt-4o-mini", help="mock LLM latency profile")
+    parser.add_argument("--mock-port", type=int, default=8904)
+    parser.add_argument("--ws-port", type=int, default=8771)
+    args = parser.parse_args()
+
+    mock_url = f"http://127.0.0.1:{args.mock_port}/v1"
+    directory = tempfile.mkdtemp(prefix="checkpoints-")
+    os.environ["LLM_BACKEND"] = "mock"
+    os.environ["MOCK_LLM_URL"] = mock_url
+    os.environ["CHECKPOINT_DIR"] = directory
+    os.environ.setdefault("TRACE_DIR", "")
+
+    mock = subprocess.Popen(
+        [sys.executable, "-m", "app.core.mock_llm", "--port", str(args.mock_port), "--profile", args.profile],
+        stdout=subprocess.DEVNULL,
+    )
+    try:
+        wait_for_mock(mock_url)
+        from autogen.io.websockets import IOWebsockets
+        from app.agents import agentchat_websockets as stack
+        from app.core.flow_registry import flows
+
+        def setup_session(session):
+            session.run, session.flow, session.layout_levels = stack.run_research, "research", flows.load("research").levels
+
+        stack.setup_session = setup_session
+        stack.warm_flows(["research"])
+        report = {"runs": args.runs, "after_s": args.after, "profile": args.profile, "modes": {}}
+        with IOWebsockets.run_server_in_thread(on_connect=stack.on_connect, port=args.ws_port) as uri:
+            for mode in ("restart", "resume"):
+                results = [run_mode(uri, stack.engine, stack.checkpoint_store, mode, args.after, args.message)
+                           for _ in range(args.runs)]
+                report["modes"][mode] = {
+                    key: round(float(np.mean([r[key] for r in results])), 2) for key in results[0]
+                }
+        report["store"] = stack.checkpoint_store.stats()
+        print(json.dumps(report, indent=2))
+    finally:
+        mock.terminate()
+        mock.wait()
+        shutil.rmtree(directory, ignore_errors=True)
@@ -0,0 +1,266 @@
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+
+import numpy as np
+
+# End-to-end flow benchmark
+# Drives run_agent, run_group, tech_support_group and research_group through the real
+# IOWebsockets server and session engine, with the LLM replaced by the local mock server
+# (app/core/mock_llm.py, started as a subprocess so its CPU is not counted as ours).
+#
+#   python -m app.benchmarks.flows --flows tech_support research --runs 5 --concurrency 4 \
+#       --profile fast --out results.json
+#
+# Per flow it reports:
+#   rounds_per_s       agent messages ("text" events) per second of wall time
+#   events_per_s       every event the client received, per second
+#   ttfe_ms            time from sending the message to the first event, p50 and p95
+#   turn_ms            time between consecutive agent messages, p50/p95/p99
+#   peak_rss_mb        peak resident memory of this process so far
+#   orchestration_cpu_s  CPU time of this process (server, engine, agents and client)
+#   model_wait_s       wall time spent inside LLM calls, summed over all runs
+#
+# Every human input prompt (research and financial flows ask for one) is answered "exit".
+#
+# With --workers N the tech support and research sessions run in N worker processes
+# (SESSION_WORKERS, app/core/workers.py). Their CPU and LLM calls are then not part of
+# orchestration_cpu_s and model_wait_s, which only see this process.
+
+FLOWS = ("agent_manager", "financial", "tech_support", "research")
+
+
+def wait_for_mock(url, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            urllib.request.urlopen(f"{url}/models", timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"mock LLM did not come up on {url}")
+
+
+class ModelTimer:
+    """Sums the wall time spent in OpenAIWrapper.create, across all threads."""
+
+    def __init__(self):
+        self.seconds = 0.0
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def install(self):
+        from autogen.oai.client import OpenAIWrapper
+
+        create = OpenAIWrapper.create
+        timer = self
+
+        def timed_create(self, **config):
+            started = time.perf_counter()
+            try:
+                return create(self, **config)
+            finally:
+                with timer._lock:
+                    timer.seconds += time.perf_counter() - started
+                    timer.calls += 1
+
+        OpenAIWrapper.create = timed_create
+
+    def snapshot(self):
+        with self._lock:
+            return self.seconds, self.calls
+
+
+def flow_runners():
+    # imported late, once LLM_BACKEND and MOCK_LLM_URL point at the mock
+    from app.core.config import llm_config
+    from app.agents.agent_manager import run_agent
+    from app.agents.financial_group import run_group
+    from app.agents.agentchat_websockets import run_tech_support, run_research
+
+    return {
+        "agent_manager": lambda msg: run_agent(),
+        "financial": lambda msg: run_group(llm_config.copy()),
+        "tech_support": run_tech_support,
+        "research": run_research,
+    }
+
+
+def make_on_connect(runners):
+    from app.agents.agentchat_websockets import engine, handle_control
+
+    # the benchmark sends its workers the runs itself, inside the marker wrapper below
+    workers, engine.workers = engine.workers, None
+
+    def on_connect(iostream):
+        # same loop as the app's on_connect, except the first message picks the flow and
+        # every run ends with a marker event so the client knows when to stop timing
+        session = engine.open(iostream)
+        flow = iostream.input()
+        runner = runners[flow]
+
+        def run(message):
+            try:
+                if workers is not None and flow in workers:
+                    return workers.run(session, message)
+                return runner(message)
+            finally:
+                session.stream.send({"type": "bench_done", "content": {}})
+
+        session.run, session.flow = run, flow
+        try:
+            while True:
+                message = iostream.input()
+                if message == "TERMINATE":
+                    break
+                if handle_control(session, message):
+                    continue
+                engine.deliver(session, message)
+        finally:
+            engine.close(session)
+
+    return on_connect
+
+
+def client(uri, flow, runs, message, results):
+    from websockets.sync.client import connect as ws_connect
+
+    with ws_connect(uri, max_size=None) as websocket:
+        websocket.send(flow)
+        for _ in range(runs):
+            sent = time.perf_counter()
+            websocket.send(message)
+            first, events, turns = None, 0, []
+            while True:
+                raw = websocket.recv()
+                now = time.perf_counter()
+                try:
+                    event = json.loads(raw)
+                except ValueError:
+                    event = None
+                if not isinstance(event, dict):
+                    # a human input prompt
+                    websocket.send("exit")
+                    continue
+                if event.get("type") == "bench_done":
+                    break
+                first = first or now
+                events += 1
+                if event.get("type") == "text":
+                    turns.append(now)
+            results.append({
+                "ttfe": (first or now) - sent,
+                "events": events,
+                "turns": np.diff([sent] + turns).tolist(),
+                "elapsed": now - sent,
+            })
+        websocket.send("TERMINATE")
+
+
+def percentiles(values, points):
+    if not values:
+        return {f"p{p}": None for p in points}
+    return {f"p{p}": round(float(np.percentile(values, p)) * 1000, 2) for p in points}
+
+
+def bench_flow(uri, flow, runs, concurrency, message, model_timer):
+    results = []
+    wait_before, calls_before = model_timer.snapshot()
+    cpu_before = time.process_time()
+    started = time.perf_counter()
+    clients = [
+        threading.Thread(target=client, args=(uri, flow, runs, message, results))
+        for _ in range(concurrency)
+    ]
+    for thread in clients:
+        thread.start()
+    for thread in clients:
+        thread.join()
+    wall = time.perf_counter() - started
+    cpu = time.process_time() - cpu_before
+    wait_after, calls_after = model_timer.snapshot()
+
+    turns = [t for r in results for t in r["turns"]]
+    events = sum(r["events"] for r in results)
+    return {
+        "flow": flow,
+        "runs": len(results),
+        "concurrency": concurrency,
+        "wall_s": round(wall, 3),
+        "rounds": len(turns),
+        "rounds_per_s": round(len(turns) / wall, 2),
+        "events": events,
+        "events_per_s": round(events / wall, 2),
+        "ttfe_ms": percentiles([r["ttfe"] for r in results], (50, 95)),
+        "turn_ms": percentiles(turns, (50, 95, 99)),
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "orchestration_cpu_s": round(cpu, 3),
+        "cpu_per_round_ms": round(1000 * cpu / len(turns), 3) if turns else None,
+        "model_calls": calls_after - calls_before,
+        "model_wait_s": round(wait_after - wait_before, 3),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--flows", nargs="+", default=list(FLOWS), choices=FLOWS)
+    parser.add_argument("--runs", type=int, default=3, help="runs per client connection")
+    parser.add_argument("--concurrency", type=int, default=1, help="client connections per flow")
+    parser.add_argument("--message", default="My laptop won't turn on after the last update.")
+    parser.add_argument("--profile", default="fast", help="mock LLM latency profile")
+    parser.add_argument("--mock-port", type=int, default=8900)
+    parser.add_argument("--ws-port", type=int, default=8766)
+    parser.add_argument("--workers", type=int, default=0, help="session worker processes (0 runs on threads)")
+    parser.add_argument("--out", help="write the JSON results here instead of stdout")
+    args = parser.parse_args()
+
+    mock_url = f"http://127.0.0.1:{args.mock_port}/v1"
+    os.environ["LLM_BACKEND"] = "mock"
+    os.environ["MOCK_LLM_URL"] = mock_url
+    # tracing is part of the production path but writes to disk; enable it with TRACE_DIR=...
+    os.environ.setdefault("TRACE_DIR", "")
+    os.environ["SESSION_WORKERS"] = str(args.workers)
+
+    mock = subprocess.Popen(
+        [sys.executable, "-m", "app.core.mock_llm", "--port", str(args.mock_port), "--profile", args.profile],
+        stdout=subprocess.DEVNULL,
+    )
+    try:
+        wait_for_mock(mock_url)
+        model_timer = ModelTimer()
+        model_timer.install()
+        runners = flow_runners()
+
+        from autogen.io.websockets import IOWebsockets
+        from app.agents.agentchat_websockets import flow_pool, session_workers
+
+        flow_pool.warm()
+        if session_workers is not None:
+            session_workers.start()
+            session_workers.wait_ready()
+        with IOWebsockets.run_server_in_thread(on_connect=make_on_connect(runners), port=args.ws_port) as uri:
+            report = {
+                "profile": args.profile,
+                "python": sys.version.split()[0],
+                "workers": args.workers,
+                "flows": [
+                    bench_flow(uri, flow, args.runs, args.concurrency, args.message, model_timer)
+                    for flow in args.flows
+                ],
+            }
+    finally:
+        mock.terminate()
+        mock.wait()
+
+    output = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
@@ -0,0 +1,153 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+# Websocket output framing benchmark
+# Runs a flow against the mock LLM (app/core/mock_llm.py) once per output mode and counts, at
+# the client, what the websocket carried for the same run:
+#
+#   python -m app.benchmarks.framing --flow tech_support --format flow --runs 3
+#
+#   frames         websocket messages received per run, and per second of run time
+#   payload_bytes  message bytes after decompression, per run
+#   wire_bytes     bytes read from the TCP socket (framing and deflate included), per run
+#
+# Modes: one JSON frame per event (what clients got before), the same with permessage-deflate,
+# batched JSON arrays, and batched msgpack, each with and without deflate.
+
+MODES = {
+    "json": {"hello": {}, "deflate": False},
+    "json+deflate": {"hello": {}, "deflate": True},
+    "batch": {"hello": {"batch": True}, "deflate": False},
+    "batch+deflate": {"hello": {"batch": True}, "deflate": True},
+    "msgpack": {"hello": {"batch": True, "encoding": "msgpack"}, "deflate": False},
+    "msgpack+deflate": {"hello": {"batch": True, "encoding": "msgpack"}, "deflate": True},
+}
+
+
+class CountingSocket:
+    """Wraps the client socket to count the bytes the websocket reads off the wire."""
+
+    def __init__(self, sock):
+        self._sock = sock
+        self.bytes_in = 0
+
+    def recv(self, *args):
+        data = self._sock.recv(*args)
+        self.bytes_in += len(data)
+        return data
+
+    def __getattr__(self, name):
+        return getattr(self._sock, name)
+
+
+def decode(message):
+    """Return the events in a websocket message, or None for a human input prompt."""
+    if isinstance(message, bytes):
+        import msgpack
+
+        data = msgpack.unpackb(message)
+    else:
+        try:
+            data = json.loads(message)
+        except ValueError:
+            return None
+    if isinstance(data, list):
+        return data
+    return [data] if isinstance(data, dict) else None
+
+
+def run_mode(uri, flow, fmt, mode, runs, message):
+    from websockets.sync.client import connect as ws_connect
+
+    settings = MODES[mode]
+    hello = dict(settings["hello"], op="hello", format=fmt)
+    if fmt == "flow":
+        hello["layout"] = None
+    results = []
+    with ws_connect(uri, max_size=None, compression="deflate" if settings["deflate"] else None) as websocket:
+        counter = websocket.socket = CountingSocket(websocket.socket)
+        websocket.send(flow)
+        websocket.send(json.dumps(hello))
+        for _ in range(runs):
+            wire_before = counter.bytes_in
+            frames = payload = events = 0
+            started = time.perf_counter()
+            websocket.send(message)
+            done = False
+            while not done:
+                raw = websocket.recv()
+                batch = decode(raw)
+                if batch is None:
+                    websocket.send("exit")
+                    continue
+                frames += 1
+                payload += len(raw)
+                for event in batch:
+                    if (event.get("type") or event.get("k")) == "bench_done":
+                        done = True
+                    else:
+                        events += 1
+            elapsed = time.perf_counter() - started
+            results.append({
+                "events": events,
+                "frames": frames,
+                "payload_bytes": payload,
+                "wire_bytes": counter.bytes_in - wire_before,
+                "seconds": elapsed,
+            })
+        websocket.send("TERMINATE")
+    per_run = {key: sum(r[key] for r in results) / len(results) for key in results[0]}
+    return {
+        "mode": mode,
+        "events_per_run": round(per_run["events"], 1),
+        "frames_per_run": round(per_run["frames"], 1),
+        "frames_per_s": round(per_run["frames"] / per_run["seconds"], 1),
+        "payload_bytes_per_run": round(per_run["payload_bytes"]),
+        "wire_bytes_per_run": round(per_run["wire_bytes"]),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--flow", default="tech_support", choices=["tech_support", "research"])
+    parser.add_argument("--format", default="flow", choices=["raw", "flow"])
+    parser.add_argument("--modes", nargs="+", default=list(MODES), choices=list(MODES))
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--message", default="My laptop won't turn on after the last update.")
+    parser.add_argument("--profile", default="fast", help="mock LLM latency profile")
+    parser.add_argument("--mock-port", type=int, default=8900)
+    parser.add_argument("--ws-port", type=int, default=8767)
+    args = parser.parse_args()
+
+    mock_url = f"http://127.0.0.1:{args.mock_port}/v1"
+    os.environ["LLM_BACKEND"] = "mock"
+    os.environ["MOCK_LLM_URL"] = mock_url
+    os.environ.setdefault("TRACE_DIR", "")
+
+    mock = subprocess.Popen(
+        [sys.executable, "-m", "app.core.mock_llm", "--port", str(args.mock_port), "--profile", args.profile],
+        stdout=subprocess.DEVNULL,
+    )
+    try:
+        from app.benchmarks.flows import wait_for_mock, flow_runners, make_on_connect
+
+        wait_for_mock(mock_url)
+        from autogen.io.websockets import IOWebsockets
+        from app.agents.agentchat_websockets import flow_pool
+
+        flow_pool.warm()
+        with IOWebsockets.run_server_in_thread(on_connect=make_on_connect(flow_runners()), port=args.ws_port) as uri:
+            report = {
+                "flow": args.flow,
+                "format": args.format,
+                "profile": args.profile,
+                "modes": [run_mode(uri, args.flow, args.format, mode, args.runs, args.message) for mode in args.modes],
+            }
+    finally:
+        mock.terminate()
+        mock.wait()
+    print(json.dumps(report, indent=2))
@@ -0,0 +1,71 @@
+import argparse
+import json
+import random
+import time
+
+from app.core.flow_graph import FlowGraph
+from app.core.layout import LayoutEngine
+
+# Layout time against node and edge count
+# Builds random hierarchies (a root, managers, specialists, tools) of growing size and times a
+# full layout plus an incremental update after one more node arrives, for both modes.
+#
+#   python -m app.benchmarks.layout --sizes 10 25 50 100 200
+
+
+def random_hierarchy(nodes, extra_edges, seed=0):
+    rng = random.Random(seed)
+    graph = FlowGraph()
+    levels = {}
+    names = []
+    for i in range(nodes):
+        name = f"agent_{i}"
+        graph.node(name)
+        names.append(name)
+        levels[name] = 0 if i == 0 else min(3, 1 + i // max(1, nodes // 3))
+        if i:
+            parent = rng.choice([n for n in names[:-1] if levels[n] < levels[name]] or names[:1])
+            graph.edge(graph.nodes[parent]["i"], graph.nodes[name]["i"])
+    for _ in range(extra_edges):
+        a, b = rng.sample(names, 2)
+        graph.edge(graph.nodes[a]["i"], graph.nodes[b]["i"])
+    return graph, levels
+
+
+def bench(nodes, extra_edges, mode, repeat=5):
+    full, incremental = [], []
+    for r in range(repeat):
+        graph, levels = random_hierarchy(nodes, extra_edges, seed=r)
+        engine = LayoutEngine(mode=mode, levels=levels)
+        started = time.perf_counter()
+        engine.update(graph)
+        full.append(time.perf_counter() - started)
+
+        new_id, _ = graph.node("late_arrival")
+        graph.edge(1, new_id)
+        started = time.perf_counter()
+        moved = engine.update(graph)
+        incremental.append(time.perf_counter() - started)
+    return {
+        "mode": mode,
+        "nodes": nodes,
+        "edges": len(graph.edges),
+        "full_ms": round(1000 * sorted(full)[len(full) // 2], 3),
+        "incremental_ms": round(1000 * sorted(incremental)[len(incremental) // 2], 3),
+        "moved_on_update": len(moved),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 25, 50, 100, 200])
+    parser.add_argument("--edge-factor", type=float, default=1.0, help="extra random edges per node")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    results = [
+        bench(n, int(n * args.edge_factor), mode, args.repeat)
+        for mode in ("layered", "force")
+        for n in args.sizes
+    ]
+    print(json.dumps(results, indent=2))
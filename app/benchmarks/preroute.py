@@ -0,0 +1,86 @@
+import argparse
+import json
+import os
+import statistics
+import time
+
+from app.benchmarks.flows import ModelTimer, wait_for_mock
+
+# What the tech support fast path saves
+# Runs tech_support_group against the mock LLM with and without keyword pre-routing and
+# reports LLM calls and milliseconds per session for both, and the difference.
+#
+#   python -m app.benchmarks.preroute --sessions 20 --profile gpt-4o-mini
+
+QUERIES = [
+    "My laptop won't start after the update",
+    "My phone keeps crashing when I open the camera",
+    "The computer is really slow since yesterday",
+    "How do I change the email address on my account?",
+    "Can I get an invoice for last month?",
+]
+
+
+class Quiet:
+    # agents print every message; the benchmark only wants the timings
+    def print(self, *objects, sep=" ", end="\n", flush=False):
+        pass
+
+    def send(self, message):
+        pass
+
+    def input(self, prompt="", *, password=False):
+        return "exit"
+
+
+def bench(sessions, fast_path, model_timer):
+    from autogen.io.base import IOStream
+    from app.core.config import llm_config
+    from app.agents.tech_support_group import build_tech_support_group, tech_support_group
+
+    calls, waits, walls = [], [], []
+    with IOStream.set_default(Quiet()):
+        for i in range(sessions):
+            pattern = build_tech_support_group(llm_config.copy())
+            wait_before, calls_before = model_timer.snapshot()
+            started = time.perf_counter()
+            tech_support_group(llm_config, QUERIES[i % len(QUERIES)], pattern=pattern, fast_path=fast_path)
+            walls.append(time.perf_counter() - started)
+            wait_after, calls_after = model_timer.snapshot()
+            calls.append(calls_after - calls_before)
+            waits.append(wait_after - wait_before)
+    return {
+        "fast_path": fast_path,
+        "sessions": sessions,
+        "llm_calls_per_session": round(statistics.mean(calls), 2),
+        "llm_ms_per_session": round(1000 * statistics.mean(waits), 1),
+        "wall_ms_per_session": round(1000 * statistics.mean(walls), 1),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type=int, default=10)
+    parser.add_argument("--profile", default="fast", help="mock LLM latency profile")
+    parser.add_argument("--mock-port", type=int, default=8901)
+    args = parser.parse_args()
+
+    os.environ["LLM_BACKEND"] = "mock"
+    os.environ["MOCK_LLM_URL"] = f"http://127.0.0.1:{args.mock_port}/v1"
+    from app.core.mock_llm import run_mock_llm_in_thread
+
+    with run_mock_llm_in_thread(port=args.mock_port, profile=args.profile) as url:
+        wait_for_mock(url)
+        model_timer = ModelTimer()
+        model_timer.install()
+        triage, fast = (bench(args.sessions, fast_path, model_timer) for fast_path in (False, True))
+    print(json.dumps({
+        "profile": args.profile,
+        "triage": triage,
+        "fast_path": fast,
+        "saved_per_session": {
+            "llm_calls": round(triage["llm_calls_per_session"] - fast["llm_calls_per_session"], 2),
+            "llm_ms": round(triage["llm_ms_per_session"] - fast["llm_ms_per_session"], 1),
+            "wall_ms": round(triage["wall_ms_per_session"] - fast["wall_ms_per_session"], 1),
+        },
+    }, indent=2))
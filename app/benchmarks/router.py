@@ -0,0 +1,129 @@
+import argparse
+import json
+import subprocess
+import sys
+import threading
+import time
+
+import numpy as np
+
+from app.benchmarks.flows import wait_for_mock
+
+# LLM router benchmark
+# Starts one mock LLM per stand-in deployment, each with its own latency profile and faults,
+# and sends the same completion calls through the shared HTTP pool three ways:
+#
+#   python -m app.benchmarks.router --calls 300 --concurrency 8 --hedge-ms 400
+#
+#   single     every call to the first deployment, as with one config_list entry
+#   router     LLMRouter over all of them: latency EWMA, circuit breaker and failover
+#   hedged     the same, plus hedged requests after --hedge-ms
+#
+# Deployments are given as name:profile[:error_rate[:stall_rate[:stall_ms]]], by default
+#   east:fast:0:0.05:1500     fast, but 5% of the calls stall for 1.5 s (a latency tail)
+#   west:fast:0:0.05:1500     the same, with its own stalls
+#   central:gpt-4o-mini       slower, steady
+#   flaky:fast:0.5            fast, but half the calls fail with a 500
+#
+# Per setting it reports call latency (p50/p95/p99, including the OpenAI client's own retries),
+# failed calls and the router's stats per deployment.
+
+DEFAULT_DEPLOYMENTS = ("east:fast:0:0.05:1500", "west:fast:0:0.05:1500", "central:gpt-4o-mini", "flaky:fast:0.5")
+
+
+def start_mocks(specs, base_port):
+    mocks, deployments = [], []
+    for i, spec in enumerate(specs):
+        name, profile, *faults = spec.split(":")
+        error_rate, stall_rate, stall_ms = (list(map(float, faults)) + [0.0, 0.0, 0.0])[:3]
+        port = base_port + i
+        mocks.append(subprocess.Popen(
+            [sys.executable, "-m", "app.core.mock_llm", "--port", str(port), "--profile", profile,
+             "--error-rate", str(error_rate), "--stall-rate", str(stall_rate), "--stall-ms", str(stall_ms)],
+            stdout=subprocess.DEVNULL,
+        ))
+        deployments.append({"name": name, "base_url": f"http://127.0.0.1:{port}/v1"})
+    for deployment in deployments:
+        wait_for_mock(deployment["base_url"])
+    return mocks, deployments
+
+
+def run_setting(deployments, router_args, calls, concurrency):
+    from openai import OpenAI
+    from app.core.http_pool import HTTPPool
+    from app.core.llm_router import LLMRouter, parse_deployments
+
+    origin = deployments[0]["base_url"]
+    router = LLMRouter(origin, parse_deployments(json.dumps(deployments)), **router_args) if router_args is not None else None
+    pool = HTTPPool(router=router)
+    client = OpenAI(api_key="mock", base_url=origin, http_client=pool.client)
+    latencies, failed = [], []
+    lock = threading.Lock()
+    counter = iter(range(calls))
+
+    def worker():
+        for i in counter:
+            started = time.perf_counter()
+            try:
+                client.chat.completions.create(
+                    model="gpt-4o-mini",
+                    messages=[{"role": "user", "content": f"Call {i}: my laptop won't turn on."}],
+                )
+                ok = True
+            except Exception:
+                ok = False
+            with lock:
+                (latencies if ok else failed).append(time.perf_counter() - started)
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - started
+    result = {
+        "wall_s": round(wall, 2),
+        "calls_per_s": round(calls / wall, 1),
+        "failed": len(failed),
+        "latency_ms": {f"p{p}": round(float(np.percentile(latencies, p)) * 1000, 1) for p in (50, 95, 99)} if latencies else None,
+    }
+    if router is not None:
+        stats = router.stats()
+        result["router"] = {
+            "failovers": stats["failovers"],
+            "hedged": stats["hedged"],
+            "deployments": {
+                d["name"]: {k: d[k] for k in ("state", "latency_ms", "error_rate", "requests", "errors", "circuit_opened", "hedges_won")}
+                for d in stats["deployments"]
+            },
+        }
+    pool.close()
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--deployments", nargs="+", default=list(DEFAULT_DEPLOYMENTS))
+    parser.add_argument("--calls", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--hedge-ms", type=float, default=400)
+    parser.add_argument("--hedge-budget", type=float, default=0.1)
+    parser.add_argument("--base-port", type=int, default=8910)
+    args = parser.parse_args()
+
+    mocks, deployments = start_mocks(args.deployments, args.base_port)
+    try:
+        settings = {
+            "single": None,
+            "router": {},
+            "hedged": {"hedge_after": args.hedge_ms / 1000, "hedge_budget": args.hedge_budget},
+        }
+        report = {"deployments": args.deployments, "calls": args.calls, "concurrency": args.concurrency, "settings": {}}
+        for name, router_args in settings.items():
+            report["settings"][name] = run_setting(deployments, router_args, args.calls, args.concurrency)
+        print(json.dumps(report, indent=2))
+    finally:
+        for mock in mocks:
+            mock.terminate()
+            mock.wait()
@@ -0,0 +1,134 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+
+import numpy as np
+
+# LLM scheduler benchmark
+# Runs a burst of tech support sessions, some premium and the rest standard, against a mock LLM
+# that enforces a requests-per-minute quota (429 with Retry-After above it), once per setting:
+#
+#   python -m app.benchmarks.scheduler --sessions 12 --premium 3 --mock-rpm 240
+#
+#   off        LLM_RPM=0: the scheduler only orders calls, every session fires at the quota
+#              and finds the limit through 429s and the client's retries
+#   scheduled  LLM_RPM at 90% of the quota: calls wait their turn, premium first
+#
+# Per setting it reports the run time of premium and standard sessions (p50/p95), failed
+# runs, the 429s the deployment answered and the scheduler's wait metrics. Each setting runs in a
+# fresh process, since the scheduler reads its limits once.
+
+
+def session(uri, tier, message, results):
+    from websockets.sync.client import connect as ws_connect
+
+    started = time.perf_counter()
+    failed = False
+    with ws_connect(uri, max_size=None) as websocket:
+        websocket.send("tech_support")
+        websocket.send(json.dumps({"op": "hello", "account_key": f"bench-{tier}"}))
+        websocket.send(message)
+        while True:
+            raw = websocket.recv()
+            try:
+                event = json.loads(raw)
+            except ValueError:
+                websocket.send("exit")
+                continue
+            if event.get("type") == "error":
+                failed = True
+            if event.get("type") == "bench_done":
+                break
+        websocket.send("TERMINATE")
+    results.append({"tier": tier, "seconds": time.perf_counter() - started, "failed": failed})
+
+
+def run_setting(args):
+    from autogen.io.websockets import IOWebsockets
+    from app.benchmarks.flows import flow_runners, make_on_connect
+    from app.agents.agentchat_websockets import flow_pool
+    from app.core import config
+
+    flow_pool.warm("tech_support")
+    results = []
+    with IOWebsockets.run_server_in_thread(on_connect=make_on_connect(flow_runners()), port=args.ws_port) as uri:
+        started = time.perf_counter()
+        clients = [
+            threading.Thread(target=session, args=(uri, "premium" if i < args.premium else "standard", args.message, results))
+            for i in range(args.sessions)
+        ]
+        for thread in clients:
+            thread.start()
+        for thread in clients:
+            thread.join()
+        wall = time.perf_counter() - started
+
+    def summary(tier):
+        seconds = [r["seconds"] for r in results if r["tier"] == tier]
+        return {
+            "sessions": len(seconds),
+            "failed": sum(r["failed"] for r in results if r["tier"] == tier),
+            "run_s": {f"p{p}": round(float(np.percentile(seconds, p)), 2) for p in (50, 95)} if seconds else None,
+        }
+
+    scheduler = config.llm_scheduler.stats()
+    return {
+        "llm_rpm": config.LLM_RPM,
+        "wall_s": round(wall, 2),
+        "premium": summary("premium"),
+        "standard": summary("standard"),
+        "llm_requests": sum(c["granted"] for c in scheduler["classes"].values()),
+        "throttled_429": scheduler["throttled"],
+        "scheduler_wait_ms": {name: c["wait_ms"] for name, c in scheduler["classes"].items() if c["granted"]},
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type=int, default=12)
+    parser.add_argument("--premium", type=int, default=3, help="how many of the sessions are premium")
+    parser.add_argument("--mock-rpm", type=int, default=240, help="the mock deployment's quota")
+    parser.add_argument("--message", default="My laptop won't turn on after the last update.")
+    parser.add_argument("--profile", default="fast", help="mock LLM latency profile")
+    parser.add_argument("--mock-port", type=int, default=8901)
+    parser.add_argument("--ws-port", type=int, default=8768)
+    parser.add_argument("--setting", choices=["off", "scheduled"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.setting:
+        # one setting, in the child process started below
+        print(json.dumps(run_setting(args)))
+        sys.exit()
+
+    mock_url = f"http://127.0.0.1:{args.mock_port}/v1"
+    report = {"sessions": args.sessions, "premium": args.premium, "mock_rpm": args.mock_rpm, "settings": {}}
+    for setting in ("off", "scheduled"):
+        # a fresh quota for each setting
+        mock = subprocess.Popen(
+            [sys.executable, "-m", "app.core.mock_llm", "--port", str(args.mock_port), "--profile", args.profile,
+             "--rpm", str(args.mock_rpm)],
+            stdout=subprocess.DEVNULL,
+        )
+        try:
+            from app.benchmarks.flows import wait_for_mock
+
+            wait_for_mock(mock_url)
+            env = dict(
+                os.environ, LLM_BACKEND="mock", MOCK_LLM_URL=mock_url, TRACE_DIR="",
+                LLM_RPM=str(0 if setting == "off" else int(args.mock_rpm * 0.9)),
+                MAX_ACTIVE_RUNS=str(args.sessions),
+                ACCOUNT_KEYS="bench-premium=premium,bench-standard=standard",
+            )
+            child = subprocess.run(
+                [sys.executable, "-m", "app.benchmarks.scheduler", *sys.argv[1:], "--setting", setting],
+                env=env, capture_output=True, text=True, check=True,
+            )
+            report["settings"][setting] = json.loads(child.stdout.strip().splitlines()[-1])
+        finally:
+            mock.terminate()
+            mock.wait()
+    print(json.dumps(report, indent=2))
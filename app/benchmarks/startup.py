@@ -0,0 +1,67 @@
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+
+import numpy as np
+
+# Import-time profile
+# Imports a module in a fresh interpreter with `python -X importtime`, a few times, and reports
+# the median total and the packages that took longest (their own import time, summed): what a
+# worker, or a --reload cycle, pays before the app can answer.
+#
+#   python -m app.benchmarks.startup                           # app.main
+#   python -m app.benchmarks.startup --module app.agents.agentchat_websockets --runs 5
+#
+# Before the lazy flow registry, `import app.main` pulled in autogen (and openai) through the
+# flow modules and config: about 1.9 s here, against about 0.5 s after, which is mostly fastapi.
+
+LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)")
+
+
+def profile(module):
+    """One cold import: (cumulative microseconds of `module`, {package: self microseconds})."""
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [os.getcwd(), os.environ.get("PYTHONPATH")])))
+    env.setdefault("OPENAI_API_KEY", "unused")
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True, env=env, check=True,
+    )
+    total, packages = 0, {}
+    for line in result.stderr.splitlines():
+        match = LINE.match(line)
+        if not match:
+            continue
+        name = match.group(4)
+        package = name.split(".")[0]
+        packages[package] = packages.get(package, 0) + int(match.group(1))
+        if name == module:
+            total = int(match.group(2))
+    return total, packages
+
+
+def report(module, runs, top):
+    profiles = [profile(module) for _ in range(runs)]
+    packages = {}
+    for _, p in profiles:
+        for name, us in p.items():
+            packages.setdefault(name, []).append(us)
+    slowest = sorted(packages.items(), key=lambda item: -np.median(item[1]))[:top]
+    return {
+        "module": module,
+        "runs": runs,
+        "total_ms": round(float(np.median([total for total, _ in profiles])) / 1000, 1),
+        "slowest_packages_ms": {name: round(float(np.median(us)) / 1000, 1) for name, us in slowest},
+        "autogen_loaded": "autogen" in packages,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--module", nargs="+", default=["app.main"])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=8, help="slowest packages to list")
+    args = parser.parse_args()
+    print(json.dumps([report(module, args.runs, args.top) for module in args.module], indent=2))
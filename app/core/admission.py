@@ -0,0 +1,205 @@
+import math
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import numpy as np
+
+# Admission control for runs
+# The session engine and the /chat job manager hand their runs to an AdmissionController
+# instead of straight to a thread pool. It runs at most `max_active` of them at once, at most
+# `flow_limits[flow]` of one flow (a 50 round research group costs far more than a support
+# chat), and keeps the rest in one FIFO queue; a run whose flow is at its limit is skipped
+# over, so it does not hold up the runs of other flows behind it.
+#
+# A new run is turned away with Busy, instead of queued, when
+#   queue_full     `max_pending` runs are waiting already
+#   wait           its projected wait is over `max_wait` seconds
+#
+# The projected wait is the longer of the two queues it is in: runs of its flow ahead of it,
+# divided over the flow's slots, times the flow's average run time; and all runs ahead of it,
+# divided over all slots, times the average run time of any flow (EWMAs of finished runs).
+# Busy carries that estimate as retry_after, which clients get as "busy, retry after".
+
+EWMA_ALPHA = 0.2
+WAIT_SAMPLES = 1000
+
+
+class Busy(RuntimeError):
+    def __init__(self, reason, retry_after):
+        super().__init__(f"busy ({reason}), retry after {retry_after} s")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class _Queued:
+    __slots__ = ("flow", "fn", "args", "future", "enqueued")
+
+    def __init__(self, flow, fn, args):
+        self.flow = flow
+        self.fn = fn
+        self.args = args
+        self.future = Future()
+        self.enqueued = time.monotonic()
+
+
+class FlowCounters:
+    def __init__(self, limit):
+        self.limit = limit
+        self.active = 0
+        self.pending = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.run_seconds = None
+        self.waits = deque(maxlen=WAIT_SAMPLES)
+
+
+class AdmissionController:
+    def __init__(self, max_active=4, max_pending=None, flow_limits=None, max_wait=None, thread_name_prefix="run"):
+        self.max_active = max_active
+        self.max_pending = max_pending
+        self.flow_limits = dict(flow_limits or {})
+        self.max_wait = max_wait
+        self._executor = ThreadPoolExecutor(max_workers=max_active, thread_name_prefix=thread_name_prefix)
+        self._pending = deque()
+        self._flows = {}
+        self._active = 0
+        self._run_seconds = None
+        self._lock = threading.Lock()
+        self.rejected = {"queue_full": 0, "wait": 0}
+
+    def _counters(self, flow):
+        counters = self._flows.get(flow)
+        if counters is None:
+            limit = max(1, min(self.flow_limits.get(flow, self.max_active), self.max_active))
+            counters = self._flows[flow] = FlowCounters(limit)
+        return counters
+
+    def projected_wait(self, flow):
+        """Seconds a run of `flow` submitted now would wait for its slot (an estimate)."""
+        with self._lock:
+            return self._projected_wait(self._counters(flow))
+
+    def _projected_wait(self, counters):
+        wait = 0.0
+        ahead = counters.active + counters.pending + 1 - counters.limit
+        if ahead > 0 and counters.run_seconds is not None:
+            wait = ahead / counters.limit * counters.run_seconds
+        ahead = self._active + len(self._pending) + 1 - self.max_active
+        if ahead > 0 and self._run_seconds is not None:
+            wait = max(wait, ahead / self.max_active * self._run_seconds)
+        return wait
+
+    def submit(self, flow, fn, *args):
+        """Run fn(*args) once admitted; returns its Future, or raises Busy."""
+        with self._lock:
+            counters = self._counters(flow)
+            if self.max_pending is not None and len(self._pending) >= self.max_pending:
+                self._reject(counters, "queue_full")
+                raise Busy("queue_full", self._retry_after(self._projected_wait(counters)))
+            wait = self._projected_wait(counters)
+            if self.max_wait is not None and wait > self.max_wait:
+                self._reject(counters, "wait")
+                raise Busy("wait", self._retry_after(wait))
+            queued = _Queued(flow, fn, args)
+            counters.admitted += 1
+            counters.pending += 1
+            self._pending.append(queued)
+            self._dispatch()
+        # a run cancelled while it waits (its session closed) leaves the queue at once
+        queued.future.add_done_callback(lambda future: future.cancelled() and self._drop(queued))
+        return queued.future
+
+    @staticmethod
+    def _retry_after(wait):
+        return max(1, math.ceil(wait))
+
+    def _reject(self, counters, reason):
+        counters.rejected += 1
+        self.rejected[reason] += 1
+
+    def _drop(self, queued):
+        with self._lock:
+            if queued in self._pending:
+                self._pending.remove(queued)
+                self._flows[queued.flow].pending -= 1
+
+    def _dispatch(self):
+        # first come first served among the runs whose flow has a free slot
+        for queued in list(self._pending):
+            if self._active >= self.max_active:
+                return
+            counters = self._flows[queued.flow]
+            if counters.active >= counters.limit:
+                continue
+            self._pending.remove(queued)
+            counters.pending -= 1
+            if not queued.future.set_running_or_notify_cancel():
+                continue
+            counters.active += 1
+            self._active += 1
+            counters.waits.append(time.monotonic() - queued.enqueued)
+            self._executor.submit(self._execute, queued)
+
+    def _execute(self, queued):
+        started = time.monotonic()
+        # runs cut short (a BaseException such as a cancellation) say nothing about run times
+        finished = False
+        try:
+            result = queued.fn(*queued.args)
+            finished = True
+        except Exception as e:
+            finished = True
+            queued.future.set_exception(e)
+        except BaseException as e:
+            queued.future.set_exception(e)
+        else:
+            queued.future.set_result(result)
+        finally:
+            seconds = time.monotonic() - started
+            with self._lock:
+                counters = self._flows[queued.flow]
+                counters.active -= 1
+                self._active -= 1
+                if finished:
+                    counters.run_seconds = seconds if counters.run_seconds is None else counters.run_seconds + EWMA_ALPHA * (seconds - counters.run_seconds)
+                    self._run_seconds = seconds if self._run_seconds is None else self._run_seconds + EWMA_ALPHA * (seconds - self._run_seconds)
+                self._dispatch()
+
+    def run_seconds(self, flow):
+        """Average run time of `flow` (EWMA of finished runs), None before the first one."""
+        with self._lock:
+            counters = self._flows.get(flow)
+            return counters.run_seconds if counters is not None else None
+
+    def stats(self):
+        with self._lock:
+            flows = {}
+            for flow, counters in self._flows.items():
+                waits = list(counters.waits)
+                flows[flow] = {
+                    "limit": counters.limit,
+                    "active": counters.active,
+                    "pending": counters.pending,
+                    "admitted": counters.admitted,
+                    "rejected": counters.rejected,
+                    "run_s": round(counters.run_seconds, 3) if counters.run_seconds is not None else None,
+                    "projected_wait_s": round(self._projected_wait(counters), 3),
+                    "queue_wait_ms": {
+                        f"p{p}": round(float(np.percentile(waits, p)) * 1000, 2) if waits else None
+                        for p in (50, 95, 99)
+                    },
+                }
+            return {
+                "max_active": self.max_active,
+                "max_pending": self.max_pending,
+                "max_wait_s": self.max_wait,
+                "active": self._active,
+                "pending": len(self._pending),
+                "rejected": dict(self.rejected),
+                "flows": flows,
+            }
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
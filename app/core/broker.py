@@ -0,0 +1,143 @@
+import queue
+import threading
+import time
+
+# Message broker for sharded sessions
+# With sharding (app/core/cluster.py) the process that holds a client's socket (gateway) is not
+# necessarily the one running its chat (node). They only talk through a Broker:
+#
+#   publish(topic, message)       fire and forget; messages are tuples of str, bytes, dicts
+#   subscribe(topic, handler)     handler(message) for every message, in publish order
+#   set_route / route / drop_route   which node owns a session, for sticky reconnects
+#   report_load / loads              each node's latest load report, for placement
+#
+# Topics used: "node.<node id>" (commands for a node) and "session.<session id>" (output of a
+# session, to whichever gateway holds the client right now).
+#
+# LocalBroker keeps all of it in this process, so a gateway and several nodes can run and be
+# tested on one machine. A networked broker (Redis pub/sub plus a hash for routes and loads,
+# NATS with a KV bucket, ...) implements the same methods.
+
+SUBSCRIBER_QUEUE = 1024
+
+
+class Broker:
+    def publish(self, topic, message):
+        raise NotImplementedError
+
+    def subscribe(self, topic, handler):
+        """Call handler(message) for each message on topic; returns a Subscription to close()."""
+        raise NotImplementedError
+
+    def set_route(self, session_id, node_id):
+        raise NotImplementedError
+
+    def route(self, session_id):
+        raise NotImplementedError
+
+    def drop_route(self, session_id):
+        raise NotImplementedError
+
+    def report_load(self, node_id, load):
+        raise NotImplementedError
+
+    def loads(self, max_age=None):
+        """{node id: load} of the nodes that reported within `max_age` seconds."""
+        raise NotImplementedError
+
+
+class Subscription:
+    """Delivers a topic's messages to a handler on its own thread.
+
+    The queue is bounded, so a slow consumer (a client on a bad connection) slows down its
+    publisher like a slow socket did, instead of buffering without limit.
+    """
+
+    def __init__(self, broker, topic, handler, maxsize=SUBSCRIBER_QUEUE):
+        self.broker = broker
+        self.topic = topic
+        self.handler = handler
+        self.queue = queue.Queue(maxsize=maxsize)
+        self._thread = threading.Thread(target=self._deliver, name=f"broker-{topic}", daemon=True)
+        self._thread.start()
+
+    def _deliver(self):
+        while True:
+            message = self.queue.get()
+            if message is Subscription:
+                return
+            try:
+                self.handler(message)
+            except Exception as e:
+                print(f" - broker: handler for {self.topic} failed: {e}", flush=True)
+
+    def close(self):
+        self.broker._unsubscribe(self)
+        self.queue.put(Subscription)
+
+
+class LocalBroker(Broker):
+    def __init__(self):
+        self._subscriptions = {}
+        self._routes = {}
+        self._loads = {}
+        self._lock = threading.Lock()
+        self.published = 0
+        self.undelivered = 0
+
+    def publish(self, topic, message):
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(topic, ()))
+            self.published += 1
+            if not subscriptions:
+                self.undelivered += 1
+        for subscription in subscriptions:
+            subscription.queue.put(message)
+
+    def subscribe(self, topic, handler):
+        subscription = Subscription(self, topic, handler)
+        with self._lock:
+            self._subscriptions.setdefault(topic, []).append(subscription)
+        return subscription
+
+    def _unsubscribe(self, subscription):
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.topic, [])
+            if subscription in subscriptions:
+                subscriptions.remove(subscription)
+            if not subscriptions:
+                self._subscriptions.pop(subscription.topic, None)
+
+    def set_route(self, session_id, node_id):
+        with self._lock:
+            self._routes[session_id] = node_id
+
+    def route(self, session_id):
+        with self._lock:
+            return self._routes.get(session_id)
+
+    def drop_route(self, session_id):
+        with self._lock:
+            self._routes.pop(session_id, None)
+
+    def report_load(self, node_id, load):
+        with self._lock:
+            self._loads[node_id] = (time.time(), load)
+
+    def loads(self, max_age=None):
+        now = time.time()
+        with self._lock:
+            return {
+                node_id: load
+                for node_id, (reported, load) in self._loads.items()
+                if max_age is None or now - reported <= max_age
+            }
+
+    def stats(self):
+        with self._lock:
+            return {
+                "topics": len(self._subscriptions),
+                "routes": len(self._routes),
+                "published": self.published,
+                "undelivered": self.undelivered,
+            }
@@ -0,0 +1,166 @@
+import heapq
+import socket
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# Run cancellation and deadlines
+# Every run of the session engine gets a RunToken, reachable from any code working for the run
+# through `current_run` (research branches copy the context into their threads, worker
+# processes keep a token of their own that the front's token forwards to). Cancelling it
+#
+#   stops the group chat at the next turn   agents check it before every reply (watch_turns)
+#   stops new LLM calls                     the shared HTTP transport checks it before sending
+#   aborts the LLM calls in flight          their sockets are shut down under the blocked read
+#   wakes a run waiting for human input     the session engine puts CANCEL in its inbox
+#
+# and the run ends with RunCancelled. It is a BaseException, like asyncio.CancelledError, so the
+# OpenAI client does not retry it and the agents' `except Exception` blocks let it through.
+# A run is cancelled by the client ({"op": "cancel"}), by the session closing (the socket went
+# away), or by its deadline, which one watcher thread enforces for all runs. With sharded
+# sessions a closed socket only detaches the session, and its node cancels the run after
+# SESSION_DETACH_SECONDS instead (app/core/cluster.py).
+
+# put in a session inbox to wake a run blocked on human input
+CANCEL = object()
+
+
+class RunCancelled(BaseException):
+    def __init__(self, reason="cancelled"):
+        super().__init__(reason)
+        self.reason = reason
+
+
+class RunToken:
+    def __init__(self, deadline=None):
+        """`deadline` is a time.monotonic() value, or None."""
+        self.deadline = deadline
+        self.reason = None
+        self.cancelled_at = None
+        self.aborted_calls = 0
+        self._cancelled = threading.Event()
+        self._sockets = set()
+        self._callbacks = []
+        self._closed = False
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def cancel(self, reason="cancelled"):
+        with self._lock:
+            if self._cancelled.is_set() or self._closed:
+                return False
+            self.reason, self.cancelled_at = reason, time.monotonic()
+            self._cancelled.set()
+            sockets, callbacks = list(self._sockets), list(self._callbacks)
+        for sock in sockets:
+            try:
+                # socket.socket's own shutdown: SSLSocket.shutdown would drop its state under the reader
+                socket.socket.shutdown(sock, socket.SHUT_RDWR)
+                self.aborted_calls += 1
+            except OSError:
+                pass
+        for callback in callbacks:
+            callback(reason)
+        return True
+
+    def close(self):
+        # the run is over: a late cancel (its deadline passing) does nothing
+        with self._lock:
+            self._closed = True
+            self._callbacks.clear()
+
+    def check(self):
+        """Raise RunCancelled if the run was cancelled or is past its deadline."""
+        if self.deadline is not None and not self.cancelled and time.monotonic() >= self.deadline:
+            self.cancel("deadline")
+        if self.cancelled:
+            raise RunCancelled(self.reason)
+
+    def on_cancel(self, callback):
+        """Call callback(reason) when the run is cancelled (at once if it already is)."""
+        with self._lock:
+            if not self._cancelled.is_set():
+                self._callbacks.append(callback)
+                return
+        callback(self.reason)
+
+    def remove_callback(self, callback):
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+    @contextmanager
+    def io(self, sock):
+        # a blocking read or write of an LLM call on `sock`, aborted by cancel()
+        with self._lock:
+            if self._cancelled.is_set():
+                raise RunCancelled(self.reason)
+            self._sockets.add(sock)
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._sockets.discard(sock)
+
+
+# the token of the run the current thread works for
+current_run = ContextVar("current_run", default=None)
+
+
+def check_current():
+    run = current_run.get()
+    if run is not None:
+        run.check()
+
+
+def watch_turns(agents):
+    """Make each agent check the current run's token before it replies."""
+
+    def check(messages):
+        check_current()
+        return messages
+
+    for agent in agents:
+        agent.register_hook("process_all_messages_before_reply", check)
+
+
+class DeadlineWatcher:
+    """One thread that cancels runs whose deadline has passed."""
+
+    def __init__(self):
+        self._heap = []
+        self._cond = threading.Condition()
+        self._thread = None
+        self._order = 0
+
+    def watch(self, token):
+        if token.deadline is None:
+            return
+        with self._cond:
+            self._order += 1
+            heapq.heappush(self._heap, (token.deadline, self._order, token))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name="run-deadlines", daemon=True)
+                self._thread.start()
+            self._cond.notify()
+
+    def _loop(self):
+        while True:
+            with self._cond:
+                while not self._heap:
+                    self._cond.wait()
+                deadline, _, token = self._heap[0]
+                now = time.monotonic()
+                if deadline > now:
+                    self._cond.wait(deadline - now)
+                    continue
+                heapq.heappop(self._heap)
+            # closed tokens of finished runs ignore it
+            token.cancel("deadline")
+
+
+deadlines = DeadlineWatcher()
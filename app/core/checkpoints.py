@@ -0,0 +1,309 @@
+import json
+import threading
+import time
+from contextvars import ContextVar
+from pathlib import Path
+
+from autogen.agentchat.group import ContextVariables
+from autogen.agentchat.groupchat import GroupChat
+
+# Group chat checkpoints
+# A run of a session's flow is checkpointed after every round of its group chat, so a client
+# that lost its connection, or a server that restarted, can continue the run where it was
+# instead of starting over. A checkpoint is the pattern's state as the next speaker is about
+# to reply: the group chat history, the context variables and that speaker. Each session has
+# one append-only file in the store, for its latest run:
+#
+#   checkpoints/<session id>.jsonl
+#     {"flow": "research", "message": "...", "started": ts}                  the run
+#     {"round": 1, "speaker": ..., "messages": [...], "context": {...}, ...}  each round
+#
+# Rounds are incremental: the messages added since the previous round, and the context
+# variables that changed ("removed" lists the deleted ones). A round whose history no longer
+# extends the saved one stores it whole with "reset": true. Loading replays the file; a torn
+# last line (the process died mid-write) is ignored.
+#
+# checkpoint_rounds(pattern) hooks a pattern built for the flow pool. Both parts do nothing
+# unless the run has a Checkpointer in `current_checkpoint`:
+#
+#   prepare_group_chat                 binds the run's group chat; when resuming, restores the
+#                                      context variables, hands ag2 the saved history (it
+#                                      resumes a chat given more than one message), makes the
+#                                      saved speaker the first to reply and counts the rounds
+#                                      already done against max_rounds
+#   process_all_messages_before_reply  saves the round, on every agent and the user agent
+#
+# Checkpoints of finished runs are dropped by the session engine; the rest (disconnected,
+# past their deadline, failed, or left behind by a restart) are evicted by the cleanup
+# thread once they are `ttl` seconds old, oldest first beyond `max_bytes`.
+
+TTL = 24 * 3600
+MAX_BYTES = 256 * 1024 * 1024
+CLEANUP_SECONDS = 300
+
+
+def _encode(value):
+    return json.dumps(value, separators=(",", ":"), sort_keys=True, default=str)
+
+
+class Checkpoint:
+    """The state of a run as of its latest round."""
+
+    def __init__(self, flow, message, started):
+        self.flow = flow
+        self.message = message
+        self.started = started
+        self.messages = []
+        self.context = {}
+        self.speaker = None
+        self.rounds = 0
+        self.updated_at = started
+
+    def apply(self, record):
+        if record.get("reset"):
+            self.messages = []
+        self.messages.extend(record.get("messages", ()))
+        self.context.update(record.get("context", {}))
+        for key in record.get("removed", ()):
+            self.context.pop(key, None)
+        self.speaker = record.get("speaker", self.speaker)
+        self.rounds = record.get("round", self.rounds)
+        self.updated_at = record.get("ts", self.updated_at)
+
+    def to_dict(self):
+        return {
+            "flow": self.flow,
+            "rounds": self.rounds,
+            "messages": len(self.messages),
+            "speaker": self.speaker,
+            "started": self.started,
+            "updated_at": self.updated_at,
+        }
+
+
+class Checkpointer:
+    """Writes the checkpoints of one run."""
+
+    def __init__(self, store, session_id, path, resume=None):
+        self.store = store
+        self.session_id = session_id
+        self.path = path
+        # the Checkpoint this run continues, used up by the first prepare_group_chat
+        self.resume = resume
+        self.groupchat = None
+        self.context = None
+        self.rounds = resume.rounds if resume is not None else 0
+        self._messages = len(resume.messages) if resume is not None else 0
+        self._context = {key: _encode(value) for key, value in resume.context.items()} if resume is not None else {}
+        self._file = open(path, "a", encoding="utf-8")
+        self._lock = threading.Lock()
+
+    def bind(self, groupchat, context_variables):
+        self.groupchat, self.context = groupchat, context_variables
+
+    def save(self, speaker):
+        if self.groupchat is None:
+            return
+        messages = self.groupchat.messages
+        context = self.context.to_dict()
+        with self._lock:
+            if self._file.closed:
+                return
+            encoded = {key: _encode(value) for key, value in context.items()}
+            record = {"round": self.rounds + 1, "speaker": speaker, "ts": time.time()}
+            if len(messages) < self._messages:
+                record["reset"], record["messages"] = True, messages
+            elif len(messages) > self._messages:
+                record["messages"] = messages[self._messages:]
+            changed = {key: context[key] for key, value in encoded.items() if self._context.get(key) != value}
+            if changed:
+                record["context"] = changed
+            removed = [key for key in self._context if key not in encoded]
+            if removed:
+                record["removed"] = removed
+            line = json.dumps(record, separators=(",", ":"), default=str) + "\n"
+            self._file.write(line)
+            self._file.flush()
+            self.rounds += 1
+            self._messages, self._context = len(messages), encoded
+        self.store._count(rounds=1, bytes_written=len(line))
+
+    def close(self, keep=True):
+        """End the run; without `keep` (it finished) its checkpoint is dropped."""
+        with self._lock:
+            if self._file.closed:
+                return
+            self._file.close()
+        if not keep:
+            self.store.drop(self.session_id)
+
+
+# the Checkpointer of the run the current thread works for
+current_checkpoint = ContextVar("current_checkpoint", default=None)
+
+
+def checkpoint_rounds(pattern):
+    """Checkpoint the runs of `pattern` after every round, and resume them from a checkpoint."""
+    prepare = pattern.prepare_group_chat
+
+    def prepare_group_chat(max_rounds, messages):
+        checkpoint = current_checkpoint.get()
+        resume = checkpoint.resume if checkpoint is not None else None
+        if resume is not None and len(resume.messages) > 1:
+            checkpoint.resume = None
+            agents = {agent.name: agent for agent in [*pattern.agents, pattern.user_agent] if agent is not None}
+            if resume.speaker in agents:
+                # the group's first speaker selection picks the initial agent
+                pattern.initial_agent = agents[resume.speaker]
+            pattern.context_variables.clear()
+            pattern.context_variables.update(resume.context)
+            # the last saved message is sent again to start the chat, as its first round
+            max_rounds = max(1, max_rounds - len(resume.messages) + 1)
+            messages = resume.messages
+        prepared = prepare(max_rounds=max_rounds, messages=messages)
+        if checkpoint is not None:
+            # (agents, wrapped, user, context_variables, initial, after_work, executor, groupchat, ...)
+            _, _, _, context_variables, _, _, _, groupchat, *_ = prepared
+            if not isinstance(groupchat, GroupChat) or not isinstance(context_variables, ContextVariables):
+                raise TypeError(
+                    f"{type(pattern).__name__}.prepare_group_chat returned "
+                    f"{type(groupchat).__name__} and {type(context_variables).__name__} where the group chat "
+                    "and context variables were expected: the ag2 version changed its result"
+                )
+            checkpoint.bind(groupchat, context_variables)
+        return prepared
+
+    pattern.prepare_group_chat = prepare_group_chat
+
+    for agent in [*pattern.agents, pattern.user_agent]:
+        if agent is None:
+            continue
+
+        def save(messages, name=agent.name):
+            checkpoint = current_checkpoint.get()
+            if checkpoint is not None:
+                checkpoint.save(name)
+            return messages
+
+        agent.register_hook("process_all_messages_before_reply", save)
+    return pattern
+
+
+class CheckpointStore:
+    def __init__(self, directory, ttl=TTL, max_bytes=MAX_BYTES):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._cleanup = None
+        self.counters = {"runs": 0, "resumed": 0, "rounds": 0, "bytes_written": 0, "dropped": 0, "evicted": 0}
+
+    def _path(self, session_id):
+        # session ids come from clients resuming: keep them to one plain file name
+        if not session_id or not str(session_id).isalnum():
+            raise ValueError(f"Invalid session id {session_id!r}")
+        return self.directory / f"{session_id}.jsonl"
+
+    def _count(self, **counts):
+        with self._lock:
+            for name, count in counts.items():
+                self.counters[name] += count
+
+    def open(self, session_id, flow, message, resume_from=None):
+        """Start checkpointing a run of `session_id`, continuing the run of `resume_from` if
+        that session has a checkpoint of the same flow."""
+        resume = self.load(resume_from) if resume_from else None
+        if resume is not None and (resume.flow != flow or not resume.messages):
+            resume = None
+        path = self._path(session_id)
+        started = resume.started if resume is not None else time.time()
+        lines = [{"flow": flow, "message": resume.message if resume is not None else message, "started": started}]
+        if resume is not None:
+            # the resumed state, whole, so the run's own file is enough to resume it again
+            lines.append({"round": resume.rounds, "speaker": resume.speaker, "messages": resume.messages,
+                          "context": resume.context, "ts": resume.updated_at, "reset": True})
+        data = "".join(json.dumps(line, separators=(",", ":"), default=str) + "\n" for line in lines)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(data)
+        if resume is not None and resume_from != session_id:
+            self.drop(resume_from, count=False)
+        self._count(runs=1, resumed=int(resume is not None), bytes_written=len(data))
+        return Checkpointer(self, session_id, path, resume)
+
+    def load(self, session_id):
+        """The latest checkpoint of the session, or None."""
+        try:
+            path = self._path(session_id)
+            f = open(path, encoding="utf-8")
+        except (ValueError, OSError):
+            return None
+        checkpoint = None
+        with f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break
+                if checkpoint is None:
+                    checkpoint = Checkpoint(record.get("flow"), record.get("message"), record.get("started"))
+                else:
+                    checkpoint.apply(record)
+        return checkpoint
+
+    def drop(self, session_id, count=True):
+        try:
+            self._path(session_id).unlink()
+        except (ValueError, OSError):
+            return
+        if count:
+            self._count(dropped=1)
+
+    def evict(self, now=None):
+        """Remove checkpoints older than the ttl, then the oldest beyond max_bytes."""
+        now = time.time() if now is None else now
+        files = []
+        for path in self.directory.glob("*.jsonl"):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+        files.sort()
+        total = sum(size for _, size, _ in files)
+        evicted = 0
+        for mtime, size, path in files:
+            if now - mtime <= self.ttl and total <= self.max_bytes:
+                break
+            try:
+                path.unlink()
+            except OSError:
+                continue
+            total -= size
+            evicted += 1
+        self._count(evicted=evicted)
+        return evicted
+
+    def start_cleanup(self, interval=CLEANUP_SECONDS):
+        """Evict every `interval` seconds on a daemon thread."""
+        def loop():
+            while True:
+                time.sleep(interval)
+                self.evict()
+
+        with self._lock:
+            if self._cleanup is None:
+                self._cleanup = threading.Thread(target=loop, name="checkpoint-cleanup", daemon=True)
+                self._cleanup.start()
+
+    def stats(self):
+        files = list(self.directory.glob("*.jsonl"))
+        with self._lock:
+            counters = dict(self.counters)
+        return {
+            "directory": str(self.directory),
+            "ttl_s": self.ttl,
+            "checkpoints": len(files),
+            "bytes": sum(path.stat().st_size for path in files if path.exists()),
+            **counters,
+        }
@@ -0,0 +1,361 @@
+import json
+import threading
+import time
+import uuid
+from collections import deque
+
+from websockets.exceptions import ConnectionClosed
+
+# Sharded sessions
+# Without sharding on_connect (app/agents/agentchat_websockets.py) runs a client's chats in the
+# process that holds its socket. With CLUSTER_BROKER set the two are split:
+#
+#   client <-> SessionGateway --broker--> SessionNode (SessionEngine, runs the flows)
+#
+#   gateway                                         node
+#   first message picks a node (least loaded)
+#     ("open", session id)           node.<id> ->   engine.open(), sets up the flow
+#     ("input", session id, text)    node.<id> ->   control op or chat message, as on_connect
+#     client frames                  <- session.<id>  FrameWriter output, unchanged
+#     ("undelivered", ..., frame)    node.<id> ->   the socket is gone: the frame goes back
+#     ("detach", session id)         node.<id> ->   the run goes on, its output is kept
+#     ("attach", session id)         node.<id> ->   reconnect: kept output is sent, then live
+#     ("close", session id)          node.<id> ->   TERMINATE
+#
+# open, attach, detach and undelivered also carry the id of the gateway connection, so a late
+# detach from a connection the client already replaced does not detach the new one.
+#
+# Right after connecting the gateway tells the client its session:
+#   {"type": "session", "content": {"id": ..., "node": ..., "resumed": false}}
+# and a client that reconnects sends {"op": "resume", "session": id} as its first message to
+# get back to the node still running it (sticky routing through the broker's route table).
+# When that node is gone the client gets a new session, and the resume request goes to it like
+# any other message: it continues the lost run from its last checkpoint, if the new node can
+# read the checkpoint store (app/core/checkpoints.py).
+#
+# Nodes report their load every heartbeat; the gateway places new sessions on the live node
+# with the most free run slots, counting the sessions it placed since that node's last
+# report so a burst of connections does not all land on the same node.
+#
+# A client that goes away only detaches its session here, so unlike the single process
+# setup, where the closed socket cancels the run at once, the run goes on for it to resume.
+# Once a session has stayed detached for `detach_seconds` its node cancels the run through
+# the engine, the same RunToken cancellation a closed socket triggers (the run stops at its
+# next turn, its LLM calls are aborted, a wait for human input is woken, reason "detached"),
+# and closes the session on a later heartbeat, after the run has given its slot back.
+
+HEARTBEAT_SECONDS = 1.0
+DETACH_SECONDS = 300
+BACKLOG_FRAMES = 1000
+
+
+def control_op(message):
+    """The op of a JSON control message ({"op": ...}), or None for chat input."""
+    if not message.startswith("{"):
+        return None
+    try:
+        control = json.loads(message)
+    except ValueError:
+        return None
+    return control.get("op") if isinstance(control, dict) else None
+
+
+class NodeSocket:
+    """Stands in for the client websocket of a session hosted on a node."""
+
+    def __init__(self, hosted):
+        self.hosted = hosted
+
+    def send(self, data):
+        self.hosted.output(data)
+
+
+class NodeIOStream:
+    # what a Session needs from IOWebsockets: the socket for its frame writer, and send()
+    # for the unbatched fast path
+    def __init__(self, websocket):
+        self.websocket = websocket
+
+    def send(self, event):
+        self.websocket.send(event.model_dump_json())
+
+
+class HostedSession:
+    def __init__(self, node, session_id, backlog):
+        self.node = node
+        self.id = session_id
+        self.session = None
+        # gateway connection currently holding the client
+        self.connection = None
+        self.attached = False
+        self.detached_at = None
+        # output sent while no gateway holds the client, replayed on attach
+        self.backlog = deque(maxlen=backlog)
+        # where the next frame handed back by the gateway goes: they were sent before the rest
+        self._returned = 0
+        self.dropped = 0
+        # its run was cancelled for staying detached too long
+        self.cancelled = False
+        self._lock = threading.Lock()
+
+    def output(self, data):
+        with self._lock:
+            self._output(data)
+
+    def _output(self, data):
+        if self.attached:
+            self.node.broker.publish(f"session.{self.id}", data)
+            return
+        if len(self.backlog) == self.backlog.maxlen:
+            self.dropped += 1
+        self.backlog.append(data)
+
+    def attach(self, connection):
+        with self._lock:
+            while self.backlog:
+                self.node.broker.publish(f"session.{self.id}", self.backlog.popleft())
+            self.connection, self.attached, self.detached_at = connection, True, None
+            self.cancelled = False
+
+    def detach(self, connection):
+        with self._lock:
+            if connection == self.connection and self.attached:
+                self.attached, self.detached_at, self._returned = False, time.time(), 0
+
+    def undelivered(self, connection, data):
+        with self._lock:
+            if connection != self.connection:
+                # a frame of an older connection, the client has reconnected since
+                self._output(data)
+                return
+            if self.attached:
+                self.attached, self.detached_at, self._returned = False, time.time(), 0
+            if len(self.backlog) == self.backlog.maxlen:
+                self.dropped += 1
+                return
+            self.backlog.insert(self._returned, data)
+            self._returned += 1
+
+
+class SessionNode:
+    def __init__(self, node_id, broker, engine, setup, receive,
+                 heartbeat=HEARTBEAT_SECONDS, detach_seconds=DETACH_SECONDS, backlog=BACKLOG_FRAMES):
+        """Runs sessions for the gateways: `setup(session)` prepares a new session's flow and
+        `receive(session, message)` handles each client message, as on_connect does."""
+        self.id = node_id
+        self.broker = broker
+        self.engine = engine
+        self.setup = setup
+        self.receive = receive
+        self.heartbeat = heartbeat
+        self.detach_seconds = detach_seconds
+        self.backlog = backlog
+        self._hosted = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._subscription = None
+        self._reports = 0
+        self.reaped = 0
+
+    def start(self):
+        self._subscription = self.broker.subscribe(f"node.{self.id}", self._command)
+        self._report()
+        threading.Thread(target=self._heartbeat, name=f"node-{self.id}", daemon=True).start()
+        return self
+
+    def _command(self, message):
+        kind, session_id, *payload = message
+        with self._lock:
+            hosted = self._hosted.get(session_id)
+        if kind == "open" and hosted is None:
+            hosted = HostedSession(self, session_id, self.backlog)
+            hosted.session = self.engine.open(NodeIOStream(NodeSocket(hosted)), session_id=session_id)
+            self.setup(hosted.session)
+            hosted.attach(payload[0])
+            with self._lock:
+                self._hosted[session_id] = hosted
+            self.broker.set_route(session_id, self.id)
+        elif hosted is None:
+            print(f" - node {self.id}: {kind} for unknown session {session_id}", flush=True)
+        elif kind == "input":
+            self.receive(hosted.session, payload[0])
+        elif kind == "attach":
+            hosted.attach(payload[0])
+        elif kind == "detach":
+            hosted.detach(payload[0])
+        elif kind == "undelivered":
+            hosted.undelivered(*payload)
+        elif kind == "close":
+            self._close(hosted)
+
+    def _close(self, hosted):
+        with self._lock:
+            self._hosted.pop(hosted.id, None)
+        self.engine.close(hosted.session)
+        self.broker.drop_route(hosted.id)
+
+    def load(self):
+        stats = self.engine.stats()
+        return {
+            "sessions": stats["sessions"],
+            "active_runs": stats["running"] + stats["queued"],
+            "capacity": stats["max_active_runs"],
+            # lets the gateway tell a fresh report from one it has already seen
+            "report": self._reports,
+        }
+
+    def _report(self):
+        self._reports += 1
+        self.broker.report_load(self.id, self.load())
+
+    def _heartbeat(self):
+        while not self._stop.wait(self.heartbeat):
+            self._report()
+            now = time.time()
+            with self._lock:
+                expired = [
+                    hosted for hosted in self._hosted.values()
+                    if hosted.detached_at is not None and now - hosted.detached_at > self.detach_seconds
+                ]
+            for hosted in expired:
+                if hosted.session.busy:
+                    # a run nobody came back for, maybe blocked on human input: cancel it and
+                    # reap the session on a later heartbeat, once the run has given up its slot
+                    if not hosted.cancelled:
+                        hosted.cancelled = True
+                        self.engine.cancel(hosted.session, "detached")
+                    continue
+                self.reaped += 1
+                self._close(hosted)
+
+    def stats(self):
+        with self._lock:
+            hosted = list(self._hosted.values())
+        return {
+            "node": self.id,
+            "load": self.load(),
+            "attached": sum(h.attached for h in hosted),
+            "detached": sum(not h.attached for h in hosted),
+            "backlog_frames": sum(len(h.backlog) for h in hosted),
+            "dropped_frames": sum(h.dropped for h in hosted),
+            "reaped": self.reaped,
+        }
+
+    def close(self):
+        self._stop.set()
+        if self._subscription is not None:
+            self._subscription.close()
+        with self._lock:
+            hosted = list(self._hosted.values())
+        for h in hosted:
+            self._close(h)
+
+
+class SessionGateway:
+    def __init__(self, broker, node_ttl=3 * HEARTBEAT_SECONDS):
+        self.broker = broker
+        self.node_ttl = node_ttl
+        # node -> (report it was counted against, sessions placed since)
+        self._placed = {}
+        self._lock = threading.Lock()
+        self.opened = 0
+        self.resumed = 0
+        self.rerouted = 0
+
+    def live_nodes(self):
+        return self.broker.loads(max_age=self.node_ttl)
+
+    def place(self):
+        """Pick the live node with the most free run slots, then the fewest sessions."""
+        loads = self.live_nodes()
+        if not loads:
+            raise RuntimeError("No session node is available")
+        with self._lock:
+            def placed_since_report(node_id):
+                report, placed = self._placed.get(node_id, (None, 0))
+                return placed if report == loads[node_id]["report"] else 0
+
+            def score(node_id):
+                load, placed = loads[node_id], placed_since_report(node_id)
+                return (load["active_runs"] + placed) / max(load["capacity"], 1), load["sessions"] + placed
+
+            node_id = min(loads, key=score)
+            self._placed[node_id] = (loads[node_id]["report"], placed_since_report(node_id) + 1)
+            return node_id
+
+    def _resume(self, message):
+        # {"op": "resume", "session": id} as the first message; False when that session is gone
+        if control_op(message) != "resume":
+            return None
+        control = json.loads(message)
+        session_id = control.get("session") if isinstance(control, dict) else None
+        if not isinstance(session_id, str):
+            return False
+        node_id = self.broker.route(session_id)
+        if node_id is None or node_id not in self.live_nodes():
+            return False
+        return session_id, node_id
+
+    def _connect(self, websocket, connection, session_id, node_id, resumed):
+        def forward(data):
+            try:
+                websocket.send(data)
+            except ConnectionClosed:
+                # the client is gone; the node keeps the frame for when it comes back
+                self.broker.publish(f"node.{node_id}", ("undelivered", session_id, connection, data))
+
+        # subscribed before the node is asked for anything, so no output is missed
+        subscription = self.broker.subscribe(f"session.{session_id}", forward)
+        websocket.send(json.dumps({"type": "session", "content": {"id": session_id, "node": node_id, "resumed": resumed}}))
+        self.broker.publish(f"node.{node_id}", ("attach" if resumed else "open", session_id, connection))
+        with self._lock:
+            if resumed:
+                self.resumed += 1
+            else:
+                self.opened += 1
+        return subscription
+
+    def on_connect(self, iostream):
+        websocket = iostream.websocket
+        message = iostream.input()
+        resume = self._resume(message)
+        if resume is not None:
+            # the resume request itself is not chat input
+            message = None
+        session_id, node_id = resume or (uuid.uuid4().hex, self.place())
+        connection = uuid.uuid4().hex[:12]
+        subscription = self._connect(websocket, connection, session_id, node_id, resumed=bool(resume))
+        closed = False
+        # the client's last hello, replayed to the session that replaces a lost one
+        hello = None
+        try:
+            while True:
+                if message is None:
+                    message = iostream.input()
+                if control_op(message) == "hello":
+                    hello = message
+                if message == "TERMINATE":
+                    self.broker.publish(f"node.{node_id}", ("close", session_id))
+                    closed = True
+                    break
+                if node_id not in self.live_nodes():
+                    # the node stopped reporting: its runs are gone, start over on another one
+                    subscription.close()
+                    websocket.send(json.dumps({"type": "error", "content": {"content": "The session was lost, continuing in a new one."}}))
+                    session_id, node_id = uuid.uuid4().hex, self.place()
+                    subscription = self._connect(websocket, connection, session_id, node_id, resumed=False)
+                    if hello is not None and hello is not message:
+                        self.broker.publish(f"node.{node_id}", ("input", session_id, hello))
+                    with self._lock:
+                        self.rerouted += 1
+                self.broker.publish(f"node.{node_id}", ("input", session_id, message))
+                message = None
+        finally:
+            if not closed:
+                self.broker.publish(f"node.{node_id}", ("detach", session_id, connection))
+            subscription.close()
+
+    def stats(self):
+        with self._lock:
+            counters = {"opened": self.opened, "resumed": self.resumed, "rerouted": self.rerouted}
+        return {"nodes": self.live_nodes(), **counters}
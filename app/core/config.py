@@ -1,17 +1,226 @@
 import os
-from autogen import LLMConfig
+import threading
 from pydantic import BaseModel
 
+# Which LLM backend the flows talk to: "azure" (default) or "mock", the local
+# OpenAI-compatible server in app/core/mock_llm.py for offline, deterministic runs
+LLM_BACKEND = os.environ.get("LLM_BACKEND", "azure")
+MOCK_LLM_URL = os.environ.get("MOCK_LLM_URL", "http://127.0.0.1:8900/v1")
+AZURE_BASE_URL = "https://gabriel-azure-oai.openai.azure.com/"
+# The endpoint the llm_config entries point at
+LLM_BASE_URL = MOCK_LLM_URL if LLM_BACKEND == "mock" else AZURE_BASE_URL
+
+# One keep-alive connection pool shared by the OpenAI clients of all agents and sessions:
+# connection limits (per host: requests in flight, 0 for no limit) and timeouts in seconds
+HTTP_MAX_CONNECTIONS = int(os.environ.get("HTTP_MAX_CONNECTIONS", 100))
+HTTP_MAX_KEEPALIVE = int(os.environ.get("HTTP_MAX_KEEPALIVE", 20))
+HTTP_KEEPALIVE_EXPIRY = float(os.environ.get("HTTP_KEEPALIVE_EXPIRY", 30))
+HTTP_MAX_PER_HOST = int(os.environ.get("HTTP_MAX_PER_HOST", 0))
+HTTP_CONNECT_TIMEOUT = float(os.environ.get("HTTP_CONNECT_TIMEOUT", 10))
+HTTP_READ_TIMEOUT = float(os.environ.get("HTTP_READ_TIMEOUT", 120))
+HTTP_POOL_TIMEOUT = float(os.environ.get("HTTP_POOL_TIMEOUT", 30))
+
+# LLM call scheduler shared by all sessions: the deployment's requests and tokens per minute
+# (0 for no limit), the priority classes from highest to lowest (a session's class is its
+# account tier, see ACCOUNT_KEYS) and the class of everyone else
+LLM_RPM = int(os.environ.get("LLM_RPM", 0))
+LLM_TPM = int(os.environ.get("LLM_TPM", 0))
+LLM_PRIORITY_CLASSES = [name.strip() for name in os.environ.get("LLM_PRIORITY_CLASSES", "premium,standard,batch").split(",") if name.strip()]
+LLM_DEFAULT_TIER = os.environ.get("LLM_DEFAULT_TIER", "standard")
+
+# Account tiers by the key a client presents as "account_key" in its hello, e.g.
+# "k_8f2c=premium,k_93ab=batch" (comma separated); sessions without a known key get
+# LLM_DEFAULT_TIER. Tiers are only ever taken from here, never from the client
+ACCOUNT_KEYS = {
+	key.strip(): tier.strip()
+	for key, _, tier in (entry.partition("=") for entry in os.environ.get("ACCOUNT_KEYS", "").split(","))
+	if key.strip() and tier.strip()
+}
+if set(ACCOUNT_KEYS.values()) - set(LLM_PRIORITY_CLASSES):
+	raise ValueError(f"ACCOUNT_KEYS tiers must be among LLM_PRIORITY_CLASSES {LLM_PRIORITY_CLASSES}")
+
+# Deployments the LLM calls are spread over by latency and health (app/core/llm_router.py): a JSON
+# list of {"name", "base_url", "api_key"} or comma separated base URLs using the configured key;
+# empty sends every call to LLM_BASE_URL
+LLM_DEPLOYMENTS = os.environ.get("LLM_DEPLOYMENTS", "")
+
+# Failures in a row that take a deployment out of rotation, and for how long at first (seconds)
+LLM_BREAKER_FAILURES = int(os.environ.get("LLM_BREAKER_FAILURES", 3))
+LLM_BREAKER_SECONDS = float(os.environ.get("LLM_BREAKER_SECONDS", 10))
+
+# Hedged requests: milliseconds without a response before a call is also sent to the next best
+# deployment (0 turns hedging off), and the largest fraction of calls that may be hedged
+LLM_HEDGE_MS = float(os.environ.get("LLM_HEDGE_MS", 0))
+LLM_HEDGE_BUDGET = float(os.environ.get("LLM_HEDGE_BUDGET", 0.1))
+
+def build_llm_router():
+	if not LLM_DEPLOYMENTS:
+		return None
+	from app.core.llm_router import LLMRouter, parse_deployments
+
+	return LLMRouter(
+		LLM_BASE_URL,
+		parse_deployments(LLM_DEPLOYMENTS),
+		breaker_failures=LLM_BREAKER_FAILURES,
+		breaker_seconds=LLM_BREAKER_SECONDS,
+		hedge_after=LLM_HEDGE_MS / 1000,
+		hedge_budget=LLM_HEDGE_BUDGET,
+	)
+
+def build_llm_scheduler():
+	from app.core.llm_scheduler import LLMScheduler
+
+	return LLMScheduler(rpm=LLM_RPM, tpm=LLM_TPM, classes=LLM_PRIORITY_CLASSES, default_class=LLM_DEFAULT_TIER)
+
+def build_http_pool():
+	from app.core.http_pool import HTTPPool
+
+	return HTTPPool(
+		max_connections=HTTP_MAX_CONNECTIONS,
+		max_keepalive=HTTP_MAX_KEEPALIVE,
+		keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+		max_per_host=HTTP_MAX_PER_HOST or None,
+		connect_timeout=HTTP_CONNECT_TIMEOUT,
+		read_timeout=HTTP_READ_TIMEOUT,
+		pool_timeout=HTTP_POOL_TIMEOUT,
+		scheduler=lazy("llm_scheduler"),
+		router=lazy("llm_router"),
+	)
+
 # FILL IN WITH YOUR CREDENTIALS
-llm_config = LLMConfig(
-	config_list=[
-		{
-			"api_type": "azure",
-			"api_key": os.environ["OPENAI_API_KEY"],
-			"api_version": "2024-12-01-preview",
-			"base_url": "https://gabriel-azure-oai.openai.azure.com/",
-			"model": "gpt-4o-mini", 
-		}
-	],
-	temperature=0.7
-)
+def build_llm_config():
+	from autogen import LLMConfig
+
+	if LLM_BACKEND == "mock":
+		return LLMConfig(
+			config_list=[
+				{
+					"api_type": "openai",
+					"api_key": "mock",
+					"base_url": LLM_BASE_URL,
+					"model": "gpt-4o-mini",
+					"http_client": lazy("http_pool").client,
+				}
+			],
+			temperature=0.7
+		)
+	return LLMConfig(
+		config_list=[
+			{
+				"api_type": "azure",
+				"api_key": os.environ["OPENAI_API_KEY"],
+				"api_version": "2024-12-01-preview",
+				"base_url": LLM_BASE_URL,
+				"model": "gpt-4o-mini", 
+				"http_client": lazy("http_pool").client,
+			}
+		],
+		temperature=0.7
+	)
+
+# llm_config, http_pool, llm_scheduler and llm_router are built on first access (`from app.core.config import llm_config`
+# still works), so importing the settings does not load autogen, openai and httpx
+LAZY = {"llm_config": build_llm_config, "http_pool": build_http_pool, "llm_scheduler": build_llm_scheduler, "llm_router": build_llm_router}
+_lazy_lock = threading.RLock()
+
+def lazy(name):
+	with _lazy_lock:
+		if name not in globals():
+			globals()[name] = LAZY[name]()
+		return globals()[name]
+
+def __getattr__(name):
+	if name in LAZY:
+		return lazy(name)
+	raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+# Maximum number of group chat runs executing at once; further runs wait in the session queue
+MAX_ACTIVE_RUNS = int(os.environ.get("MAX_ACTIVE_RUNS", 4))
+
+# Admission control (app/core/admission.py): runs waiting for a slot before new ones are turned
+# away, and the projected wait in seconds past which a new run is turned away with "busy, retry
+# after" (0 for no limit on either)
+ADMISSION_MAX_PENDING = int(os.environ.get("ADMISSION_MAX_PENDING", 64))
+ADMISSION_MAX_WAIT = float(os.environ.get("ADMISSION_MAX_WAIT", 60))
+
+# Most runs of a flow at once, e.g. "research=2,agent_manager=1" (comma separated); other flows
+# are only bound by MAX_ACTIVE_RUNS
+FLOW_CONCURRENCY = {
+	name.strip(): int(limit)
+	for name, _, limit in (entry.partition("=") for entry in os.environ.get("FLOW_CONCURRENCY", "").split(","))
+	if name.strip() and limit.strip()
+}
+
+# Seconds a session run may take before it is cancelled, as if the client had sent
+# {"op": "cancel"} (0 for no deadline); a client's hello can set its own with "deadline_s"
+RUN_DEADLINE_SECONDS = float(os.environ.get("RUN_DEADLINE_SECONDS", 0))
+
+# Worker processes that run the tech support and research sessions, so group chats use every
+# core instead of sharing one GIL; 0 runs them on threads in the server process
+SESSION_WORKERS = int(os.environ.get("SESSION_WORKERS", 0))
+
+# Runs each worker process takes at once (MAX_ACTIVE_RUNS still caps the total)
+SESSION_WORKER_RUNS = int(os.environ.get("SESSION_WORKER_RUNS", 4))
+
+# Sharded sessions (app/core/cluster.py): the broker between the socket gateway and the session
+# nodes, "local" for an in-process one; empty runs sessions in the process that holds the socket
+CLUSTER_BROKER = os.environ.get("CLUSTER_BROKER", "")
+
+# Session nodes started in this process with the local broker. They split MAX_ACTIVE_RUNS, the
+# FLOW_CONCURRENCY limits and ADMISSION_MAX_PENDING between them (at least 1 each), so the
+# process runs no more than it would without sharding
+CLUSTER_NODES = int(os.environ.get("CLUSTER_NODES", 2))
+
+# Node load reports interval (a node silent for three intervals counts as gone), and how long a
+# session whose client disconnected is kept for it to resume, after which its run is cancelled
+CLUSTER_HEARTBEAT_MS = float(os.environ.get("CLUSTER_HEARTBEAT_MS", 1000))
+SESSION_DETACH_SECONDS = float(os.environ.get("SESSION_DETACH_SECONDS", 300))
+
+# Pre-built instances kept ready per flow by the warm flow pool
+FLOW_POOL_SIZE = int(os.environ.get("FLOW_POOL_SIZE", 2))
+
+# Flows imported and pre-built in the background at startup (comma separated); the rest load on first use
+FLOW_WARMUP = [flow.strip() for flow in os.environ.get("FLOW_WARMUP", "tech_support,research").split(",") if flow.strip()]
+
+# Threads shared by all research runs for running independent specialists and managers side by
+# side; 0 runs the research flow as one sequential group chat
+RESEARCH_BRANCH_WORKERS = int(os.environ.get("RESEARCH_BRANCH_WORKERS", 0))
+
+# Flows whose agents see a compacted history instead of the whole chat (comma separated)
+HISTORY_FLOWS = {flow.strip() for flow in os.environ.get("HISTORY_FLOWS", "").split(",") if flow.strip()}
+
+# Turns an agent sees verbatim (at least 1) before older ones are summarized, and the most messages it sees at all
+HISTORY_KEEP_RECENT = int(os.environ.get("HISTORY_KEEP_RECENT", 8))
+HISTORY_MAX_MESSAGES = int(os.environ.get("HISTORY_MAX_MESSAGES", 24))
+
+# Flows whose agents stream their completions to the client token by token (comma separated)
+STREAM_FLOWS = {flow.strip() for flow in os.environ.get("STREAM_FLOWS", "").split(",") if flow.strip()}
+
+# Streamed text is sent once this many bytes or milliseconds of it are buffered
+STREAM_CHUNK_BYTES = int(os.environ.get("STREAM_CHUNK_BYTES", 64))
+STREAM_CHUNK_MS = float(os.environ.get("STREAM_CHUNK_MS", 50))
+
+# Websocket output: permessage-deflate ("deflate", empty to turn it off), and the default batch
+# delay and size for clients that ask for batched frames
+WS_COMPRESSION = os.environ.get("WS_COMPRESSION", "deflate")
+WS_BATCH_MS = float(os.environ.get("WS_BATCH_MS", 20))
+WS_BATCH_BYTES = int(os.environ.get("WS_BATCH_BYTES", 16 * 1024))
+
+# Directory of the append-only trace store that records every run; empty disables tracing
+TRACE_DIR = os.environ.get("TRACE_DIR", "traces")
+
+# Directory of the checkpoints that let a reconnecting client resume its run (empty disables
+# them), how long one is kept, the store's size cap, and how often the cleanup thread evicts
+CHECKPOINT_DIR = os.environ.get("CHECKPOINT_DIR", "checkpoints")
+CHECKPOINT_TTL = float(os.environ.get("CHECKPOINT_TTL", 24 * 3600))
+CHECKPOINT_MAX_MB = int(os.environ.get("CHECKPOINT_MAX_MB", 256))
+CHECKPOINT_CLEANUP_SECONDS = float(os.environ.get("CHECKPOINT_CLEANUP_SECONDS", 300))
+
+# Flows whose LLM replies go through the response cache (comma separated, e.g. "tech_support,research")
+LLM_CACHE_FLOWS = {flow.strip() for flow in os.environ.get("LLM_CACHE_FLOWS", "").split(",") if flow.strip()}
+
+# Response cache disk tier directory (empty keeps the cache in memory only), sizes and entry lifetime
+LLM_CACHE_DIR = os.environ.get("LLM_CACHE_DIR", ".llm_cache")
+LLM_CACHE_MEMORY_MB = int(os.environ.get("LLM_CACHE_MEMORY_MB", 32))
+LLM_CACHE_DISK_MB = int(os.environ.get("LLM_CACHE_DISK_MB", 1024))
+LLM_CACHE_TTL = float(os.environ.get("LLM_CACHE_TTL", 24 * 3600))
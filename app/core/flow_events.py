@@ -0,0 +1,190 @@
+import json
+import threading
+from collections import OrderedDict
+
+from app.core.flow_graph import FlowGraph
+
+# Compact flow events
+# The visualizer only needs who talked to whom, what kind of step it was and, sometimes,
+# the text. Instead of every raw ag2 event (pretty much the full pydantic dump) the encoder
+# sends one small object per event (written, and maybe batched, by app/core/framing.py):
+#
+#   {"s": 12, "k": "msg", "f": 3, "t": 5, "x": "short text"}
+#   {"s": 13, "k": "msg", "f": 5, "t": 3, "p": 13, "n": 4211, "v": "first words..."}
+#
+#   s  sequence number, per session
+#   k  kind: msg, call, result, turn, exec, end, log, done, chunk, payload, or the raw ag2 type;
+#      node and edge frames are graph deltas, see app/core/flow_graph.py
+#   f  sender id,  t  recipient id  (node ids are declared once with a node frame)
+#   x  inline text, only when it is at most `inline_limit` bytes
+#   p  payload reference for longer text, fetched with {"op": "payload", "ref": 13}
+#   n  payload length,  v  short preview of the payload
+#   m  message id of a streamed chunk,  e  1 on the last chunk of that message, right before
+#      the sender's final msg or call frame (see app/core/streaming.py)
+#
+# With a layout engine attached, every topology change is followed by pos frames
+# {"k": "pos", "i": 3, "x": 0.42, "y": 0.5} for the nodes that moved (see app/core/layout.py).
+
+INLINE_PAYLOAD_BYTES = 256
+# the most a client may ask to get inline, larger bodies always go to the payload store
+MAX_INLINE_PAYLOAD_BYTES = 64 * 1024
+PREVIEW_CHARS = 80
+PAYLOAD_STORE_BYTES = 8 * 1024 * 1024
+
+KINDS = {
+    "text": "msg",
+    "tool_call": "call",
+    "function_call": "call",
+    "tool_response": "result",
+    "function_response": "result",
+    "group_chat_run_chat": "turn",
+    "executed_function": "exec",
+    "termination": "end",
+    "print": "log",
+    "run_completion": "done",
+    "stream_chunk": "chunk",
+}
+
+
+def dumps(frame):
+    return json.dumps(frame, separators=(",", ":"), default=str)
+
+
+class PayloadStore:
+    """Large event bodies kept for on-demand fetches, evicting the oldest past `max_bytes`."""
+
+    def __init__(self, max_bytes=PAYLOAD_STORE_BYTES):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._items = OrderedDict()
+
+    def put(self, ref, text):
+        self._items[ref] = text
+        self.size += len(text)
+        while self.size > self.max_bytes and self._items:
+            _, evicted = self._items.popitem(last=False)
+            self.size -= len(evicted)
+
+    def get(self, ref):
+        return self._items.get(ref)
+
+
+class FlowEventEncoder:
+    """Turns ag2 events into compact flow events and writes them with `write(frame)`.
+
+    `write` takes the frame dict, e.g. a session's FrameWriter (app/core/framing.py), which
+    serializes and batches them.
+    """
+
+    def __init__(self, write, inline_limit=INLINE_PAYLOAD_BYTES, layout=None):
+        self._write_frame = write
+        self.inline_limit = inline_limit
+        self.payloads = PayloadStore()
+        self.graph = FlowGraph()
+        self.layout = layout
+        self.seq = 0
+        self.frames_out = 0
+        self._lock = threading.Lock()
+
+    def send(self, event):
+        """Encode and send one event, either a BaseEvent or its `model_dump(mode="json")` dict."""
+        data = event if isinstance(event, dict) else event.model_dump(mode="json")
+        with self._lock:
+            for frame in self.encode(data):
+                self._write(frame)
+
+    def send_payload(self, ref):
+        with self._lock:
+            text = self.payloads.get(ref)
+            frame = {"k": "payload", "p": ref}
+            if text is None:
+                frame["e"] = "expired"
+            else:
+                frame["x"] = text
+            self._write(frame)
+
+    def send_graph(self):
+        with self._lock:
+            frames = self.graph.snapshot()
+            if self.layout is not None:
+                frames += [{"k": "pos", "i": i, "x": round(float(x), 3), "y": round(float(y), 3)}
+                           for i, (x, y) in self.layout.positions.items()]
+            for frame in frames:
+                self._write(frame)
+
+    def _write(self, frame):
+        self._write_frame(frame)
+        self.frames_out += 1
+
+    def encode(self, data):
+        """Return the frames for one event: node additions, the event, then edge deltas."""
+        frames = []
+        kind_type = data.get("type", "")
+        content = data.get("content")
+        content = content if isinstance(content, dict) else {"content": content}
+
+        self.seq += 1
+        frame = {"s": self.seq, "k": KINDS.get(kind_type, kind_type)}
+
+        sender = content.get("sender") or content.get("speaker")
+        recipient = content.get("recipient")
+        if sender:
+            frame["f"] = self._node_id(sender, frames)
+        if recipient:
+            frame["t"] = self._node_id(recipient, frames)
+
+        if kind_type == "stream_chunk":
+            frame["m"] = content.get("message_id")
+            if content.get("end"):
+                frame["e"] = 1
+        self._attach_text(frame, self._text(kind_type, content))
+        deltas = self.graph.apply(kind_type, content, frame.get("f"), frame.get("t"))
+        # tool nodes are only known once the graph has seen the call, keep them ahead of the event
+        frames += [delta for delta in deltas if delta["k"] == "node"]
+        frames.append(frame)
+        frames += [delta for delta in deltas if delta["k"] != "node"]
+        if self.layout is not None and self._topology_changed(frames):
+            frames += self.layout.update(self.graph)
+        return frames
+
+    @staticmethod
+    def _topology_changed(frames):
+        # positions only depend on which nodes and edges exist, not on edge counts
+        return any(f["k"] == "node" or (f["k"] == "edge" and f["w"] == 1) for f in frames)
+
+    def _node_id(self, name, frames):
+        node_id, delta = self.graph.node(name)
+        if delta is not None:
+            frames.append(delta)
+        return node_id
+
+    def _text(self, kind_type, content):
+        if kind_type in ("tool_call", "function_call"):
+            calls = content.get("tool_calls") or [{"function": content.get("function_call") or {}}]
+            return "\n".join(
+                f"{call['function'].get('name')}({call['function'].get('arguments') or ''})" for call in calls
+            )
+        if kind_type == "executed_function":
+            return f"{content.get('func_name')}: {content.get('content')}"
+        if kind_type == "termination":
+            return content.get("termination_reason")
+        if kind_type == "print":
+            return content.get("sep", " ").join(content.get("objects", []))
+        if kind_type == "group_chat_run_chat":
+            return None
+        body = content.get("content")
+        if body is None or isinstance(body, str):
+            return body
+        return dumps(body)
+
+    def _attach_text(self, frame, text):
+        if not text:
+            return
+        if len(text.encode("utf-8")) <= self.inline_limit:
+            frame["x"] = text
+            return
+        ref = frame["s"]
+        self.payloads.put(ref, text)
+        frame["p"] = ref
+        frame["n"] = len(text)
+        frame["v"] = text[:PREVIEW_CHARS]
@@ -0,0 +1,75 @@
+import time
+
+# Incremental flow graph
+# Kept per session next to the flow event encoder. Every event updates the node index and
+# the deduplicated edge counts in O(1) and returns only what changed, so the client applies
+# deltas instead of rebuilding nodes and edges from the whole message list.
+#
+#   {"k": "node", "i": 4, "x": "classify_query", "y": "tool"}     node added
+#   {"k": "edge", "a": 1, "b": 4, "w": 3}                         edge a -> b now seen w times
+#
+# Edges follow the visualizer's reading of a run: message sender -> recipient, agent -> tool
+# for tool calls, tool -> agent for executed tools, and previous speaker -> next speaker for
+# group chat turns.
+
+TOOL_PREFIX = "tool:"
+
+
+class FlowGraph:
+    def __init__(self):
+        self.nodes = {}
+        self.edges = {}
+        self.last_speaker = None
+        self.updated_at = None
+
+    def node(self, name, node_type="agent"):
+        """Return the node id for `name` and the node-added delta, or None if it already exists."""
+        now = time.time()
+        node = self.nodes.get(name)
+        if node is not None:
+            node["t"] = now
+            return node["i"], None
+        node = self.nodes[name] = {"i": len(self.nodes) + 1, "x": name, "y": node_type, "t": now}
+        return node["i"], {"k": "node", "i": node["i"], "x": name, "y": node_type}
+
+    def edge(self, a, b):
+        now = time.time()
+        edge = self.edges.get((a, b))
+        if edge is None:
+            edge = self.edges[(a, b)] = {"w": 0, "t": now}
+        edge["w"] += 1
+        edge["t"] = now
+        self.updated_at = now
+        return {"k": "edge", "a": a, "b": b, "w": edge["w"]}
+
+    def apply(self, kind_type, content, sender_id=None, recipient_id=None):
+        """Update the graph for one event and return its deltas (node additions first)."""
+        deltas = []
+
+        def add_node(name, node_type="agent"):
+            node_id, delta = self.node(name, node_type)
+            if delta is not None:
+                deltas.append(delta)
+            return node_id
+
+        if kind_type == "group_chat_run_chat" and sender_id is not None:
+            if self.last_speaker is not None and self.last_speaker != sender_id:
+                deltas.append(self.edge(self.last_speaker, sender_id))
+            self.last_speaker = sender_id
+        elif kind_type in ("tool_call", "function_call") and sender_id is not None:
+            calls = content.get("tool_calls") or [{"function": content.get("function_call") or {}}]
+            for call in calls:
+                tool_id = add_node(TOOL_PREFIX + str(call["function"].get("name")), "tool")
+                deltas.append(self.edge(sender_id, tool_id))
+        elif kind_type == "executed_function" and recipient_id is not None:
+            tool_id = add_node(TOOL_PREFIX + str(content.get("func_name")), "tool")
+            deltas.append(self.edge(tool_id, recipient_id))
+        elif sender_id is not None and recipient_id is not None:
+            deltas.append(self.edge(sender_id, recipient_id))
+        return deltas
+
+    def snapshot(self):
+        """All nodes and edges as deltas, for a client that joins mid-run."""
+        frames = [{"k": "node", "i": n["i"], "x": n["x"], "y": n["y"]} for n in self.nodes.values()]
+        frames += [{"k": "edge", "a": a, "b": b, "w": e["w"]} for (a, b), e in self.edges.items()]
+        return frames
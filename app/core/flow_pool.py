@@ -0,0 +1,103 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+# Warm pool of pre-built group chat patterns
+# Building a flow means constructing every agent (and its OpenAI client), registering tools
+# and wiring handoffs. ag2 patterns are single use: prepare_group_chat re-registers hooks and
+# handoff functions on the agents on every run. So instead of copying one template we keep
+# a few ready-made instances per flow and rebuild replacements in the background, off the
+# session's critical path. Each instance has its own ContextVariables and empty histories.
+
+
+class FlowTemplate:
+    def __init__(self, name, build, size=2):
+        self.name = name
+        self.build = build
+        self.size = size
+        self._ready = deque()
+        self._building = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.builds = 0
+        self.build_seconds = 0.0
+        self.setup_seconds = 0.0
+
+    def stats(self):
+        with self._lock:
+            acquired = self.hits + self.misses
+            return {
+                "ready": len(self._ready),
+                "building": self._building,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / acquired if acquired else None,
+                "avg_build_ms": 1000 * self.build_seconds / self.builds if self.builds else None,
+                "avg_setup_ms": 1000 * self.setup_seconds / acquired if acquired else None,
+            }
+
+
+class FlowPool:
+    def __init__(self, builder_threads=1):
+        self._templates = {}
+        self._builder = ThreadPoolExecutor(max_workers=builder_threads, thread_name_prefix="flow-build")
+
+    def register(self, name, build, size=2):
+        """Register `build() -> pattern` under `name`, keeping `size` instances ready."""
+        self._templates[name] = FlowTemplate(name, build, size)
+
+    def __contains__(self, name):
+        return name in self._templates
+
+    def warm(self, *names):
+        """Start filling the pool for the given flows (all registered flows by default)."""
+        for name in names or list(self._templates):
+            self._refill(self._templates[name])
+
+    def acquire(self, name):
+        """Take a ready pattern for a new run, building one inline if the pool is empty."""
+        template = self._templates[name]
+        started = time.perf_counter()
+        with template._lock:
+            pattern = template._ready.popleft() if template._ready else None
+            if pattern is None:
+                template.misses += 1
+            else:
+                template.hits += 1
+        if pattern is None:
+            pattern = self._build(template)
+        with template._lock:
+            template.setup_seconds += time.perf_counter() - started
+        self._refill(template)
+        return pattern
+
+    def _build(self, template):
+        started = time.perf_counter()
+        pattern = template.build()
+        with template._lock:
+            template.builds += 1
+            template.build_seconds += time.perf_counter() - started
+        return pattern
+
+    def _refill(self, template):
+        with template._lock:
+            missing = template.size - len(template._ready) - template._building
+            template._building += max(0, missing)
+        for _ in range(missing):
+            self._builder.submit(self._build_ready, template)
+
+    def _build_ready(self, template):
+        try:
+            pattern = self._build(template)
+            with template._lock:
+                template._ready.append(pattern)
+        except Exception as e:
+            print(f" - flow pool: failed to build {template.name}: {e}", flush=True)
+        finally:
+            with template._lock:
+                template._building -= 1
+
+    def stats(self):
+        return {name: template.stats() for name, template in self._templates.items()}
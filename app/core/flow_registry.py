@@ -0,0 +1,79 @@
+import importlib
+import threading
+import time
+from types import SimpleNamespace
+
+# Named flows, imported on first use
+# Every flow module pulls in autogen's agentchat and group packages (and through them openai),
+# which is most of the server's startup time. The registry only knows each flow as a module
+# path plus the names of the functions and constants the server needs from it:
+#
+#   run       runs the flow, e.g. tech_support_group(llm_config, initial_msg, pattern=...)
+#   build     builds a fresh pattern for the warm flow pool
+#   levels    LAYOUT_LEVELS for the server-side graph layout
+#   branches  RESEARCH_BRANCHES style hierarchy for history compaction
+#
+# load(name) imports the module the first time and returns those attributes; warm(*names)
+# does the same ahead of time, e.g. from the FastAPI lifespan.
+
+
+class FlowRegistry:
+    def __init__(self):
+        self._flows = {}
+        self._loaded = {}
+        self._import_seconds = {}
+        self._lock = threading.Lock()
+
+    def register(self, name, module, **attributes):
+        """Register flow `name`, found in `module`; `attributes` maps a role to a name in it."""
+        self._flows[name] = (module, attributes)
+
+    def __contains__(self, name):
+        return name in self._flows
+
+    def names(self):
+        return list(self._flows)
+
+    def load(self, name):
+        loaded = self._loaded.get(name)
+        if loaded is not None:
+            return loaded
+        module_name, attributes = self._flows[name]
+        # imports hold their own lock, so two sessions loading the same flow just wait on each other
+        started = time.perf_counter()
+        module = importlib.import_module(module_name)
+        loaded = SimpleNamespace(name=name, module=module_name,
+                                 **{role: getattr(module, attr) for role, attr in attributes.items()})
+        with self._lock:
+            self._import_seconds.setdefault(name, time.perf_counter() - started)
+            return self._loaded.setdefault(name, loaded)
+
+    def warm(self, *names):
+        """Import the given flows now (all registered flows by default)."""
+        for name in names or self.names():
+            self.load(name)
+
+    def stats(self):
+        with self._lock:
+            return {
+                name: {
+                    "module": module,
+                    "loaded": name in self._loaded,
+                    "import_ms": round(1000 * self._import_seconds[name], 1) if name in self._import_seconds else None,
+                }
+                for name, (module, _) in self._flows.items()
+            }
+
+
+flows = FlowRegistry()
+flows.register("agent_manager", "app.agents.agent_manager", run="run_agent")
+flows.register("financial", "app.agents.financial_group", run="run_group")
+flows.register("weather", "app.agents.weather_agents", run="run_weather_agents")
+flows.register(
+    "tech_support", "app.agents.tech_support_group",
+    run="tech_support_group", build="build_tech_support_group", levels="LAYOUT_LEVELS",
+)
+flows.register(
+    "research", "app.agents.heirerarchical_research",
+    run="research_group", build="build_research_group", levels="LAYOUT_LEVELS", branches="RESEARCH_BRANCHES",
+)
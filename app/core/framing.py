@@ -0,0 +1,172 @@
+import json
+import threading
+import time
+
+try:
+    import msgpack
+except ImportError:  # binary framing is optional
+    msgpack = None
+
+# Output framing
+# Everything a session sends (raw ag2 events, or flow frames from app/core/flow_events.py) goes
+# out through one FrameWriter, chosen by the client's hello:
+#
+#   {"op": "hello", "format": "flow", "batch": true, "encoding": "msgpack"}
+#
+#   batch     events are buffered and written as one frame, an array of events, once
+#             `max_bytes` are pending or the oldest has waited `max_delay` seconds. Without
+#             it every event is its own frame, as before.
+#   encoding  "json" sends text frames; "msgpack" sends binary frames and needs the msgpack
+#             package. In msgpack, agent names in raw events are interned: the first time a
+#             name is seen the writer sends {"type": "name", "content": {"i": 3, "x": "tech_agent"}}
+#             and from then on the sender, recipient and speaker fields carry the 3.
+#             Flow frames already use node ids for agents.
+#
+# Compression is negotiated by the websocket server itself (permessage-deflate, see
+# WS_COMPRESSION); batching also helps it, since one larger frame compresses better than
+# many tiny ones. Human input prompts stay plain text frames; the batch is flushed before
+# them so the client sees everything that came before the question.
+
+BATCH_DELAY_SECONDS = 0.02
+BATCH_BYTES = 16 * 1024
+INTERNED_FIELDS = ("sender", "recipient", "speaker")
+
+
+class DelayedFlusher:
+    """One thread that flushes writers whose oldest pending event has waited long enough."""
+
+    def __init__(self):
+        self._due = {}
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def schedule(self, writer, deadline):
+        with self._cond:
+            if writer in self._due:
+                return
+            self._due[writer] = deadline
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="frame-flusher", daemon=True)
+                self._thread.start()
+            self._cond.notify()
+
+    def cancel(self, writer):
+        with self._cond:
+            self._due.pop(writer, None)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                now = time.monotonic()
+                # a NaN deadline counts as due, an infinite one waits in bounded steps,
+                # so one writer's bad max_delay cannot spin or kill the thread
+                due = [writer for writer, deadline in self._due.items() if not deadline > now]
+                for writer in due:
+                    del self._due[writer]
+                if not due:
+                    self._cond.wait(min(min(self._due.values()) - now, threading.TIMEOUT_MAX) if self._due else None)
+                    continue
+            for writer in due:
+                try:
+                    writer.flush()
+                except Exception as e:
+                    print(f" - frame flusher: {e}", flush=True)
+
+
+flusher = DelayedFlusher()
+
+
+class FrameWriter:
+    def __init__(self, websocket, encoding="json", batch=False, max_delay=BATCH_DELAY_SECONDS, max_bytes=BATCH_BYTES):
+        if encoding not in ("json", "msgpack"):
+            raise ValueError(f"Unknown encoding {encoding!r}")
+        if encoding == "msgpack" and msgpack is None:
+            raise ValueError("The msgpack encoding needs the msgpack package")
+        self.websocket = websocket
+        self.encoding = encoding
+        self.batch = batch
+        self.max_delay = max_delay
+        self.max_bytes = max_bytes
+        self.names = {}
+        self._pending = []
+        self._pending_bytes = 0
+        self._lock = threading.Lock()
+        self.events_out = 0
+        self.frames_out = 0
+        self.bytes_out = 0
+
+    def write(self, item):
+        """Send one event or flow frame (a dict), now or with the next batch."""
+        with self._lock:
+            for item in self._intern(item):
+                data = self._pack(item)
+                self.events_out += 1
+                if not self.batch:
+                    self._send(data)
+                    continue
+                self._pending.append(data)
+                self._pending_bytes += len(data)
+                if self._pending_bytes >= self.max_bytes:
+                    self._flush()
+                elif len(self._pending) == 1:
+                    flusher.schedule(self, time.monotonic() + self.max_delay)
+
+    def write_text(self, text):
+        """Send a plain text frame (a human input prompt) after everything pending."""
+        with self._lock:
+            self._flush()
+            self._send(text)
+
+    def flush(self):
+        with self._lock:
+            self._flush()
+
+    def _flush(self):
+        if not self._pending:
+            return
+        flusher.cancel(self)
+        if self.encoding == "msgpack":
+            packer = msgpack.Packer()
+            data = packer.pack_array_header(len(self._pending)) + b"".join(self._pending)
+        else:
+            data = "[" + ",".join(self._pending) + "]"
+        self._pending, self._pending_bytes = [], 0
+        self._send(data)
+
+    def _send(self, data):
+        self.websocket.send(data)
+        self.frames_out += 1
+        self.bytes_out += len(data)
+
+    def _pack(self, item):
+        if self.encoding == "msgpack":
+            return msgpack.packb(item, default=str)
+        return json.dumps(item, separators=(",", ":"), default=str)
+
+    def _intern(self, item):
+        # only raw events in msgpack; flow frames ("k") already refer to agents by node id
+        content = item.get("content")
+        if self.encoding != "msgpack" or "k" in item or not isinstance(content, dict):
+            return [item]
+        declared = []
+        content = dict(content)
+        for field in INTERNED_FIELDS:
+            name = content.get(field)
+            if not isinstance(name, str):
+                continue
+            if name not in self.names:
+                self.names[name] = len(self.names) + 1
+                declared.append({"type": "name", "content": {"i": self.names[name], "x": name}})
+            content[field] = self.names[name]
+        return declared + [dict(item, content=content)]
+
+    def stats(self):
+        with self._lock:
+            return {
+                "encoding": self.encoding,
+                "batch": self.batch,
+                "events": self.events_out,
+                "frames": self.frames_out,
+                "bytes": self.bytes_out,
+                "events_per_frame": self.events_out / self.frames_out if self.frames_out else None,
+            }
@@ -0,0 +1,208 @@
+import json
+import threading
+
+# History compaction
+# Every agent turn in a group chat resends the whole conversation, so prompt size grows with
+# every round. These transforms shorten the history an agent sees right before it replies
+# (ag2's process_all_messages_before_reply hook); the chat history itself is never changed.
+#
+#   HideSenders       drops messages from agents this agent has no business reading
+#                     (another branch's specialists)
+#   SummarizeOlder    keeps the first message and the last `keep_recent` turns verbatim and
+#                     replaces the turns in between with one summary message
+#   SlidingWindow     hard cap: the first message plus the most recent turns that fit
+#
+# They work on turns rather than messages: an assistant message with tool calls and the tool
+# responses that follow it stay together, since the API rejects a response without its call.
+# The first message (the task), the latest turn (what the agent and its handoff tools are
+# answering) and the agent's own tool calls (what it already did, e.g. initiate_research)
+# are always kept. The transforms follow ag2's MessageTransform protocol, so they
+# also plug into autogen's TransformMessages.
+
+
+def prompt_tokens(messages):
+    """Rough prompt size, about four characters of JSON per token."""
+    return sum(len(json.dumps(message, default=str)) for message in messages) // 4
+
+
+def split_turns(messages):
+    turns = []
+    for message in messages:
+        if message.get("role") == "tool" and turns and turns[-1][0].get("tool_calls"):
+            turns[-1].append(message)
+        else:
+            turns.append([message])
+    return turns
+
+
+def join_turns(turns):
+    return [message for turn in turns for message in turn]
+
+
+SUMMARY_NAME = "history_summary"
+
+
+def is_own_call(turn, names):
+    # in an agent's own history its tool calls carry no name, other agents' calls do
+    return bool(names) and bool(turn[0].get("tool_calls")) and turn[0].get("name") in (*names, None)
+
+
+def describe(message, limit=160):
+    # one line per message for the summary
+    name = message.get("name") or message.get("role", "")
+    if message.get("tool_calls"):
+        calls = ", ".join(call["function"]["name"] for call in message["tool_calls"])
+        return f"{name} called {calls}"
+    text = message.get("content")
+    if not isinstance(text, str):
+        text = json.dumps(text, default=str)
+    text = " ".join(text.split())
+    if len(text) > limit:
+        text = text[:limit].rstrip() + "..."
+    return f"{name}: {text}"
+
+
+class HideSenders:
+    def __init__(self, names):
+        self.names = set(names)
+
+    def apply_transform(self, messages):
+        turns = split_turns(messages)
+        kept = [turn for i, turn in enumerate(turns) if i in (0, len(turns) - 1) or turn[0].get("name") not in self.names]
+        return join_turns(kept)
+
+    def get_logs(self, pre_transform_messages, post_transform_messages):
+        removed = len(pre_transform_messages) - len(post_transform_messages)
+        return f"Hid {removed} messages from other branches.", removed > 0
+
+
+class SummarizeOlder:
+    def __init__(self, keep_recent=8, summarize=None, keep_names=()):
+        # the latest turn is what the agent is answering, it is never summarized
+        if keep_recent < 1:
+            raise ValueError(f"keep_recent must be at least 1, got {keep_recent}")
+        self.keep_recent = keep_recent
+        self.keep_names = set(keep_names)
+        # summarize(messages) -> str; the default lists who said what, one short line each
+        self.summarize = summarize or (lambda messages: "\n".join(f"- {describe(m)}" for m in messages))
+
+    def apply_transform(self, messages):
+        turns = split_turns(messages)
+        if len(turns) <= self.keep_recent + 2:
+            return messages
+        middle = turns[1:-self.keep_recent]
+        own = [turn for turn in middle if is_own_call(turn, self.keep_names)]
+        older = join_turns([turn for turn in middle if not is_own_call(turn, self.keep_names)])
+        summary = {"role": "user", "name": SUMMARY_NAME, "content": f"Earlier in this conversation:\n{self.summarize(older)}"}
+        return join_turns([turns[0], [summary], *own, *turns[-self.keep_recent:]])
+
+    def get_logs(self, pre_transform_messages, post_transform_messages):
+        removed = len(pre_transform_messages) - len(post_transform_messages)
+        return f"Summarized {removed + 1} older messages.", removed > 0
+
+
+class SlidingWindow:
+    def __init__(self, max_messages=24, keep_names=()):
+        self.max_messages = max_messages
+        self.keep_names = set(keep_names)
+
+    def apply_transform(self, messages):
+        if len(messages) <= self.max_messages:
+            return messages
+        turns = split_turns(messages)
+        last = len(turns) - 1
+        # the task, the summary and the agent's own calls are pinned, the rest fills up from the end
+        kept = {i for i, turn in enumerate(turns)
+                if i == 0 or turn[0].get("name") == SUMMARY_NAME or is_own_call(turn, self.keep_names)}
+        size = sum(len(turns[i]) for i in kept)
+        for i in range(last, 0, -1):
+            if i in kept:
+                continue
+            # the latest turn always stays, even when it alone is over the limit
+            if i != last and size + len(turns[i]) > self.max_messages:
+                break
+            kept.add(i)
+            size += len(turns[i])
+        return join_turns([turns[i] for i in sorted(kept)])
+
+    def get_logs(self, pre_transform_messages, post_transform_messages):
+        removed = len(pre_transform_messages) - len(post_transform_messages)
+        return f"Dropped {removed} messages outside the window.", removed > 0
+
+
+class CompactionStats:
+    """Prompt tokens before and after compaction, per flow and agent."""
+
+    def __init__(self):
+        self._agents = {}
+        self._lock = threading.Lock()
+
+    def record(self, flow, agent, before, after):
+        with self._lock:
+            counters = self._agents.setdefault((flow, agent), {"turns": 0, "before": 0, "after": 0, "last_saved": 0})
+            counters["turns"] += 1
+            counters["before"] += before
+            counters["after"] += after
+            counters["last_saved"] = before - after
+
+    def stats(self):
+        with self._lock:
+            flows = {}
+            for (flow, agent), counters in self._agents.items():
+                flows.setdefault(flow, {})[agent] = {
+                    "turns": counters["turns"],
+                    "prompt_tokens_before": counters["before"],
+                    "prompt_tokens_after": counters["after"],
+                    "saved_per_turn": (counters["before"] - counters["after"]) / counters["turns"],
+                    "last_turn_saved": counters["last_saved"],
+                }
+            return flows
+
+
+class HistoryCompactor:
+    """Applies `transforms` to the history an agent sees before each reply."""
+
+    def __init__(self, transforms, stats=None, flow=None):
+        self.transforms = transforms
+        self.stats = stats
+        self.flow = flow
+
+    def add_to_agent(self, agent):
+        def compact(messages):
+            if not messages:
+                return messages
+            # the system message is the agent's own prompt, only the conversation is compacted
+            head = messages[:1] if messages[0].get("role") == "system" else []
+            compacted = messages[len(head):]
+            for transform in self.transforms:
+                compacted = transform.apply_transform(compacted)
+            compacted = head + compacted
+            if self.stats is not None:
+                self.stats.record(self.flow, agent.name, prompt_tokens(messages), prompt_tokens(compacted))
+            return compacted
+
+        agent.register_hook(hookable_method="process_all_messages_before_reply", hook=compact)
+
+
+def compact_history(pattern, keep_recent=8, max_messages=24, branches=None, stats=None, flow=None):
+    """Compact the history of every LLM agent in `pattern`.
+
+    `branches` maps a lead agent to the agents under it (see RESEARCH_BRANCHES). Agents that
+    belong to a branch stop seeing the members of the other branches; everyone else stops
+    seeing all branch members, only their leads.
+    """
+    branches = branches or {}
+    members = {name for names in branches.values() for name in names}
+    for agent in pattern.agents:
+        if not getattr(agent, "llm_config", False):
+            continue
+        transforms = []
+        if members:
+            own = next((set(names) for lead, names in branches.items() if agent.name == lead or agent.name in names), set())
+            transforms.append(HideSenders(members - own))
+        transforms += [
+            SummarizeOlder(keep_recent, keep_names=[agent.name]),
+            SlidingWindow(max_messages, keep_names=[agent.name]),
+        ]
+        HistoryCompactor(transforms, stats=stats, flow=flow).add_to_agent(agent)
+    return pattern
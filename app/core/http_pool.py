@@ -0,0 +1,342 @@
+import contextlib
+import json
+import re
+import threading
+import time
+
+import httpcore
+import httpx
+
+from app.core.cancellation import RunCancelled, current_run
+from app.core.llm_scheduler import DEFAULT_COMPLETION_TOKENS
+
+# Shared HTTP pool for LLM calls
+# Every agent gets its own OpenAI client, and without an `http_client` in its config each of
+# those opens its own connection pool: with a few sessions running that is a TLS handshake per
+# agent and a pile of idle sockets. The llm_config entries carry this one httpx client instead
+# (LLMConfig.copy() copies the entries but keeps the client), so every agent of every session
+# reuses the same keep-alive connections.
+#
+#   max_connections    open connections across all hosts
+#   max_per_host       requests in flight per host; further ones wait for a slot
+#   max_keepalive      idle connections kept open, each for `keepalive_expiry` seconds
+#   timeouts           connect, read and write; `pool` is how long a request may wait for a
+#                      connection (slot and pool checkout) before httpx.PoolTimeout
+#
+# The transport counts requests, new and reused connections and the time spent waiting for a
+# connection, using httpcore's trace extension: the first traced step of a request is either
+# connecting (a new connection) or writing the request (a reused one).
+#
+# The sync OpenAI client stops reading a stream at "data: [DONE]" and closes it, and httpcore
+# drops an HTTP/1.1 connection whose body was not read to the end. Closing a response body
+# therefore first reads what is left of it, up to `DRAIN_BYTES`, so streamed completions give
+# their connection back to the pool too.
+#
+# With a scheduler (app/core/llm_scheduler.py) every POST first waits for its turn there, before
+# taking a connection slot. The response body is watched on its way to the client for the
+# usage the API reports, which settles the request's token estimate; a 429 pauses the
+# scheduler for the Retry-After the deployment asked for.
+#
+# With a router (app/core/llm_router.py) the completion requests, once the scheduler lets them
+# go, are sent to one of several deployments; each attempt takes its own host's slot. The
+# scheduler only sees a 429 when every deployment answered with one.
+#
+# Calls made for a run (app/core/cancellation.py) check its token before they are sent, and
+# every socket read and write registers the socket with the token, so cancelling the run shuts
+# the socket down under a call blocked on the model. The error that causes is raised as
+# RunCancelled, which the OpenAI client does not retry.
+
+MAX_CONNECTIONS = 100
+MAX_KEEPALIVE = 20
+KEEPALIVE_EXPIRY = 30.0
+DRAIN_BYTES = 64 * 1024
+# response bytes kept to find the reported usage in
+USAGE_BYTES = 256 * 1024
+TOTAL_TOKENS = re.compile(rb'"total_tokens"\s*:\s*(\d+)')
+
+
+def estimate_tokens(request):
+    """Rough token count of a completion request: its body / 4, plus the completion allowance."""
+    try:
+        body = request.content
+        data = json.loads(body)
+        completion = data.get("max_tokens") or data.get("max_completion_tokens") or DEFAULT_COMPLETION_TOKENS
+    except (httpx.RequestNotRead, ValueError, AttributeError):
+        return DEFAULT_COMPLETION_TOKENS
+    return len(body) // 4 + completion
+
+
+def retry_after(response, default=1.0):
+    # OpenAI and Azure send retry-after-ms, or retry-after in seconds
+    for header, scale in (("retry-after-ms", 0.001), ("retry-after", 1.0)):
+        try:
+            return float(response.headers[header]) * scale
+        except (KeyError, ValueError):
+            continue
+    return default
+
+
+class AbortableStream(httpcore.NetworkStream):
+    """Network stream whose blocking reads and writes a run's cancellation can interrupt."""
+
+    def __init__(self, stream):
+        self._stream = stream
+
+    def _io(self):
+        run = current_run.get()
+        return run.io(self._stream.get_extra_info("socket")) if run is not None else contextlib.nullcontext()
+
+    def read(self, max_bytes, timeout=None):
+        with self._io():
+            return self._stream.read(max_bytes, timeout)
+
+    def write(self, buffer, timeout=None):
+        with self._io():
+            return self._stream.write(buffer, timeout)
+
+    def close(self):
+        self._stream.close()
+
+    def start_tls(self, ssl_context, server_hostname=None, timeout=None):
+        return AbortableStream(self._stream.start_tls(ssl_context, server_hostname, timeout))
+
+    def get_extra_info(self, info):
+        return self._stream.get_extra_info(info)
+
+
+class AbortableBackend(httpcore.NetworkBackend):
+    def __init__(self, backend):
+        self._backend = backend
+
+    def connect_tcp(self, host, port, timeout=None, local_address=None, socket_options=None):
+        return AbortableStream(self._backend.connect_tcp(host, port, timeout, local_address, socket_options))
+
+    def connect_unix_socket(self, path, timeout=None, socket_options=None):
+        return AbortableStream(self._backend.connect_unix_socket(path, timeout, socket_options))
+
+    def sleep(self, seconds):
+        self._backend.sleep(seconds)
+
+
+def cancelled_error(error):
+    # the error a cancelled run's aborted call ended with, as RunCancelled
+    run = current_run.get()
+    if run is not None and run.cancelled:
+        return RunCancelled(run.reason)
+    return None
+
+
+class UsageMeter:
+    """Reads the usage of a completion off its response body and settles the scheduler ticket."""
+
+    def __init__(self, scheduler, ticket):
+        self.scheduler = scheduler
+        self.ticket = ticket
+        self._parts = []
+        self._size = 0
+
+    def feed(self, chunk):
+        if self._size < USAGE_BYTES:
+            self._parts.append(chunk)
+            self._size += len(chunk)
+
+    def close(self):
+        # the last total_tokens: streams only report usage in their final chunk
+        found = TOTAL_TOKENS.findall(b"".join(self._parts))
+        self.scheduler.settle(self.ticket, int(found[-1]) if found else self.ticket.tokens)
+
+
+class PooledStream(httpx.SyncByteStream):
+    """Response body that is drained on close and then gives its host slot back."""
+
+    def __init__(self, stream, release=None):
+        self._stream = stream
+        self._release = release
+        # a UsageMeter fed with the body, set by the transport once the call is settled
+        self.meter = None
+        self._done = False
+
+    def __iter__(self):
+        try:
+            for chunk in self._stream:
+                if self.meter is not None:
+                    self.meter.feed(chunk)
+                yield chunk
+        except httpx.HTTPError as e:
+            cancelled = cancelled_error(e)
+            if cancelled is not None:
+                raise cancelled from e
+            raise
+        self._done = True
+
+    def close(self):
+        try:
+            run = current_run.get()
+            if not self._done and not (run is not None and run.cancelled):
+                self._drain()
+            self._stream.close()
+        finally:
+            release, self._release = self._release, None
+            if release is not None:
+                release()
+            meter, self.meter = self.meter, None
+            if meter is not None:
+                meter.close()
+
+    def _drain(self):
+        drained = 0
+        try:
+            for chunk in self._stream:
+                if self.meter is not None:
+                    self.meter.feed(chunk)
+                drained += len(chunk)
+                if drained > DRAIN_BYTES:
+                    return
+        except httpx.HTTPError:
+            pass
+
+
+class PooledTransport(httpx.HTTPTransport):
+    def __init__(self, max_per_host=None, pool_timeout=None, scheduler=None, router=None, **kwargs):
+        super().__init__(**kwargs)
+        # set before the first connection is made, which takes the pool's backend
+        self._pool._network_backend = AbortableBackend(self._pool._network_backend)
+        self.max_per_host = max_per_host
+        self.pool_timeout = pool_timeout
+        self.scheduler = scheduler
+        self.router = router
+        self._slots = {}
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.new_connections = 0
+        self.reused_connections = 0
+        self.failed = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    def _slot(self, host):
+        if not self.max_per_host:
+            return None
+        with self._lock:
+            if host not in self._slots:
+                self._slots[host] = threading.BoundedSemaphore(self.max_per_host)
+            return self._slots[host]
+
+    def handle_request(self, request):
+        run = current_run.get()
+        if run is not None:
+            run.check()
+        ticket = None
+        if self.scheduler is not None and request.method == "POST":
+            ticket = self.scheduler.acquire(estimate_tokens(request))
+        try:
+            if self.router is not None and self.router.handles(request):
+                response = self.router.send(request, self._send)
+            else:
+                response = self._send(request)
+        except BaseException as e:
+            if ticket is not None:
+                self.scheduler.settle(ticket, 0)
+            cancelled = cancelled_error(e) if isinstance(e, Exception) else None
+            if cancelled is not None:
+                raise cancelled from e
+            raise
+        if ticket is not None:
+            if response.status_code == 429:
+                self.scheduler.throttled_for(retry_after(response))
+                self.scheduler.settle(ticket, 0)
+            else:
+                response.stream.meter = UsageMeter(self.scheduler, ticket)
+        return response
+
+    def _send(self, request):
+        # one request to one host, with its slot and connection metrics
+        started = time.perf_counter()
+        slot = self._slot(request.url.host)
+        if slot is not None and not slot.acquire(timeout=self.pool_timeout):
+            with self._lock:
+                self.failed += 1
+            raise httpx.PoolTimeout(f"No free connection slot for {request.url.host}", request=request)
+
+        checkout = {}
+        previous = request.extensions.get("trace")
+
+        def trace(event_name, info):
+            if "ready" not in checkout:
+                checkout["ready"] = time.perf_counter()
+                checkout["new"] = event_name.startswith("connection.")
+            if previous is not None:
+                previous(event_name, info)
+
+        request.extensions = {**request.extensions, "trace": trace}
+        try:
+            response = super().handle_request(request)
+        except BaseException:
+            if slot is not None:
+                slot.release()
+            with self._lock:
+                self.failed += 1
+            raise
+
+        waited = checkout.get("ready", started) - started
+        with self._lock:
+            self.requests += 1
+            if checkout.get("new"):
+                self.new_connections += 1
+            else:
+                self.reused_connections += 1
+            self.wait_seconds += waited
+            self.max_wait_seconds = max(self.max_wait_seconds, waited)
+        response.stream = PooledStream(response.stream, slot.release if slot is not None else None)
+        return response
+
+    def stats(self):
+        connections = list(self._pool.connections)
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "failed": self.failed,
+                "new_connections": self.new_connections,
+                "reused_connections": self.reused_connections,
+                "reuse_rate": self.reused_connections / self.requests if self.requests else None,
+                "wait_ms_total": round(self.wait_seconds * 1000, 3),
+                "wait_ms_avg": round(self.wait_seconds * 1000 / self.requests, 3) if self.requests else None,
+                "wait_ms_max": round(self.max_wait_seconds * 1000, 3),
+                "open_connections": len(connections),
+                "idle_connections": sum(1 for c in connections if c.is_idle()),
+            }
+
+
+class HTTPPool:
+    """The process-wide httpx client for LLM calls, with its transport's metrics."""
+
+    def __init__(self, max_connections=MAX_CONNECTIONS, max_keepalive=MAX_KEEPALIVE, keepalive_expiry=KEEPALIVE_EXPIRY,
+                 max_per_host=None, connect_timeout=10.0, read_timeout=120.0, write_timeout=30.0, pool_timeout=30.0,
+                 scheduler=None, router=None):
+        limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self.transport = PooledTransport(
+            max_per_host=max_per_host, pool_timeout=pool_timeout, scheduler=scheduler, router=router, limits=limits,
+        )
+        # the OpenAI client uses these timeouts as its own, since they differ from httpx's default
+        self.client = httpx.Client(
+            transport=self.transport,
+            timeout=httpx.Timeout(connect=connect_timeout, read=read_timeout, write=write_timeout, pool=pool_timeout),
+        )
+        self.limits = {
+            "max_connections": max_connections,
+            "max_keepalive": max_keepalive,
+            "keepalive_expiry": keepalive_expiry,
+            "max_per_host": max_per_host,
+        }
+
+    def stats(self):
+        return dict(self.transport.stats(), limits=self.limits)
+
+    def close(self):
+        self.client.close()
+        if self.transport.router is not None:
+            self.transport.router.close()
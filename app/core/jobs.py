@@ -0,0 +1,91 @@
+import threading
+import time
+import uuid
+
+from app.core.admission import AdmissionController
+
+# Background jobs for the HTTP API
+# A job runs a blocking agent function on a worker thread so the FastAPI event loop never
+# waits on an LLM. The function receives an `on_stage(stage, summary)` callback; every
+# stage it reports is recorded on the job and wakes anyone streaming the job.
+# Jobs go through an AdmissionController (app/core/admission.py), which may turn a new one
+# away with Busy instead of queueing it.
+
+
+class Job:
+    def __init__(self):
+        self.id = uuid.uuid4().hex
+        self.status = "queued"
+        self.stages = []
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.finished_at = None
+        self._changed = threading.Condition()
+
+    @property
+    def done(self):
+        return self.status in ("completed", "failed")
+
+    def _update(self, **fields):
+        with self._changed:
+            for name, value in fields.items():
+                setattr(self, name, value)
+            self._changed.notify_all()
+
+    def add_stage(self, stage, summary):
+        with self._changed:
+            self.stages.append({"stage": stage, "summary": summary, "finished_at": time.time()})
+            self._changed.notify_all()
+
+    def wait_for_change(self, seen_stages, timeout=None):
+        """Block until the job has more than `seen_stages` stages or is done."""
+        with self._changed:
+            self._changed.wait_for(lambda: len(self.stages) > seen_stages or self.done, timeout)
+
+    def to_dict(self):
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "stages": list(self.stages),
+            "result": self.result,
+            "error": self.error,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class JobManager:
+    def __init__(self, max_workers=4, keep_finished=1000, admission=None):
+        self.admission = admission or AdmissionController(max_workers, thread_name_prefix="job")
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self.keep_finished = keep_finished
+
+    def submit(self, fn, *args, flow=None, **kwargs):
+        """Start fn as a job, admitted as a run of `flow` (fn's name by default); raises Busy."""
+        job = Job()
+        self.admission.submit(flow or fn.__name__, self._run, job, fn, args, kwargs)
+        with self._lock:
+            self._jobs[job.id] = job
+            self._evict()
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _run(self, job, fn, args, kwargs):
+        job._update(status="running")
+        try:
+            result = fn(*args, on_stage=job.add_stage, **kwargs)
+            job._update(status="completed", result=result, finished_at=time.time())
+        except Exception as e:
+            print(f" - job {job.id}: Exception: {e}", flush=True)
+            job._update(status="failed", error=str(e), finished_at=time.time())
+
+    def _evict(self):
+        # drop the oldest finished jobs once more than `keep_finished` are held
+        finished = [job for job in self._jobs.values() if job.done]
+        for job in sorted(finished, key=lambda j: j.finished_at)[: max(0, len(finished) - self.keep_finished)]:
+            del self._jobs[job.id]
@@ -0,0 +1,135 @@
+import zlib
+
+import numpy as np
+
+# Server-side graph layout
+# Positions are computed here, once per topology change, instead of on the phone for every
+# render. Coordinates are normalised to [0, 1] so the client only scales them to its screen.
+#
+# "layered" puts each node on the row of its level in the agent hierarchy (executive ->
+# managers -> specialists, triage -> tech -> device specialists) and spreads the rows with a
+# force pass that only moves x. "force" is a plain 2D force-directed layout. Both start from
+# the previous positions, so nodes that already exist barely move when new ones arrive.
+
+MARGIN = 0.05
+
+
+def force_directed(pos, edges, weights=None, iterations=50, temperature=0.1, fixed_y=False, mobility=None, k=None):
+    """Fruchterman-Reingold with all pairwise forces computed as NumPy arrays.
+
+    `pos` is an (n, 2) float array, updated in place and returned. `edges` is an (m, 2) int
+    array of row indices into `pos`. `mobility` scales how far each node may move per step,
+    which lets an incremental pass settle new nodes while the old ones stay put.
+    """
+    n = len(pos)
+    if n < 2:
+        return pos
+    k = k or 0.5 * np.sqrt(1.0 / n)
+    weights = np.ones(len(edges)) if weights is None else np.asarray(weights, dtype=float)
+    mobility = np.ones(n) if mobility is None else mobility
+    cooling = (0.005 / temperature) ** (1.0 / max(iterations, 1)) if temperature > 0.005 else 1.0
+
+    for _ in range(iterations):
+        delta = pos[:, None, :] - pos[None, :, :]
+        dist2 = np.maximum(np.einsum("ijk,ijk->ij", delta, delta), 1e-6)
+        np.fill_diagonal(dist2, np.inf)
+        # repulsion k^2 / d between every pair
+        disp = np.einsum("ij,ijk->ik", k * k / dist2, delta)
+        # weak pull to the centre keeps small graphs off the borders
+        disp += (0.5 - pos) * (k * 2)
+
+        if len(edges):
+            d = pos[edges[:, 0]] - pos[edges[:, 1]]
+            # attraction d^2 / k along each edge, heavier edges pull harder
+            pull = (np.sqrt(np.einsum("ij,ij->i", d, d)) / k * np.log1p(weights))[:, None] * d
+            for axis in (0, 1):
+                disp[:, axis] -= np.bincount(edges[:, 0], pull[:, axis], minlength=n)
+                disp[:, axis] += np.bincount(edges[:, 1], pull[:, axis], minlength=n)
+
+        if fixed_y:
+            disp[:, 1] = 0
+        length = np.maximum(np.sqrt(np.einsum("ij,ij->i", disp, disp)), 1e-9)
+        step = np.minimum(length, temperature * mobility)
+        pos += disp * (step / length)[:, None]
+        np.clip(pos, MARGIN, 1 - MARGIN, out=pos)
+        temperature *= cooling
+    return pos
+
+
+def assign_levels(names, edges, hints):
+    """Level for every node: the flow's hint if it has one, else one below its first parent."""
+    levels = {i: hints[name] for i, name in enumerate(names) if name in hints}
+    if not levels and names:
+        levels[0] = 0
+    changed = True
+    while changed:
+        changed = False
+        for a, b in edges:
+            if a in levels and b not in levels:
+                levels[b] = levels[a] + 1
+                changed = True
+    return np.array([levels.get(i, 0) for i in range(len(names))], dtype=float)
+
+
+def _seed_position(node_id):
+    rng = np.random.default_rng(zlib.crc32(str(node_id).encode()))
+    return rng.uniform(0.3, 0.7, size=2)
+
+
+class LayoutEngine:
+    def __init__(self, mode="layered", levels=None, iterations=60, incremental_iterations=15, min_move=0.01):
+        self.mode = mode
+        self.levels = levels or {}
+        self.iterations = iterations
+        self.incremental_iterations = incremental_iterations
+        self.min_move = min_move
+        self.positions = {}
+
+    def update(self, graph):
+        """Lay out `graph` (a FlowGraph) and return pos frames for nodes that moved."""
+        nodes = sorted(graph.nodes.values(), key=lambda node: node["i"])
+        if not nodes:
+            return []
+        ids = [node["i"] for node in nodes]
+        index = {node_id: row for row, node_id in enumerate(ids)}
+        pairs = [(index[a], index[b]) for (a, b) in graph.edges if a != b]
+        edges = np.array(pairs, dtype=int).reshape(-1, 2)
+        weights = [graph.edges[(ids[a], ids[b])]["w"] for a, b in pairs]
+
+        known = np.array([node_id in self.positions for node_id in ids])
+        pos = np.empty((len(ids), 2))
+        for row, node_id in enumerate(ids):
+            pos[row] = self.positions[node_id] if known[row] else self._place_new(node_id, row, edges, ids)
+
+        if self.mode == "layered":
+            level = assign_levels([node["x"] for node in nodes], pairs, self.levels)
+            # row spacing comes from the flow's hierarchy so rows don't shift as deeper nodes arrive
+            depth = max(level.max(), max(self.levels.values(), default=0), 1)
+            pos[:, 1] = MARGIN + (1 - 2 * MARGIN) * level / depth
+            fixed_y = True
+        else:
+            fixed_y = False
+
+        if known.any():
+            # incremental pass: new nodes find their place, existing ones only drift
+            mobility = np.where(known, 0.1, 1.0)
+            force_directed(pos, edges, weights, self.incremental_iterations, 0.05, fixed_y, mobility)
+        else:
+            force_directed(pos, edges, weights, self.iterations, 0.1, fixed_y)
+
+        frames = []
+        for row, node_id in enumerate(ids):
+            old = self.positions.get(node_id)
+            if old is None or np.abs(pos[row] - old).max() >= self.min_move:
+                self.positions[node_id] = pos[row].copy()
+                frames.append({"k": "pos", "i": node_id, "x": round(float(pos[row, 0]), 3), "y": round(float(pos[row, 1]), 3)})
+        return frames
+
+    def _place_new(self, node_id, row, edges, ids):
+        # start a new node next to the neighbours that already have a position
+        neighbours = [ids[b if a == row else a] for a, b in edges if row in (a, b)]
+        placed = [self.positions[n] for n in neighbours if n in self.positions]
+        seed = _seed_position(node_id)
+        if not placed:
+            return seed
+        return np.mean(placed, axis=0) + (seed - 0.5) * 0.1
@@ -0,0 +1,155 @@
+import hashlib
+import json
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+import diskcache
+
+# LLM response cache
+# Support traffic repeats a lot: the same questions reach triage_agent and computer_agent with
+# the same histories. This cache sits in front of the OpenAI client through ag2's cache hook
+# (`agent.client_cache`, see AbstractCache), so a repeated request is answered without a call.
+#
+#   key     sha256 of model, messages, tools and temperature
+#   memory  LRU of pickled responses, bounded by `memory_bytes`
+#   disk    diskcache directory, bounded by `disk_bytes` (least recently used evicted first)
+#
+# Entries expire after `ttl` seconds in both tiers; a disk hit is copied back to memory with
+# its remaining lifetime. Each agent gets its own view with hit and miss counters, while all
+# views share the same tiers. Everything is safe to use from many sessions at once.
+
+KEY_FIELDS = ("model", "messages", "tools", "temperature")
+MEMORY_BYTES = 32 * 1024 * 1024
+DISK_BYTES = 1024 * 1024 * 1024
+TTL_SECONDS = 24 * 3600
+
+
+def cache_key(key):
+    # ag2 hands over the full create params from get_key(), as a JSON string or (newer
+    # releases) a dict; only the fields that decide the reply count
+    if isinstance(key, str):
+        try:
+            key = json.loads(key)
+        except ValueError:
+            pass
+    if isinstance(key, dict):
+        key = {field: key.get(field) for field in KEY_FIELDS}
+    data = json.dumps(key, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    def __init__(self, directory=None, memory_bytes=MEMORY_BYTES, disk_bytes=DISK_BYTES, ttl=TTL_SECONDS):
+        self.memory_bytes = memory_bytes
+        self.ttl = ttl
+        self._memory = OrderedDict()
+        self._memory_size = 0
+        self._lock = threading.Lock()
+        self._disk = None
+        if directory:
+            self._disk = diskcache.Cache(directory, size_limit=disk_bytes, eviction_policy="least-recently-used")
+        self._counters = {}
+
+    def for_agent(self, name):
+        return AgentResponseCache(self, name)
+
+    def attach(self, agents):
+        """Point every LLM agent in `agents` at its own view of this cache."""
+        for agent in agents:
+            if agent is not None and getattr(agent, "llm_config", False):
+                agent.client_cache = self.for_agent(agent.name)
+
+    def get(self, key, default=None, agent=None):
+        digest = cache_key(key)
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(digest)
+            if entry is not None and entry[0] <= now:
+                self._drop(digest)
+                entry = None
+            if entry is not None:
+                self._memory.move_to_end(digest)
+                self._count(agent, "memory_hits")
+                return pickle.loads(entry[1])
+
+        if self._disk is not None:
+            data, expires = self._disk.get(digest, expire_time=True)
+            if data is not None:
+                with self._lock:
+                    self._remember(digest, data, expires or now + self.ttl)
+                    self._count(agent, "disk_hits")
+                return pickle.loads(data)
+
+        with self._lock:
+            self._count(agent, "misses")
+        return default
+
+    def set(self, key, value, agent=None):
+        digest = cache_key(key)
+        # pickled right away, the client keeps changing the response object afterwards
+        data = pickle.dumps(value)
+        with self._lock:
+            self._remember(digest, data, time.time() + self.ttl)
+        if self._disk is not None:
+            self._disk.set(digest, data, expire=self.ttl)
+
+    def _remember(self, digest, data, expires):
+        if len(data) > self.memory_bytes:
+            return
+        self._drop(digest)
+        self._memory[digest] = (expires, data)
+        self._memory_size += len(data)
+        while self._memory_size > self.memory_bytes:
+            self._drop(next(iter(self._memory)))
+
+    def _drop(self, digest):
+        entry = self._memory.pop(digest, None)
+        if entry is not None:
+            self._memory_size -= len(entry[1])
+
+    def _count(self, agent, counter):
+        counters = self._counters.setdefault(agent, {"memory_hits": 0, "disk_hits": 0, "misses": 0})
+        counters[counter] += 1
+
+    def stats(self):
+        with self._lock:
+            agents = {}
+            for agent, counters in self._counters.items():
+                lookups = sum(counters.values())
+                hits = counters["memory_hits"] + counters["disk_hits"]
+                agents[agent] = dict(counters, hit_rate=hits / lookups if lookups else None)
+            memory = {"items": len(self._memory), "bytes": self._memory_size, "max_bytes": self.memory_bytes}
+        disk = None
+        if self._disk is not None:
+            disk = {"items": len(self._disk), "bytes": self._disk.volume(), "max_bytes": self._disk.size_limit}
+        return {"ttl": self.ttl, "memory": memory, "disk": disk, "agents": agents}
+
+    def close(self):
+        if self._disk is not None:
+            self._disk.close()
+
+
+class AgentResponseCache:
+    """One agent's view of a ResponseCache, in the shape ag2 expects for `client_cache`."""
+
+    def __init__(self, cache, agent):
+        self.cache = cache
+        self.agent = agent
+
+    def get(self, key, default=None):
+        return self.cache.get(key, default, agent=self.agent)
+
+    def set(self, key, value):
+        self.cache.set(key, value, agent=self.agent)
+
+    def close(self):
+        # the tiers are shared by every session, they stay open
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
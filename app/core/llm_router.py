@@ -0,0 +1,289 @@
+import json
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextvars import copy_context
+
+import httpx
+
+# LLM deployment router
+# With more than one deployment of the model (Azure resources in several regions, a mock per
+# latency profile, ...) the shared HTTP pool's transport (app/core/http_pool.py) hands every
+# completion request to this router, which sends it to one of them. The llm_config entries keep
+# pointing at `origin`; the router swaps that prefix of the URL for the chosen deployment's base
+# URL (and its key), so the OpenAI clients and agents do not know there is more than one.
+#
+#   latency        EWMA of the time to the response headers per deployment (to the first token
+#                  for streams). The fastest one gets the calls; the deployments serve many at
+#                  once, so the load on one only counts through the latency it causes (calls
+#                  waiting on it only break ties). One without an estimate, or not used for
+#                  STALE_SECONDS, is tried first, so it gets probed rather than judged forever
+#                  on an old estimate
+#   error rate     EWMA of failures (connection errors, timeouts, 429 and 5xx); scores are
+#                  divided by 1 - error rate
+#   circuit        `breaker_failures` failures in a row (or a 429) open a deployment's circuit:
+#                  it gets no calls for `breaker_seconds` (the Retry-After for a 429), then one
+#                  probe call; a failed probe opens it again for twice as long
+#   failover       a failed attempt is retried at once on the next best deployment, each one
+#                  at most once per call; the last failure goes back to the client as it was
+#   hedging        with `hedge_after` set, a call with no response headers after that many
+#                  seconds is also sent to the next best deployment and the first good
+#                  response wins (the other is closed when it arrives). At most `hedge_budget`
+#                  of all calls are hedged, since each hedge is a second billed request
+#
+# Other 4xx responses are the request's fault, not the deployment's, and are returned as they
+# are. When every circuit is open the call goes to the one that closes first.
+
+EWMA_ALPHA = 0.2
+STALE_SECONDS = 30.0
+BREAKER_MAX_SECONDS = 300.0
+HEDGE_THREADS = 64
+
+
+def _close_late(future):
+    response = future.result()[0]
+    if response is not None:
+        response.close()
+
+
+class Deployment:
+    def __init__(self, name, base_url, api_key=None):
+        self.name = name
+        self.base_url = base_url.rstrip("/")
+        self.api_key = api_key
+        self.latency = None
+        self.error_rate = 0.0
+        self.waiting = 0
+        self.last_used = 0.0
+        # consecutive failures; open_until is 0 while the circuit is closed
+        self.failures = 0
+        self.open_until = 0.0
+        self.open_seconds = 0.0
+        self.probing = False
+        self.requests = 0
+        self.errors = 0
+        self.opened = 0
+        self.hedges_won = 0
+
+    def state(self, now):
+        if not self.open_until:
+            return "closed"
+        return "open" if now < self.open_until else "half_open"
+
+    def available(self, now):
+        state = self.state(now)
+        return state == "closed" or (state == "half_open" and not self.probing)
+
+
+def parse_deployments(spec):
+    """Deployments from a JSON list of {"name", "base_url", "api_key"} or comma separated base URLs.
+
+    A deployment without an api_key is called with the key of the llm_config entry.
+    """
+    spec = spec.strip()
+    if spec.startswith("["):
+        entries = json.loads(spec)
+    else:
+        entries = [{"base_url": url.strip()} for url in spec.split(",") if url.strip()]
+    return [
+        Deployment(entry.get("name") or f"deployment-{i}", entry["base_url"], entry.get("api_key"))
+        for i, entry in enumerate(entries)
+    ]
+
+
+class LLMRouter:
+    def __init__(self, origin, deployments, breaker_failures=3, breaker_seconds=10.0, hedge_after=0.0, hedge_budget=0.1):
+        self.origin = origin.rstrip("/")
+        self.deployments = list(deployments)
+        self.breaker_failures = breaker_failures
+        self.breaker_seconds = breaker_seconds
+        self.hedge_after = hedge_after
+        self.hedge_budget = hedge_budget
+        self._lock = threading.Lock()
+        self._hedges = ThreadPoolExecutor(max_workers=HEDGE_THREADS, thread_name_prefix="llm-hedge") if hedge_after else None
+        self.calls = 0
+        self.failovers = 0
+        self.hedged = 0
+
+    def handles(self, request):
+        return request.method == "POST" and str(request.url).startswith(self.origin)
+
+    def _score(self, deployment, now):
+        latency = deployment.latency
+        if latency is None or now - deployment.last_used > STALE_SECONDS:
+            latency = 0.0
+        return latency / (1 - min(deployment.error_rate, 0.9)), deployment.waiting
+
+    def pick(self, exclude=()):
+        """The best deployment not in `exclude`, marked as having one more call waiting on it."""
+        now = time.monotonic()
+        with self._lock:
+            candidates = [d for d in self.deployments if d not in exclude]
+            if not candidates:
+                return None
+            available = [d for d in candidates if d.available(now)]
+            if available:
+                deployment = min(available, key=lambda d: self._score(d, now))
+            elif exclude:
+                # failing over: only to deployments that may take calls
+                return None
+            else:
+                deployment = min(candidates, key=lambda d: d.open_until)
+            if deployment.state(now) == "half_open":
+                deployment.probing = True
+            deployment.waiting += 1
+            deployment.last_used = now
+            deployment.requests += 1
+            return deployment
+
+    def _record(self, deployment, latency=None, failed=False, retry_after=None):
+        with self._lock:
+            deployment.waiting -= 1
+            deployment.probing = False
+            deployment.error_rate += EWMA_ALPHA * ((1.0 if failed else 0.0) - deployment.error_rate)
+            if not failed:
+                deployment.latency = latency if deployment.latency is None else deployment.latency + EWMA_ALPHA * (latency - deployment.latency)
+                deployment.failures, deployment.open_until, deployment.open_seconds = 0, 0.0, 0.0
+                return
+            deployment.errors += 1
+            deployment.failures += 1
+            now = time.monotonic()
+            half_open = deployment.state(now) == "half_open"
+            if half_open or retry_after is not None or deployment.failures >= self.breaker_failures:
+                seconds = min(BREAKER_MAX_SECONDS, deployment.open_seconds * 2 if half_open else self.breaker_seconds)
+                deployment.open_seconds = max(seconds, retry_after or 0.0)
+                deployment.open_until = now + deployment.open_seconds
+                deployment.opened += 1
+
+    def _request(self, request, deployment):
+        url = deployment.base_url + str(request.url)[len(self.origin):]
+        headers = request.headers.copy()
+        # httpx sets the new host's
+        del headers["host"]
+        if deployment.api_key:
+            if "api-key" in headers:
+                headers["api-key"] = deployment.api_key
+            elif "authorization" in headers:
+                headers["authorization"] = f"Bearer {deployment.api_key}"
+        return httpx.Request(request.method, url, headers=headers, content=request.content, extensions=request.extensions)
+
+    def _release(self, deployment):
+        # an attempt that says nothing about the deployment
+        with self._lock:
+            deployment.waiting -= 1
+            deployment.probing = False
+
+    def _attempt(self, request, deployment, send):
+        """Send to one deployment; returns (response or None, error or None, failed)."""
+        started = time.perf_counter()
+        try:
+            response = send(self._request(request, deployment))
+        except httpx.TransportError as e:
+            self._record(deployment, failed=True)
+            return None, e, True
+        except BaseException:
+            self._release(deployment)
+            raise
+        if response.status_code == 429 or response.status_code >= 500:
+            from app.core.http_pool import retry_after
+
+            self._record(deployment, failed=True, retry_after=retry_after(response) if response.status_code == 429 else None)
+            return response, None, True
+        self._record(deployment, latency=time.perf_counter() - started)
+        return response, None, False
+
+    def send(self, request, send):
+        """Route one call: `send(request)` is the transport's own send for a single attempt."""
+        with self._lock:
+            self.calls += 1
+        tried = []
+        response = error = None
+        while True:
+            deployment = self.pick(exclude=tried)
+            if deployment is None:
+                break
+            if tried:
+                with self._lock:
+                    self.failovers += 1
+            tried.append(deployment)
+            if response is not None:
+                # a failed attempt's response is only kept while it is the last one
+                response.close()
+            if self._hedges is not None:
+                response, error, failed = self._hedged(request, deployment, send, tried)
+            else:
+                response, error, failed = self._attempt(request, deployment, send)
+            if not failed:
+                return response
+        if response is not None:
+            return response
+        raise error
+
+    def _hedged(self, request, deployment, send, tried):
+        # the attempts run in the caller's context, so a cancelled run aborts them too
+        primary = self._hedges.submit(copy_context().run, self._attempt, request, deployment, send)
+        done, _ = wait([primary], timeout=self.hedge_after)
+        with self._lock:
+            within_budget = self.hedged + 1 <= self.hedge_budget * self.calls
+        if done or not within_budget:
+            return primary.result()
+        backup_deployment = self.pick(exclude=tried)
+        if backup_deployment is None:
+            return primary.result()
+        with self._lock:
+            self.hedged += 1
+        tried.append(backup_deployment)
+        backup = self._hedges.submit(copy_context().run, self._attempt, request, backup_deployment, send)
+        pending = {primary, backup}
+        result = None
+        failures = []
+        while pending and result is None:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                outcome = future.result()
+                if result is None and not outcome[2]:
+                    result = outcome
+                    if future is backup:
+                        with self._lock:
+                            backup_deployment.hedges_won += 1
+                else:
+                    failures.append(outcome)
+        for future in pending:
+            # the loser's response is closed whenever it comes in
+            future.add_done_callback(_close_late)
+        if result is None:
+            # both failed: the later failure goes back like any failed attempt
+            result = failures.pop()
+        for response, _, _ in failures:
+            if response is not None:
+                response.close()
+        return result
+
+    def stats(self):
+        now = time.monotonic()
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "failovers": self.failovers,
+                "hedged": self.hedged,
+                "hedge_after_ms": self.hedge_after * 1000,
+                "deployments": [
+                    {
+                        "name": d.name,
+                        "base_url": d.base_url,
+                        "state": d.state(now),
+                        "latency_ms": round(d.latency * 1000, 1) if d.latency is not None else None,
+                        "error_rate": round(d.error_rate, 3),
+                        "waiting": d.waiting,
+                        "requests": d.requests,
+                        "errors": d.errors,
+                        "circuit_opened": d.opened,
+                        "hedges_won": d.hedges_won,
+                    }
+                    for d in self.deployments
+                ],
+            }
+
+    def close(self):
+        if self._hedges is not None:
+            self._hedges.shutdown(wait=False)
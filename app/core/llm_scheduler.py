@@ -0,0 +1,221 @@
+import threading
+import time
+from collections import OrderedDict, deque
+from contextvars import ContextVar
+
+import numpy as np
+
+from app.core.cancellation import RunCancelled, current_run
+
+# LLM call scheduler
+# Every LLM request of every session goes through the shared HTTP pool's transport
+# (app/core/http_pool.py), which asks this scheduler for a go before sending it. The scheduler
+# keeps the process under the deployment's limits instead of finding them through 429s:
+#
+#   rpm, tpm        token buckets for requests and tokens per minute (0: no limit), holding
+#                   BURST_SECONDS worth of each; a request takes 1 request and its estimated
+#                   tokens (prompt bytes / 4 plus max_tokens, or DEFAULT_COMPLETION_TOKENS),
+#                   corrected with the usage in the response
+#   classes         priority classes, highest first. A request's class is the account tier of
+#                   the session it runs for (`current_caller`, set by the session engine from
+#                   the account key of the client's hello, see ACCOUNT_KEYS), e.g. premium
+#                   sessions go before standard ones
+#   fair queueing   within a class, waiting sessions take turns: one request each, round
+#                   robin, so a session with many parallel agents cannot starve a small one
+#
+# Requests wait in order: the next one is the head of the highest class with anyone waiting,
+# and nothing behind it is sent while it waits for tokens. A 429 from the deployment (its
+# Retry-After) pauses all sending until then; the client's retry then queues like any call.
+# Calls made outside a session (the /chat job, benchmarks) use the default class. A call whose
+# run is cancelled while it waits leaves the queue with RunCancelled.
+
+DEFAULT_COMPLETION_TOKENS = 256
+BURST_SECONDS = 1
+WAIT_SAMPLES = 1000
+
+# (session id, account tier) of the run the current thread works for
+current_caller = ContextVar("llm_caller", default=None)
+
+
+class TokenBucket:
+    def __init__(self, per_minute):
+        self.set_rate(per_minute)
+        self.level = self.capacity
+        self._updated = time.monotonic()
+
+    def set_rate(self, per_minute):
+        self.per_minute = per_minute
+        self.rate = per_minute / 60
+        # deployments enforce their per-minute quotas over short windows (Azure: 10 seconds),
+        # so requests go out at the rate instead of in bursts of a whole minute's worth; under
+        # 60 a minute the bucket still holds one whole request, or it would never fill up to one
+        self.capacity = max(self.rate * BURST_SECONDS, 1)
+
+    def refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait(self, amount):
+        """Seconds until `amount` is available (after refill)."""
+        return max(0.0, (amount - self.level) / self.rate)
+
+
+class Ticket:
+    __slots__ = ("session", "tier", "tokens", "enqueued", "granted")
+
+    def __init__(self, session, tier, tokens):
+        self.session = session
+        self.tier = tier
+        self.tokens = tokens
+        self.enqueued = time.monotonic()
+        self.granted = None
+
+
+class LLMScheduler:
+    def __init__(self, rpm=0, tpm=0, classes=("premium", "standard", "batch"), default_class="standard"):
+        self.classes = list(classes)
+        self.default_class = default_class if default_class in self.classes else self.classes[-1]
+        self._requests = TokenBucket(rpm) if rpm else None
+        self._tokens = TokenBucket(tpm) if tpm else None
+        # class -> session -> waiting tickets; sessions rotate to the back after each grant
+        self._queues = {name: OrderedDict() for name in self.classes}
+        self._paused_until = 0.0
+        self._cond = threading.Condition()
+        self._waits = {name: deque(maxlen=WAIT_SAMPLES) for name in self.classes}
+        self.granted = {name: 0 for name in self.classes}
+        self.throttled = 0
+        self.estimated_tokens = 0
+        self.used_tokens = 0
+
+    def scale(self, share):
+        """Keep `share` of the limits, for one of several processes sending to the deployment."""
+        with self._cond:
+            for bucket in (self._requests, self._tokens):
+                if bucket is not None:
+                    bucket.set_rate(bucket.per_minute * share)
+                    bucket.level = min(bucket.level, bucket.capacity)
+
+    def tier(self, caller=None):
+        caller = caller or current_caller.get()
+        tier = caller[1] if caller else None
+        return tier if tier in self._queues else self.default_class
+
+    def acquire(self, tokens):
+        """Block until a request of about `tokens` tokens may be sent; returns its ticket."""
+        caller = current_caller.get()
+        ticket = Ticket(caller[0] if caller else None, self.tier(caller), tokens)
+        if self._tokens is not None:
+            # a request bigger than the whole bucket would never fit
+            ticket.tokens = min(ticket.tokens, self._tokens.capacity)
+        run = current_run.get()
+        wake = self._wake
+        if run is not None:
+            run.on_cancel(wake)
+        try:
+            with self._cond:
+                self._queues[ticket.tier].setdefault(ticket.session, deque()).append(ticket)
+                while True:
+                    if run is not None and run.cancelled:
+                        self._leave(ticket)
+                        self._cond.notify_all()
+                        raise RunCancelled(run.reason)
+                    if self._head() is ticket:
+                        wait = self._wait(ticket, time.monotonic())
+                        if wait <= 0:
+                            break
+                        self._cond.wait(wait)
+                    else:
+                        self._cond.wait()
+                self._grant(ticket)
+                self._cond.notify_all()
+        finally:
+            if run is not None:
+                run.remove_callback(wake)
+        return ticket
+
+    def _wake(self, reason=None):
+        with self._cond:
+            self._cond.notify_all()
+
+    def _leave(self, ticket):
+        sessions = self._queues[ticket.tier]
+        waiting = sessions[ticket.session]
+        waiting.remove(ticket)
+        if not waiting:
+            del sessions[ticket.session]
+
+    def _head(self):
+        for name in self.classes:
+            sessions = self._queues[name]
+            if sessions:
+                return next(iter(sessions.values()))[0]
+        return None
+
+    def _wait(self, ticket, now):
+        wait = self._paused_until - now
+        for bucket, amount in ((self._requests, 1), (self._tokens, ticket.tokens)):
+            if bucket is not None:
+                bucket.refill(now)
+                wait = max(wait, bucket.wait(amount))
+        return wait
+
+    def _grant(self, ticket):
+        sessions = self._queues[ticket.tier]
+        waiting = sessions[ticket.session]
+        waiting.popleft()
+        if waiting:
+            sessions.move_to_end(ticket.session)
+        else:
+            del sessions[ticket.session]
+        if self._requests is not None:
+            self._requests.level -= 1
+        if self._tokens is not None:
+            self._tokens.level -= ticket.tokens
+        ticket.granted = time.monotonic()
+        self._waits[ticket.tier].append(ticket.granted - ticket.enqueued)
+        self.granted[ticket.tier] += 1
+        self.estimated_tokens += ticket.tokens
+
+    def settle(self, ticket, used_tokens):
+        """Correct the token bucket with what the request really used."""
+        with self._cond:
+            self.used_tokens += used_tokens
+            if self._tokens is not None:
+                self._tokens.level += ticket.tokens - used_tokens
+            self._cond.notify_all()
+
+    def throttled_for(self, seconds):
+        """The deployment answered 429: send nothing for `seconds`."""
+        with self._cond:
+            self.throttled += 1
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self._cond.notify_all()
+
+    def stats(self):
+        with self._cond:
+            now = time.monotonic()
+            classes = {}
+            for name in self.classes:
+                waits = list(self._waits[name])
+                classes[name] = {
+                    "queued": sum(len(tickets) for tickets in self._queues[name].values()),
+                    "waiting_sessions": len(self._queues[name]),
+                    "granted": self.granted[name],
+                    "wait_ms": {
+                        f"p{p}": round(float(np.percentile(waits, p)) * 1000, 2) if waits else None
+                        for p in (50, 95, 99)
+                    },
+                }
+            buckets = {}
+            for label, bucket in (("requests_per_minute", self._requests), ("tokens_per_minute", self._tokens)):
+                if bucket is not None:
+                    bucket.refill(now)
+                    buckets[label] = {"limit": bucket.per_minute, "available": round(bucket.level, 1)}
+            return {
+                "classes": classes,
+                "buckets": buckets,
+                "paused_ms": round(max(0.0, self._paused_until - now) * 1000, 1),
+                "throttled": self.throttled,
+                "estimated_tokens": self.estimated_tokens,
+                "used_tokens": self.used_tokens,
+            }
@@ -0,0 +1,360 @@
+import argparse
+import json
+import os
+import random
+import re
+import threading
+import time
+import uuid
+import zlib
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Local stand-in for the chat completions API
+# Speaks enough of the OpenAI protocol (POST .../chat/completions, plain and streamed, with
+# tool calls) for every flow to run end to end without a network or an API key. Select it
+# with LLM_BACKEND=mock (see app/core/config.py) and start it with
+#
+#   python -m app.core.mock_llm --port 8900 --profile gpt-4o-mini [--script rules.json]
+#
+# Replies are rule based and deterministic for a given conversation:
+#   - scripted rules first: a JSON list of {"match": regex, "on": "last"|"system"|"any",
+#     "reply": text} or {"match": ..., "tool": name, "arguments": {...}}
+#   - group chat speaker selection ("select the next role from [...]") names an agent from
+#     the list, preferring one mentioned in the last message
+#   - with tools offered, the first tool this conversation has not called yet is called,
+#     with arguments filled in from its JSON schema; after a tool result, a text reply
+#   - otherwise a text reply of about `reply_tokens` tokens
+# Latency follows a profile: time to first token plus tokens at a fixed rate, with jitter.
+# Like the API, it answers 400 to a conversation with a tool call that is not followed by
+# its tool response. With --rpm it also enforces a requests-per-minute limit like a
+# deployment quota, over 10 second windows (rpm / 6 per window) as Azure OpenAI does:
+# requests over it get a 429 with a Retry-After header. --error-rate answers that fraction of requests with a 500, and
+# --stall-rate adds --stall-ms to that fraction of them, for a deployment with a latency tail;
+# unlike the jitter these are random, not seeded by the conversation.
+
+RPM_WINDOW_SECONDS = 10
+
+PROFILES = {
+    "instant": {"ttft_ms": 0, "tokens_per_s": 0, "jitter": 0.0},
+    "fast": {"ttft_ms": 50, "tokens_per_s": 500, "jitter": 0.1},
+    "gpt-4o-mini": {"ttft_ms": 400, "tokens_per_s": 80, "jitter": 0.25},
+    "slow": {"ttft_ms": 1500, "tokens_per_s": 30, "jitter": 0.3},
+}
+
+WORDS = (
+    "the system checks each component and reports status while the agent reviews "
+    "results and prepares a short summary with clear next steps for the user"
+).split()
+
+SELECT_SPEAKER = re.compile(r"select the next role from \[(.*?)\]", re.IGNORECASE | re.DOTALL)
+
+
+def estimate_tokens(text):
+    return max(1, len(text) // 4)
+
+
+def filler(tokens, seed):
+    rng = random.Random(seed)
+    return " ".join(rng.choice(WORDS) for _ in range(tokens))
+
+
+def order_error(messages):
+    """The 400 the OpenAI API answers for tool messages out of order, or None: every assistant
+    message with tool_calls is followed by one tool message per call id, before anything else."""
+    pending = set()
+    for index, message in enumerate(messages):
+        if message.get("role") == "tool":
+            if message.get("tool_call_id") not in pending:
+                return f"messages.[{index}].role: messages with role 'tool' must be a response to a preceding message with 'tool_calls'."
+            pending.discard(message["tool_call_id"])
+            continue
+        if pending:
+            break
+        if message.get("role") == "assistant":
+            pending = {call["id"] for call in message.get("tool_calls") or []}
+    if pending:
+        return ("An assistant message with 'tool_calls' must be followed by tool messages responding to each "
+                f"'tool_call_id'. The following tool_call_ids did not have response messages: {', '.join(sorted(pending))}")
+    return None
+
+
+class MockPolicy:
+    def __init__(self, rules=None, reply_tokens=60):
+        self.rules = [dict(rule, pattern=re.compile(rule["match"], re.IGNORECASE)) for rule in rules or []]
+        self.reply_tokens = reply_tokens
+
+    def reply(self, messages, tools):
+        """Return ("text", content) or ("tool", name, arguments_json) for a request."""
+        seed = zlib.crc32(json.dumps(messages, sort_keys=True, default=str).encode())
+        system = next((str(m.get("content") or "") for m in messages if m.get("role") == "system"), "")
+        last = messages[-1] if messages else {}
+        last_text = str(last.get("content") or "")
+
+        for rule in self.rules:
+            target = {"last": last_text, "system": system}.get(rule.get("on", "any"), system + "\n" + last_text)
+            if rule["pattern"].search(target):
+                if "tool" in rule:
+                    return "tool", rule["tool"], json.dumps(rule.get("arguments", {}))
+                return "text", rule["reply"]
+
+        choice = SELECT_SPEAKER.search(last_text) or SELECT_SPEAKER.search(system)
+        if choice:
+            names = [n.strip(" '\"") for n in choice.group(1).split(",") if n.strip(" '\"")]
+            previous = str(messages[-2].get("content") or "") if len(messages) > 1 else ""
+            mentioned = [n for n in names if n in previous]
+            return "text", (mentioned or names)[seed % len(mentioned or names)]
+
+        if tools and last.get("role") != "tool":
+            called = {
+                call["function"]["name"]
+                for m in messages
+                for call in (m.get("tool_calls") or [])
+            }
+            for tool in tools:
+                function = tool.get("function", {})
+                if function.get("name") not in called:
+                    return "tool", function["name"], json.dumps(self.arguments(function, messages, seed))
+
+        return "text", f"{filler(self.reply_tokens, seed)}."
+
+    def arguments(self, function, messages, seed):
+        # fill every parameter from the schema; free text gets the user's message or filler
+        user_text = next((str(m.get("content") or "") for m in messages if m.get("role") == "user"), "")
+        args = {}
+        for name, schema in function.get("parameters", {}).get("properties", {}).items():
+            kind = schema.get("type")
+            if kind == "boolean":
+                args[name] = True
+            elif kind in ("integer", "number"):
+                args[name] = 1
+            elif kind == "array":
+                args[name] = []
+            elif kind == "object":
+                args[name] = {}
+            elif name in ("query", "description"):
+                args[name] = user_text or filler(8, seed)
+            else:
+                args[name] = filler(self.reply_tokens, seed)
+        return args
+
+
+class MockLLMServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, policy=None, profile="fast", rpm=0, error_rate=0.0, stall_rate=0.0, stall_ms=0):
+        super().__init__(address, MockLLMHandler)
+        self.policy = policy or MockPolicy()
+        self.profile = PROFILES[profile] if isinstance(profile, str) else profile
+        self.rpm = rpm
+        self.error_rate = error_rate
+        self.stall_rate = stall_rate
+        self.stall_ms = stall_ms
+        self.faults = random.Random()
+        self.requests = 0
+        self.throttled = 0
+        # start times of the requests admitted in the current window
+        self._window = deque()
+        self._lock = threading.Lock()
+
+    def count(self):
+        with self._lock:
+            self.requests += 1
+
+    def admit(self):
+        """None if the request is within the rpm limit, else the seconds to retry after."""
+        if not self.rpm:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            while self._window and now - self._window[0] >= RPM_WINDOW_SECONDS:
+                self._window.popleft()
+            if len(self._window) >= max(1, self.rpm * RPM_WINDOW_SECONDS // 60):
+                self.throttled += 1
+                return RPM_WINDOW_SECONDS - (now - self._window[0])
+            self._window.append(now)
+            return None
+
+
+class MockLLMHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.rstrip("/").endswith("/models"):
+            return self._json(200, {"object": "list", "data": [{"id": "gpt-4o-mini", "object": "model"}]})
+        return self._json(404, {"error": {"message": "not found"}})
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        if not self.path.split("?")[0].rstrip("/").endswith("/chat/completions"):
+            return self._json(404, {"error": {"message": f"unsupported path {self.path}"}})
+        retry_after = self.server.admit()
+        if retry_after is not None:
+            return self._json(429, {"error": {"message": "Rate limit exceeded", "code": "429"}},
+                              {"Retry-After": f"{retry_after:.3f}"})
+        self.server.count()
+        if self.server.faults.random() < self.server.error_rate:
+            return self._json(500, {"error": {"message": "Internal server error", "code": "500"}})
+        if self.server.faults.random() < self.server.stall_rate:
+            self._sleep_ms(self.server.stall_ms)
+
+        messages = body.get("messages", [])
+        error = order_error(messages)
+        if error is not None:
+            return self._json(400, {"error": {"message": error, "type": "invalid_request_error", "code": None}})
+        reply = self.server.policy.reply(messages, body.get("tools"))
+        prompt_tokens = sum(estimate_tokens(str(m.get("content") or "")) for m in messages)
+        completion_text = reply[1] if reply[0] == "text" else reply[2]
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": estimate_tokens(completion_text),
+            "total_tokens": prompt_tokens + estimate_tokens(completion_text),
+        }
+        model = body.get("model", "gpt-4o-mini")
+        completion_id = f"chatcmpl-mock-{uuid.uuid4().hex[:12]}"
+        # jitter is seeded by the conversation too, so a replayed workload has the same timing
+        rng = random.Random(zlib.crc32(json.dumps(messages, sort_keys=True, default=str).encode()))
+
+        if body.get("stream"):
+            return self._stream(reply, usage, model, completion_id, rng, body.get("stream_options") or {})
+
+        self._sleep_ms(self._ttft(rng) + self._generation_ms(usage["completion_tokens"], rng))
+        message = {"role": "assistant", "content": None}
+        if reply[0] == "text":
+            message["content"] = reply[1]
+        else:
+            message["tool_calls"] = [self._tool_call(reply)]
+        self._json(200, {
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{
+                "index": 0,
+                "message": message,
+                "finish_reason": "stop" if reply[0] == "text" else "tool_calls",
+            }],
+            "usage": usage,
+        })
+
+    def _stream(self, reply, usage, model, completion_id, rng, stream_options):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def chunk(delta, finish_reason=None, **extra):
+            self._chunk({
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}] if delta is not None else [],
+                **extra,
+            })
+
+        self._sleep_ms(self._ttft(rng))
+        if reply[0] == "text":
+            chunk({"role": "assistant", "content": ""})
+            words = reply[1].split(" ")
+            for i, word in enumerate(words):
+                self._sleep_ms(self._generation_ms(estimate_tokens(word + " "), rng))
+                chunk({"content": word if i == 0 else " " + word})
+            chunk({}, "stop")
+        else:
+            call = self._tool_call(reply)
+            self._sleep_ms(self._generation_ms(usage["completion_tokens"], rng))
+            chunk({"role": "assistant", "content": None, "tool_calls": [dict(call, index=0)]})
+            chunk({}, "tool_calls")
+        if stream_options.get("include_usage"):
+            chunk(None, usage=usage)
+        self._raw_chunk(b"data: [DONE]\n\n")
+        self._raw_chunk(b"")
+
+    @staticmethod
+    def _tool_call(reply):
+        return {
+            "id": f"call_{uuid.uuid4().hex[:16]}",
+            "type": "function",
+            "function": {"name": reply[1], "arguments": reply[2]},
+        }
+
+    def _ttft(self, rng):
+        return self.server.profile["ttft_ms"] * self._jitter(rng)
+
+    def _generation_ms(self, tokens, rng):
+        rate = self.server.profile["tokens_per_s"]
+        return 1000 * tokens / rate * self._jitter(rng) if rate else 0
+
+    def _jitter(self, rng):
+        jitter = self.server.profile["jitter"]
+        return 1 + rng.uniform(-jitter, jitter)
+
+    @staticmethod
+    def _sleep_ms(ms):
+        if ms > 0:
+            time.sleep(ms / 1000)
+
+    def _chunk(self, data):
+        self._raw_chunk(f"data: {json.dumps(data)}\n\n".encode())
+
+    def _raw_chunk(self, data):
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+    def _json(self, status, data, headers=None):
+        payload = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+def load_policy(script=None, reply_tokens=60):
+    rules = None
+    if script:
+        with open(script, encoding="utf-8") as f:
+            rules = json.load(f)
+    return MockPolicy(rules, reply_tokens=reply_tokens)
+
+
+@contextmanager
+def run_mock_llm_in_thread(host="127.0.0.1", port=8900, profile="fast", policy=None, rpm=0, error_rate=0.0, stall_rate=0.0, stall_ms=0):
+    """Run the mock server in a background thread, yielding its base_url."""
+    server = MockLLMServer((host, port), policy=policy, profile=profile, rpm=rpm, error_rate=error_rate, stall_rate=stall_rate, stall_ms=stall_ms)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://{host}:{server.server_address[1]}/v1"
+    finally:
+        server.shutdown()
+        server.server_close()
+        thread.join()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local OpenAI-compatible mock LLM")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--profile", default=os.environ.get("MOCK_LLM_PROFILE", "fast"), choices=sorted(PROFILES))
+    parser.add_argument("--script", default=os.environ.get("MOCK_LLM_SCRIPT"), help="JSON file with scripted reply rules")
+    parser.add_argument("--reply-tokens", type=int, default=60)
+    parser.add_argument("--rpm", type=int, default=0, help="requests per minute before 429s (0: no limit)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with a 500")
+    parser.add_argument("--stall-rate", type=float, default=0.0, help="fraction of requests delayed by --stall-ms")
+    parser.add_argument("--stall-ms", type=float, default=0)
+    args = parser.parse_args()
+
+    server = MockLLMServer(
+        (args.host, args.port), load_policy(args.script, args.reply_tokens), args.profile, rpm=args.rpm,
+        error_rate=args.error_rate, stall_rate=args.stall_rate, stall_ms=args.stall_ms,
+    )
+    print(f"Mock LLM listening on http://{args.host}:{args.port}/v1 with profile {args.profile}", flush=True)
+    server.serve_forever()
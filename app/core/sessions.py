@@ -0,0 +1,479 @@
+import queue
+from collections import deque
+from concurrent.futures import wait
+import threading
+import time
+import uuid
+from enum import Enum
+
+import numpy as np
+
+from autogen.events.client_events import StreamEvent
+from autogen.events.print_event import PrintEvent
+from autogen.io.base import IOStream
+
+from app.core.admission import AdmissionController, Busy
+from app.core.cancellation import CANCEL, RunCancelled, RunToken, current_run, deadlines
+from app.core.checkpoints import current_checkpoint
+from app.core.framing import FrameWriter
+from app.core.llm_scheduler import current_caller
+from app.core.streaming import ChunkCoalescer, STREAM_CHUNK_BYTES, STREAM_CHUNK_SECONDS
+
+# Session engine
+# One Session per websocket connection. The connection thread only reads from the
+# socket; group chat runs are handed to a bounded worker pool so a slow run never
+# holds more than one of the `max_active_runs` slots, and idle sockets cost nothing.
+# The pool is an AdmissionController (app/core/admission.py): a run it turns away is not
+# started, the client gets {"type": "busy", "content": {"retry_after": seconds, ...}}.
+# Every run has a RunToken (app/core/cancellation.py). The client's {"op": "cancel"}, the
+# session closing and the run's deadline cancel it: the group chat stops at the next turn, its
+# LLM calls in flight are aborted, and the slot is free for the next run at once.
+# With a CheckpointStore (app/core/checkpoints.py) the runs of the session's flow are
+# checkpointed after every round; a client that reconnects continues its last run with
+# engine.resume(session, its old session id), from the round where it was.
+
+
+RECLAIM_SAMPLES = 1000
+# seconds resume() waits for the run of the connection being replaced to stop
+RESUME_WAIT_SECONDS = 10
+
+
+class SessionState(str, Enum):
+    CONNECTED = "connected"
+    QUEUED = "queued"
+    RUNNING = "running"
+    IDLE = "idle"
+    CLOSED = "closed"
+
+
+class SessionStream(IOStream):
+    """IOStream handed to the agents of a session.
+
+    Output goes straight to the client socket. Input is read from the session inbox,
+    which the connection thread fills, so only one thread ever calls recv().
+    """
+
+    def __init__(self, session: "Session"):
+        self._session = session
+
+    def print(self, *objects, sep=" ", end="\n", flush=False):
+        self.send(PrintEvent(*objects, sep=sep, end=end))
+
+    def send(self, message):
+        self._session.emit(message)
+
+    def input(self, prompt="", *, password=False):
+        if prompt != "":
+            self._session.writer.write_text(prompt)
+        message = self._session.inbox.get()
+        if message is CANCEL:
+            token = self._session.token
+            raise RunCancelled(token.reason if token is not None else "cancelled")
+        return message
+
+
+class Session:
+    def __init__(self, iostream, chunk_bytes=STREAM_CHUNK_BYTES, chunk_seconds=STREAM_CHUNK_SECONDS, session_id=None):
+        self.id = session_id or uuid.uuid4().hex
+        self.iostream = iostream
+        self.stream = SessionStream(self)
+        self.inbox = queue.Queue()
+        # runs other than the session's flow (replays) requested while busy
+        self.pending = deque()
+        self.state = SessionState.CONNECTED
+        self.created_at = time.time()
+        self.last_active = self.created_at
+        self.runs = 0
+        # the session's flow, called with each chat message
+        self.run = None
+        self.run_id = None
+        self.flow = None
+        self.future = None
+        # the RunToken of the run in progress, the run's deadline in seconds (None for the
+        # engine's default) and a cancel asked for while the run was being dispatched
+        self.token = None
+        self.deadline = None
+        self.cancel_pending = None
+        self.trace = None
+        # the SessionEngine that opened it
+        self.engine = None
+        # set when the client asks for compact flow events instead of raw ag2 events
+        self.encoder = None
+        # serializes what goes out, one JSON text frame per event until the client's hello
+        # asks for batching or msgpack (app/core/framing.py)
+        self.writer = FrameWriter(iostream.websocket)
+        self.layout_levels = None
+        # priority class of its LLM calls (app/core/llm_scheduler.py), None for the default
+        self.account_tier = None
+        # runs may emit from several threads (parallel research branches); one event at a time
+        # keeps the trace and the socket in the same order
+        self._emit_lock = threading.Lock()
+        # token deltas of streaming agents, sent as coalesced chunk events (app/core/streaming.py)
+        self.chunks = ChunkCoalescer(self._send, max_bytes=chunk_bytes, max_delay=chunk_seconds)
+
+    @property
+    def busy(self):
+        return self.state in (SessionState.QUEUED, SessionState.RUNNING)
+
+    def touch(self):
+        self.last_active = time.time()
+
+    def emit(self, event):
+        """Send an ag2 event, or an already dumped event dict, to the client."""
+        if isinstance(event, StreamEvent):
+            # deltas are not traced, the final message is
+            with self._emit_lock:
+                # ag2 wraps events: the outer content is the StreamEvent itself
+                self.chunks.add(event.content.content)
+            return
+        if (self.trace is None and self.encoder is None and not self.chunks.open and not isinstance(event, dict)
+                and not self.writer.batch and self.writer.encoding == "json"):
+            self.iostream.send(event)
+            return
+        data = event if isinstance(event, dict) else event.model_dump(mode="json")
+        with self._emit_lock:
+            content = data.get("content")
+            if self.chunks.open and isinstance(content, dict) and content.get("sender"):
+                self.chunks.finish(content["sender"])
+            if self.trace is not None and self.run_id is not None:
+                self.trace.append(self.run_id, data)
+            self._send(data)
+
+    def emit_chunk(self, turn, text):
+        """A stream delta produced in a worker process, with the turn it belongs to."""
+        with self._emit_lock:
+            self.chunks.add(text, turn)
+
+    def _send(self, data):
+        if self.encoder is not None:
+            self.encoder.send(data)
+        else:
+            self.writer.write(data)
+
+    def write(self, frame):
+        # the flow encoder's output, through whichever writer the session has now
+        self.writer.write(frame)
+
+    def set_writer(self, writer):
+        with self._emit_lock:
+            self.writer.flush()
+            self.writer = writer
+
+
+class SessionEngine:
+    def __init__(self, max_active_runs=4, trace_store=None, chunk_bytes=STREAM_CHUNK_BYTES, chunk_seconds=STREAM_CHUNK_SECONDS,
+                 workers=None, admission=None, run_deadline=None, checkpoints=None):
+        self.max_active_runs = max_active_runs
+        # optional WorkerPool (app/core/workers.py): session flows it knows run in its processes
+        self.workers = workers
+        self.trace_store = trace_store
+        self.chunk_bytes = chunk_bytes
+        self.chunk_seconds = chunk_seconds
+        # runs per flow at once, the pending queue and load shedding; unbounded by default
+        self.admission = admission or AdmissionController(max_active_runs, thread_name_prefix="session-run")
+        # seconds a run may take before it is cancelled, unless the session sets its own
+        self.run_deadline = run_deadline
+        # optional CheckpointStore for the runs of the sessions' flows
+        self.checkpoints = checkpoints
+        self._sessions = {}
+        self._lock = threading.Lock()
+        self.completed_runs = 0
+        self.failed_runs = 0
+        # cancelled runs by reason (client, closed, deadline, detached), queued runs cancelled
+        # before they started, LLM calls aborted mid-flight, and how fast a cancelled run gave
+        # its slot back
+        self.cancelled_runs = {}
+        self.cancelled_queued = 0
+        self.aborted_llm_calls = 0
+        self.reclaim_times = deque(maxlen=RECLAIM_SAMPLES)
+        # run time saved: the flow's average run time minus how long the cancelled run had run
+        self.reclaimed_seconds = 0.0
+        # output of closed sessions; live ones are added in stats()
+        self.closed_output = {"events": 0, "frames": 0, "bytes": 0}
+
+    def open(self, iostream, session_id=None):
+        # sharded sessions keep the id their gateway gave them (app/core/cluster.py)
+        session = Session(iostream, chunk_bytes=self.chunk_bytes, chunk_seconds=self.chunk_seconds, session_id=session_id)
+        session.trace, session.engine = self.trace_store, self
+        with self._lock:
+            self._sessions[session.id] = session
+        return session
+
+    def deliver(self, session, message, run=None, traced=True, flow=None):
+        """Hand a client message to the session.
+
+        An idle session starts `run(message)` on the run pool, where `run` defaults to the
+        session's flow (`session.run`, or a worker process when the engine has workers for it). While a run is queued or in progress the message goes
+        to the inbox instead, where the agents read it as human input or, if nobody asks for
+        input, it starts the next run of the session's flow. Runs with `traced=False`, like
+        replays, are not written to the trace store. `flow` names the run for admission
+        control, by default the session's flow. Returns None when the run was turned away.
+        """
+        with self._lock:
+            session.touch()
+            if session.busy:
+                if run is None:
+                    session.inbox.put(message)
+                else:
+                    session.pending.append((message, run, traced, flow))
+                return session.future
+            busy = self._submit(session, message, run, traced, flow)
+            if busy is None:
+                return session.future
+        self._turned_away(session, busy)
+        return None
+
+    def resume(self, session, from_id):
+        """Continue the last run of session `from_id` in `session`, from its checkpoint.
+
+        A session still open under that id (the client came back before its old connection
+        was noticed as gone) is closed first, and its run is waited for on a thread of its own,
+        so the caller (a connection or cluster node thread) is not held up. The client gets
+        {"type": "resumed", ...}, or an error when there is nothing to resume: no checkpoint,
+        one of another flow, or `session` is busy.
+        """
+        if self.checkpoints is None or not isinstance(from_id, str) or from_id == session.id:
+            self._nothing_to_resume(session)
+            return
+        with self._lock:
+            previous = self._sessions.get(from_id)
+        if previous is not None:
+            self.close(previous)
+            if previous.future is not None and not previous.future.done():
+                def resume_after():
+                    wait([previous.future], timeout=RESUME_WAIT_SECONDS)
+                    self._resume(session, from_id)
+
+                threading.Thread(target=resume_after, name="session-resume", daemon=True).start()
+                return
+        self._resume(session, from_id)
+
+    def _resume(self, session, from_id):
+        checkpoint = self.checkpoints.load(from_id)
+        if checkpoint is None or checkpoint.flow != session.flow or not checkpoint.messages:
+            self._nothing_to_resume(session)
+            return
+        with self._lock:
+            # the client may have sent something else, or gone, while the old run stopped
+            refused = session.busy or session.state == SessionState.CLOSED
+            if not refused:
+                session.touch()
+                busy = self._submit(session, checkpoint.message, None, resume_from=from_id)
+        if refused:
+            self._nothing_to_resume(session)
+            return
+        if busy is not None:
+            self._turned_away(session, busy)
+            return
+        session.emit({"type": "resumed", "content": {
+            "content": f"Resuming your last run from round {checkpoint.rounds}.",
+            "session": from_id,
+            "rounds": checkpoint.rounds,
+        }})
+
+    @staticmethod
+    def _nothing_to_resume(session):
+        session.emit({"type": "error", "content": {"content": "There is no run to resume."}})
+
+    def _submit(self, session, message, run, traced=True, flow=None, resume_from=None):
+        # the Busy error when admission control turns the run away
+        previous, session.state = session.state, SessionState.QUEUED
+        try:
+            flow = flow or session.flow
+            session.future = self.admission.submit(flow, self._run, session, message, run, traced, flow, resume_from)
+        except Busy as busy:
+            session.state = previous
+            return busy
+        return None
+
+    @staticmethod
+    def _turned_away(session, busy):
+        session.emit({"type": "busy", "content": {
+            "content": f"The server is busy, please retry in {busy.retry_after} s.",
+            "retry_after": busy.retry_after,
+            "reason": busy.reason,
+        }})
+
+    def _run(self, session, message, run, traced, flow, resume_from=None):
+        with self._lock:
+            if session.state == SessionState.CLOSED:
+                return None
+            session.state = SessionState.RUNNING
+            session.run_id = uuid.uuid4().hex if traced else None
+            deadline = session.deadline or self.run_deadline
+            token = session.token = RunToken(time.monotonic() + deadline if deadline else None)
+            requested, session.cancel_pending = session.cancel_pending, None
+        # however it is cancelled (client, close, deadline), a run waiting for human input wakes up
+        token.on_cancel(lambda reason: session.inbox.put(CANCEL))
+        if requested is not None:
+            token.cancel(requested)
+        deadlines.watch(token)
+        if session.trace is not None and session.run_id is not None:
+            session.trace.start_run(session.run_id, flow=session.flow)
+        started = time.monotonic()
+        failed = False
+        cancelled = None
+        # runs of the session's flow are checkpointed, replays and other runs are not
+        checkpointed = self.checkpoints is not None and run is None and traced
+        checkpoint = None
+        # the LLM scheduler queues this run's calls under the session and its tier
+        caller = current_caller.set((session.id, session.account_tier))
+        # agents, LLM calls and input prompts of this run stop when its token is cancelled
+        run_token = current_run.set(token)
+        try:
+            token.check()
+            # agents look up their output stream through IOStream.get_default(), which is per thread
+            if run is None and self.workers is not None and session.flow in self.workers:
+                return self.workers.run(session, message, (session.id, resume_from) if checkpointed else None)
+            if checkpointed:
+                checkpoint = self.checkpoints.open(session.id, session.flow, message, resume_from)
+                checkpoint_token = current_checkpoint.set(checkpoint)
+            with IOStream.set_default(session.stream):
+                return (run or session.run)(message)
+        except RunCancelled as e:
+            cancelled = e.reason
+            raise
+        except Exception as e:
+            if not token.cancelled:
+                failed = True
+                print(f" - session {session.id}: Exception: {e}", flush=True)
+                raise
+            # an error caused by the cancellation, such as a tool's request being aborted
+            cancelled = token.reason
+            raise RunCancelled(token.reason) from e
+        finally:
+            current_run.reset(run_token)
+            current_caller.reset(caller)
+            token.close()
+            if checkpoint is not None:
+                current_checkpoint.reset(checkpoint_token)
+                # a finished run, or one the client cancelled, has nothing left to resume
+                checkpoint.close(keep=failed or (cancelled is not None and cancelled != "client"))
+            busy = None
+            with self._lock:
+                session.token = None
+                # wake-ups meant for this run
+                with session.inbox.mutex:
+                    session.inbox.queue = deque(m for m in session.inbox.queue if m is not CANCEL)
+                session.runs += 1
+                if cancelled is not None:
+                    self._count_cancelled(token, flow, time.monotonic() - started)
+                elif failed:
+                    self.failed_runs += 1
+                else:
+                    self.completed_runs += 1
+                session.touch()
+                if session.state != SessionState.CLOSED:
+                    session.state = SessionState.IDLE
+                    if session.pending:
+                        busy = self._submit(session, *session.pending.popleft())
+                    elif not session.inbox.empty():
+                        busy = self._submit(session, session.inbox.get_nowait(), None)
+            if cancelled is not None and cancelled != "closed":
+                self._cancelled(session, cancelled)
+            if busy is not None:
+                self._turned_away(session, busy)
+
+    def _count_cancelled(self, token, flow, elapsed):
+        self.cancelled_runs[token.reason] = self.cancelled_runs.get(token.reason, 0) + 1
+        self.aborted_llm_calls += token.aborted_calls
+        if token.cancelled_at is not None:
+            self.reclaim_times.append(time.monotonic() - token.cancelled_at)
+        average = self.admission.run_seconds(flow)
+        if average is not None:
+            self.reclaimed_seconds += max(0.0, average - elapsed)
+
+    @staticmethod
+    def _cancelled(session, reason):
+        text = f"The run took longer than its {session.deadline or session.engine.run_deadline:g} s deadline and was stopped." \
+            if reason == "deadline" else "The run was cancelled."
+        session.emit({"type": "cancelled", "content": {"content": text, "reason": reason}})
+
+    def cancel(self, session, reason="client"):
+        """Cancel the session's queued or running run, and the messages queued behind it.
+
+        A queued run is dropped before it starts. A running one stops at the next agent turn,
+        with its LLM calls in flight aborted. Returns False when the session has no run.
+        """
+        token = None
+        with self._lock:
+            if not session.busy:
+                return False
+            session.pending.clear()
+            with session.inbox.mutex:
+                session.inbox.queue.clear()
+            if session.state == SessionState.QUEUED:
+                if session.future.cancel():
+                    session.state = SessionState.IDLE
+                    self.cancelled_queued += 1
+                else:
+                    # being dispatched right now: the run cancels itself as it starts
+                    session.cancel_pending = reason
+                    return True
+            else:
+                token = session.token
+        if token is None:
+            self._cancelled(session, reason)
+        else:
+            token.cancel(reason)
+        return True
+
+    def close(self, session):
+        output = session.writer.stats()
+        with self._lock:
+            # resume() may have closed it already, for the connection that replaced it
+            if session.state == SessionState.CLOSED:
+                return
+            session.state = SessionState.CLOSED
+            if self._sessions.get(session.id) is session:
+                del self._sessions[session.id]
+            for key in self.closed_output:
+                self.closed_output[key] += output[key]
+            token = session.token
+            if session.future is not None and session.future.cancel():
+                self.cancelled_queued += 1
+        # nobody is left to read the run's output: stop it
+        if token is not None:
+            token.cancel("closed")
+
+    def cancellation_stats(self):
+        with self._lock:
+            reclaim = list(self.reclaim_times)
+            return {
+                "run_deadline_s": self.run_deadline,
+                "cancelled_runs": dict(self.cancelled_runs),
+                "cancelled_queued": self.cancelled_queued,
+                "aborted_llm_calls": self.aborted_llm_calls,
+                # from the cancel to the run's slot being free
+                "reclaim_ms": {
+                    f"p{p}": round(float(np.percentile(reclaim, p)) * 1000, 1) if reclaim else None
+                    for p in (50, 95, 99)
+                },
+                "reclaimed_run_s": round(self.reclaimed_seconds, 1),
+            }
+
+    def stats(self):
+        with self._lock:
+            sessions = list(self._sessions.values())
+            output = dict(self.closed_output)
+        states = [s.state for s in sessions]
+        for session in sessions:
+            for key, value in session.writer.stats().items():
+                if key in output:
+                    output[key] += value
+        return {
+            "sessions": len(states),
+            "connected": states.count(SessionState.CONNECTED),
+            "idle": states.count(SessionState.IDLE),
+            "queued": states.count(SessionState.QUEUED),
+            "running": states.count(SessionState.RUNNING),
+            "max_active_runs": self.max_active_runs,
+            "completed_runs": self.completed_runs,
+            "failed_runs": self.failed_runs,
+            "cancellation": self.cancellation_stats(),
+            # events, frames and bytes written by the sessions' frame writers
+            "output": output,
+            "admission": self.admission.stats(),
+            "workers": self.workers.stats() if self.workers is not None else None,
+            "checkpoints": self.checkpoints.stats() if self.checkpoints is not None else None,
+        }
@@ -0,0 +1,99 @@
+import time
+import uuid
+from contextvars import ContextVar
+
+# Token streaming
+# With `stream: True` in its llm config, ag2's OpenAI client sends a StreamEvent per content
+# delta through IOStream.get_default(), i.e. the session stream of the run. The event only
+# carries text, so two hooks on every streaming agent say whose turn it is:
+#
+#   process_all_messages_before_reply   opens a turn: (agent name, new message id)
+#   process_message_before_send         closes it, the reply is final and about to be sent
+#
+# Deltas outside a turn (speaker selection by the group manager) are dropped. The ids live in
+# a context variable, so parallel research branches each see their own turn.
+#
+# The deltas of a turn are coalesced into "stream_chunk" events of at least `max_bytes` bytes
+# or `max_delay` seconds of text, whichever comes first (checked as deltas arrive). The
+# agent's final event (its message, or its tool call once complete; handoffs are tool calls
+# too) first flushes whatever is left as a chunk with "end": true, so the client can swap the
+# streamed text for the final message.
+
+STREAM_CHUNK_BYTES = 64
+STREAM_CHUNK_SECONDS = 0.05
+
+current_turn = ContextVar("current_turn", default=None)
+
+
+def mark_turns(agents):
+    """Tag the stream deltas of every LLM agent in `agents` with the agent and a message id."""
+    for agent in agents:
+        if agent is None or not getattr(agent, "llm_config", False):
+            continue
+
+        def start(messages, name=agent.name):
+            current_turn.set((name, uuid.uuid4().hex[:12]))
+            return messages
+
+        def end(sender, message, recipient, silent):
+            current_turn.set(None)
+            return message
+
+        agent.register_hook(hookable_method="process_all_messages_before_reply", hook=start)
+        agent.register_hook(hookable_method="process_message_before_send", hook=end)
+
+
+class ChunkCoalescer:
+    """Buffers stream deltas per agent and writes them as chunk events with `send(dict)`.
+
+    Not thread safe on its own, the session calls it under its emit lock.
+    """
+
+    def __init__(self, send, max_bytes=STREAM_CHUNK_BYTES, max_delay=STREAM_CHUNK_SECONDS):
+        self._send = send
+        self.max_bytes = max_bytes
+        self.max_delay = max_delay
+        # agent -> [message id, pending text, pending bytes, time of the oldest pending delta]
+        self.open = {}
+        self.deltas_in = 0
+        self.chunks_out = 0
+
+    def add(self, text, turn=None):
+        # the turn comes from the contextvar, or from the caller for deltas relayed from a worker
+        turn = turn or current_turn.get()
+        if turn is None or not text:
+            return
+        agent, message_id = turn
+        self.deltas_in += 1
+        buffer = self.open.get(agent)
+        if buffer is not None and buffer[0] != message_id:
+            # the agent's previous turn ended without a reply event (e.g. an empty reply)
+            self._flush(agent, end=True)
+            buffer = None
+        if buffer is None:
+            buffer = self.open[agent] = [message_id, [], 0, time.monotonic()]
+        if not buffer[1]:
+            buffer[3] = time.monotonic()
+        buffer[1].append(text)
+        buffer[2] += len(text.encode("utf-8"))
+        if buffer[2] >= self.max_bytes or time.monotonic() - buffer[3] >= self.max_delay:
+            self._flush(agent)
+
+    def finish(self, agent):
+        """Flush and close the agent's stream, right before its final event goes out."""
+        if agent in self.open:
+            self._flush(agent, end=True)
+
+    def _flush(self, agent, end=False):
+        buffer = self.open[agent]
+        text = "".join(buffer[1])
+        buffer[1], buffer[2] = [], 0
+        if end:
+            del self.open[agent]
+        if not text and not end:
+            return
+        self.chunks_out += 1
+        self._send({
+            "type": "stream_chunk",
+            "content": {"sender": agent, "message_id": buffer[0], "content": text, "end": end},
+        })
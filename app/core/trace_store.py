@@ -0,0 +1,221 @@
+import hashlib
+import json
+import mmap
+import queue
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+
+# Append-only trace store
+# Every event of every run is appended, as it happens, to a segmented log on disk:
+#
+#   traces/segment-000001.log   one JSON record per line {"run": ..., "ts": ..., "event": {...}}
+#   traces/segment-000001.idx   one fixed-size index entry per record (see INDEX_DTYPE)
+#   traces/runs.jsonl           one line per run: id, flow, start time
+#
+# Writes go through a bounded queue to a writer thread, so the chat thread never waits on
+# the disk; when the queue is full the event is counted as dropped instead. Reads memory-map
+# the index, filter it with NumPy by run, agent and event type hashes, and then only decode
+# the matching records from the memory-mapped log. Segments roll over at `segment_bytes`,
+# so neither reads nor writes hold more than one segment's index in memory.
+
+INDEX_DTYPE = np.dtype([
+    ("offset", "<u8"),
+    ("length", "<u4"),
+    ("run", "<u8"),
+    ("agent", "<u8"),
+    ("type", "<u8"),
+    ("ts", "<f8"),
+])
+SEGMENT_BYTES = 64 * 1024 * 1024
+MAX_PENDING = 10000
+
+
+def key_hash(value):
+    if not value:
+        return 0
+    return int.from_bytes(hashlib.blake2b(str(value).encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def event_agent(event):
+    content = event.get("content")
+    if isinstance(content, dict):
+        return content.get("sender") or content.get("speaker")
+    return None
+
+
+class TraceStore:
+    def __init__(self, directory, segment_bytes=SEGMENT_BYTES, max_pending=MAX_PENDING):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.segment_bytes = segment_bytes
+        self.written = 0
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._segment = max(self._segment_numbers(), default=0)
+        self._log = None
+        self._idx = None
+        self._idle = threading.Event()
+        self._idle.set()
+        self._writer = threading.Thread(target=self._write_loop, name="trace-writer", daemon=True)
+        self._writer.start()
+
+    # ---- writing ----
+
+    def start_run(self, run_id, flow=None):
+        self._put(("run", {"run": run_id, "flow": flow, "started": time.time()}))
+
+    def append(self, run_id, event):
+        """Queue one event dict (an ag2 event's `model_dump(mode="json")`) for the run."""
+        self._put(("event", (run_id, time.time(), event)))
+
+    def _put(self, item):
+        try:
+            self._idle.clear()
+            self._queue.put_nowait(item)
+        except queue.Full:
+            self.dropped += 1
+
+    def flush(self, timeout=5.0):
+        """Wait until everything queued so far is on disk (for readers of the live segment)."""
+        deadline = time.monotonic() + timeout
+        while not (self._queue.empty() and self._idle.is_set()) and time.monotonic() < deadline:
+            self._idle.wait(0.05)
+
+    def _write_loop(self):
+        while True:
+            try:
+                kind, item = self._queue.get(timeout=0.5)
+            except queue.Empty:
+                self._flush_files()
+                self._idle.set()
+                continue
+            if kind == "run":
+                with open(self.directory / "runs.jsonl", "a", encoding="utf-8") as runs:
+                    runs.write(json.dumps(item) + "\n")
+            else:
+                self._write_event(*item)
+            if self._queue.empty():
+                self._flush_files()
+                self._idle.set()
+
+    def _write_event(self, run_id, ts, event):
+        record = json.dumps({"run": run_id, "ts": ts, "event": event}, separators=(",", ":"), default=str)
+        data = record.encode("utf-8") + b"\n"
+        if self._log is None or self._log.tell() + len(data) > self.segment_bytes:
+            self._roll()
+        entry = np.zeros(1, dtype=INDEX_DTYPE)
+        entry["offset"] = self._log.tell()
+        entry["length"] = len(data) - 1
+        entry["run"] = key_hash(run_id)
+        entry["agent"] = key_hash(event_agent(event))
+        entry["type"] = key_hash(event.get("type"))
+        entry["ts"] = ts
+        self._log.write(data)
+        self._idx.write(entry.tobytes())
+        self.written += 1
+
+    def _roll(self):
+        self._close_files()
+        if self._log is not None or self._segment == 0 or self._segment_size(self._segment) >= self.segment_bytes:
+            self._segment += 1
+        self._log = open(self._path(self._segment, "log"), "ab")
+        self._idx = open(self._path(self._segment, "idx"), "ab")
+
+    def _flush_files(self):
+        if self._log is not None:
+            self._log.flush()
+            self._idx.flush()
+
+    def _close_files(self):
+        if self._log is not None:
+            self._log.close()
+            self._idx.close()
+
+    # ---- reading ----
+
+    def runs(self):
+        path = self.directory / "runs.jsonl"
+        if not path.exists():
+            return []
+        with open(path, encoding="utf-8") as runs:
+            return [json.loads(line) for line in runs if line.strip()]
+
+    def read(self, run_id=None, agent=None, event_type=None, start=0, limit=None):
+        """Yield the stored records (dicts with run, ts and event) matching every given filter.
+
+        `start` and `limit` slice the matching records, so a page of a long run only
+        decodes the records on that page.
+        """
+        skip, returned = start, 0
+        for segment in sorted(self._segment_numbers()):
+            matches = self._matches(segment, run_id, agent, event_type)
+            if skip >= len(matches):
+                skip -= len(matches)
+                continue
+            for record in self._decode(segment, matches[skip:], run_id, agent, event_type):
+                if limit is not None and returned >= limit:
+                    return
+                yield record
+                returned += 1
+            skip = 0
+
+    def _matches(self, segment, run_id, agent, event_type):
+        index = self._map(self._path(segment, "idx"))
+        if index is None:
+            return np.zeros(0, dtype=INDEX_DTYPE)
+        with index:
+            entries = np.frombuffer(index, dtype=INDEX_DTYPE, count=len(index) // INDEX_DTYPE.itemsize)
+            mask = np.ones(len(entries), dtype=bool)
+            for field, value in (("run", run_id), ("agent", agent), ("type", event_type)):
+                if value is not None:
+                    mask &= entries[field] == key_hash(value)
+            matches = entries[mask]
+            # release the view on the map before it is closed
+            del entries
+        return matches
+
+    def _decode(self, segment, matches, run_id, agent, event_type):
+        log = self._map(self._path(segment, "log"))
+        if log is None:
+            return
+        with log:
+            for offset, length in zip(matches["offset"].tolist(), matches["length"].tolist()):
+                record = json.loads(log[offset:offset + length])
+                # hashes can collide, the record itself has the real values
+                event = record["event"]
+                if run_id is not None and record["run"] != run_id:
+                    continue
+                if agent is not None and event_agent(event) != agent:
+                    continue
+                if event_type is not None and event.get("type") != event_type:
+                    continue
+                yield record
+
+    @staticmethod
+    def _map(path):
+        if not path.exists() or path.stat().st_size == 0:
+            return None
+        with open(path, "rb") as f:
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def _path(self, segment, suffix):
+        return self.directory / f"segment-{segment:06d}.{suffix}"
+
+    def _segment_size(self, segment):
+        path = self._path(segment, "log")
+        return path.stat().st_size if path.exists() else 0
+
+    def _segment_numbers(self):
+        return [int(p.stem.split("-")[1]) for p in self.directory.glob("segment-*.log")]
+
+    def stats(self):
+        return {
+            "directory": str(self.directory),
+            "segments": len(self._segment_numbers()),
+            "written": self.written,
+            "dropped": self.dropped,
+            "pending": self._queue.qsize(),
+        }
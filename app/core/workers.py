@@ -0,0 +1,326 @@
+import atexit
+import multiprocessing
+import queue
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from app.core.cancellation import RunCancelled, current_run
+
+# Session worker processes
+# All group chats share one interpreter by default, so the CPU side of a run (pydantic event
+# dumps, ContextVariables copies, handoff evaluation, tool functions, response parsing) takes
+# turns on the GIL. With SESSION_WORKERS > 0 the front process only keeps the sockets and the
+# session state; the session's flow runs in one of N worker processes:
+#
+#   front                                          worker (spawned, imports the agent stack once)
+#   SessionEngine._run -> WorkerPool.run
+#     ("run", key, flow, message, caller,  ->      runs FLOW_RUNNERS[flow](message) on a thread,
+#      checkpoint)                                 up to `runs_per_worker` at a time; caller is
+#                                                  the LLM scheduler's (session id, tier), and
+#                                                  checkpoint (session id, resume from) or None
+#                                                  for the worker's own CheckpointStore handle
+#     session.emit(event)                  <-      ("event", key, event dict)
+#     session.emit_chunk(turn, text)       <-      ("chunk", key, (agent, message id), text)
+#     prompt to the client, reply          <-      ("prompt", key, prompt)
+#     ("input", key, reply)                ->
+#     run cancelled (app/core/cancellation.py)
+#     ("cancel", key, reason)              ->      cancels the run's own RunToken
+#                                          <-      ("cancelled", key, reason, aborted LLM calls)
+#     run finished                         <-      ("done", key, error or None)
+#
+# The channel is a multiprocessing Pipe per worker (a local socket pair, pickled tuples). The
+# front's engine thread for the run relays its events in order, so tracing, flow encoding and
+# batching stay exactly as in thread mode. Runs go to the worker with the fewest active runs.
+# When a worker dies its runs fail with an error event (they are not retried, their LLM calls
+# and tool side effects may have happened already) and a new worker is started in its place.
+
+
+# seconds before replacing a worker that died during startup, doubling up to the max
+RESTART_BACKOFF = 0.5
+RESTART_BACKOFF_MAX = 30
+
+
+class WorkerCrashed(RuntimeError):
+    pass
+
+
+def worker_main(conn, runs_per_worker, warmup, share=1.0):
+    from autogen.io.base import IOStream
+    from app.agents import agentchat_websockets as stack
+    from app.core import config
+    from app.core.cancellation import CANCEL, RunCancelled, RunToken, current_run
+    from app.core.checkpoints import current_checkpoint
+    from app.core.llm_scheduler import current_caller
+    from app.core.streaming import current_turn
+
+    # every worker sends to the same deployment: each keeps its share of the rate limits
+    config.lazy("llm_scheduler").scale(share)
+    stack.warm_flows([flow for flow in warmup if flow in stack.FLOW_RUNNERS])
+    send_lock = threading.Lock()
+    inboxes = {}
+    tokens = {}
+
+    def send(*message):
+        with send_lock:
+            conn.send(message)
+
+    class WorkerStream(IOStream):
+        def __init__(self, key):
+            self.key = key
+
+        def print(self, *objects, sep=" ", end="\n", flush=False):
+            from autogen.events.print_event import PrintEvent
+
+            self.send(PrintEvent(*objects, sep=sep, end=end))
+
+        def send(self, event):
+            data = event if isinstance(event, dict) else event.model_dump(mode="json")
+            if data.get("type") == "stream":
+                send("chunk", self.key, current_turn.get(), data["content"]["content"])
+            else:
+                send("event", self.key, data)
+
+        def input(self, prompt="", *, password=False):
+            send("prompt", self.key, prompt)
+            message = inboxes[self.key].get()
+            if message is CANCEL:
+                raise RunCancelled(tokens[self.key].reason)
+            return message
+
+    def run(key, flow, message, caller, checkpoint):
+        error = cancelled = None
+        # kept unless the run finishes or the client cancels it
+        keep = True
+        token = tokens[key]
+        current_caller.set(caller)
+        current_run.set(token)
+        checkpointer = None
+        try:
+            if checkpoint is not None and stack.checkpoint_store is not None:
+                session_id, resume_from = checkpoint
+                checkpointer = stack.checkpoint_store.open(session_id, flow, message, resume_from)
+            current_checkpoint.set(checkpointer)
+            with IOStream.set_default(WorkerStream(key)):
+                stack.FLOW_RUNNERS[flow](message)
+            keep = False
+        except RunCancelled as e:
+            cancelled = e.reason
+        except Exception as e:
+            if token.cancelled:
+                cancelled = token.reason
+            else:
+                error = f"{type(e).__name__}: {e}"
+        finally:
+            if checkpointer is not None:
+                checkpointer.close(keep=keep and cancelled != "client")
+            token.close()
+            inboxes.pop(key, None)
+            tokens.pop(key, None)
+        if cancelled is not None:
+            send("cancelled", key, cancelled, token.aborted_calls)
+        else:
+            send("done", key, error)
+
+    runs = ThreadPoolExecutor(max_workers=runs_per_worker, thread_name_prefix="worker-run")
+    send("ready", None, None)
+    while True:
+        try:
+            kind, key, *payload = conn.recv()
+        except (EOFError, OSError):
+            break
+        if kind == "run":
+            inboxes[key] = queue.Queue()
+            tokens[key] = RunToken()
+            runs.submit(run, key, *payload)
+        elif kind == "input" and key in inboxes:
+            inboxes[key].put(payload[0])
+        elif kind == "cancel" and key in tokens:
+            tokens[key].cancel(payload[0])
+            inboxes[key].put(CANCEL)
+        elif kind == "stop":
+            break
+
+
+class Worker:
+    def __init__(self, context, index, runs_per_worker, warmup, share):
+        self.index = index
+        self.conn, child = context.Pipe()
+        self.process = context.Process(
+            target=worker_main, args=(child, runs_per_worker, warmup, share), name=f"session-worker-{index}", daemon=True,
+        )
+        self.process.start()
+        child.close()
+        self.started_at = time.time()
+        self.ready = threading.Event()
+        # key -> queue of messages for the engine thread relaying that run
+        self.runs = {}
+        self._send_lock = threading.Lock()
+
+    def send(self, *message):
+        with self._send_lock:
+            self.conn.send(message)
+
+
+class WorkerPool:
+    def __init__(self, processes, runs_per_worker=4, flows=(), warmup=()):
+        self.processes = processes
+        self.runs_per_worker = runs_per_worker
+        self.flows = set(flows)
+        self.warmup = list(warmup)
+        # spawn, not fork: the front process already runs server and engine threads
+        self._context = multiprocessing.get_context("spawn")
+        self._workers = []
+        self._lock = threading.Lock()
+        self._started = False
+        self._closed = False
+        self._failed_starts = 0
+        self.crashes = 0
+        self.completed = 0
+
+    def __contains__(self, flow):
+        return flow in self.flows
+
+    def start(self):
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("The worker pool is closed")
+            first, self._started = not self._started, True
+            while len(self._workers) < self.processes:
+                self._workers.append(self._spawn(len(self._workers)))
+        if first:
+            # registered after multiprocessing's own exit hook, so it runs before that one
+            # terminates the workers (which would get them replaced)
+            atexit.register(self.close)
+
+    def wait_ready(self, timeout=None):
+        """Block until every worker has imported and warmed its flows."""
+        with self._lock:
+            workers = list(self._workers)
+        return all(worker.ready.wait(timeout) for worker in workers)
+
+    def _spawn(self, index):
+        worker = Worker(self._context, index, self.runs_per_worker, self.warmup, 1 / self.processes)
+        threading.Thread(target=self._read, args=(worker,), name=f"worker-reader-{index}", daemon=True).start()
+        return worker
+
+    def _read(self, worker):
+        # one reader per worker hands every message to the queue of the run it belongs to
+        while True:
+            try:
+                kind, key, *payload = worker.conn.recv()
+            except (EOFError, OSError):
+                break
+            if kind == "ready":
+                worker.ready.set()
+                continue
+            with self._lock:
+                inbox = worker.runs.get(key)
+            if inbox is not None:
+                inbox.put((kind, *payload))
+        self._replace(worker)
+
+    def _replace(self, worker):
+        with self._lock:
+            if self._closed or worker not in self._workers:
+                return
+            self.crashes += 1
+            self._workers.remove(worker)
+            orphans = list(worker.runs.values())
+            worker.runs.clear()
+            # a worker that dies before it is ready will most likely do it again: back off
+            self._failed_starts = 0 if worker.ready.is_set() else self._failed_starts + 1
+            delay = min(RESTART_BACKOFF_MAX, RESTART_BACKOFF * 2 ** self._failed_starts) if self._failed_starts else 0
+        worker.process.join(timeout=1)
+        print(f" - worker {worker.index} exited with code {worker.process.exitcode}, restarting in {delay:g}s", flush=True)
+        for inbox in orphans:
+            inbox.put(("crashed", worker.process.exitcode))
+        time.sleep(delay)
+        with self._lock:
+            if not self._closed:
+                self._workers.append(self._spawn(worker.index))
+
+    def run(self, session, message, checkpoint=None):
+        """Run the session's flow on a worker, relaying its events to the session; blocks until done.
+
+        `checkpoint` is (session id, session id to resume from or None) for a checkpointed run.
+        """
+        self.start()
+        key = uuid.uuid4().hex
+        inbox = queue.Queue()
+        with self._lock:
+            if not self._workers:
+                raise WorkerCrashed("No session worker is running")
+            worker = min(self._workers, key=lambda w: len(w.runs))
+            worker.runs[key] = inbox
+
+        # the run's deadline and cancels are enforced by the front, the worker's token follows
+        def forward(reason):
+            try:
+                worker.send("cancel", key, reason)
+            except OSError:
+                pass
+
+        token = current_run.get()
+        try:
+            worker.send("run", key, session.flow, message, (session.id, session.account_tier), checkpoint)
+            if token is not None:
+                token.on_cancel(forward)
+            while True:
+                kind, *payload = inbox.get()
+                if kind == "event":
+                    session.emit(payload[0])
+                elif kind == "chunk":
+                    session.emit_chunk(*payload)
+                elif kind == "prompt":
+                    worker.send("input", key, session.stream.input(payload[0]))
+                elif kind == "done":
+                    if payload[0] is not None:
+                        raise RuntimeError(payload[0])
+                    with self._lock:
+                        self.completed += 1
+                    return None
+                elif kind == "cancelled":
+                    reason, token.aborted_calls = payload[0], token.aborted_calls + payload[1]
+                    raise RunCancelled(reason)
+                elif kind == "crashed":
+                    session.emit({"type": "error", "content": {"content": "The worker running this session crashed, please retry."}})
+                    raise WorkerCrashed(f"worker {worker.index} exited with code {payload[0]}")
+        finally:
+            if token is not None:
+                token.remove_callback(forward)
+            with self._lock:
+                worker.runs.pop(key, None)
+
+    def stats(self):
+        with self._lock:
+            workers = [
+                {
+                    "pid": worker.process.pid,
+                    "alive": worker.process.is_alive(),
+                    "ready": worker.ready.is_set(),
+                    "active_runs": len(worker.runs),
+                    "uptime_s": round(time.time() - worker.started_at, 1),
+                }
+                for worker in self._workers
+            ]
+            return {
+                "processes": self.processes,
+                "runs_per_worker": self.runs_per_worker,
+                "flows": sorted(self.flows),
+                "completed_runs": self.completed,
+                "crashes": self.crashes,
+                "workers": workers,
+            }
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            workers, self._workers = self._workers, []
+        for worker in workers:
+            try:
+                worker.send("stop", None)
+            except OSError:
+                pass
+            worker.process.join(timeout=5)
@@ -1,20 +1,72 @@
 from fastapi import FastAPI
-from app.api.api_manager import chat
-from autogen.io.websockets import IOWebsockets
-from app.agents.agentchat_websockets import on_connect
+from app.api.api_manager import startup, health, chat, chat_status, chat_stream, session_stats, flow_stats, flow_registry_stats, cache_stats, cluster_stats, http_pool_stats, admission_stats, llm_scheduler_stats, llm_router_stats, compaction_stats, list_traces, get_trace
+from app.core.config import FLOW_WARMUP, WS_COMPRESSION, CHECKPOINT_CLEANUP_SECONDS
 from contextlib import asynccontextmanager
 import threading
+import traceback
 
 WS_PORT = 8765
 
+def start_stack():
+    # autogen and the agent stack load here, off the startup path: the HTTP routes answer while
+    # this thread imports, warms FLOW_WARMUP and brings up the websocket server
+    from app.agents import agentchat_websockets as stack
+
+    if stack.session_workers is not None:
+        # the workers import and warm the flows themselves
+        stack.session_workers.start()
+    else:
+        stack.warm_flows(FLOW_WARMUP)
+    stack.start_cluster()
+    if stack.checkpoint_store is not None:
+        stack.checkpoint_store.start_cleanup(CHECKPOINT_CLEANUP_SECONDS)
+    return stack
+
+def serve_websockets(stop):
+    stack = None
+    try:
+        from autogen.io.websockets import IOWebsockets
+
+        stack = start_stack()
+        with IOWebsockets.run_server_in_thread(on_connect=stack.client_handler, port=WS_PORT, compression=WS_COMPRESSION or None) as uri:
+            startup.ready(stack)
+            print(f"WebSocket server is running on {uri}")
+            stop.wait()
+    except Exception as e:
+        # the HTTP app stays up for the stats routes, GET /health reports the failure
+        startup.failed(e)
+        print(f" - serve_websockets(): the agent stack failed to start: {startup.error}", flush=True)
+        traceback.print_exc()
+    finally:
+        if stack is not None and stack.session_workers is not None:
+            stack.session_workers.close()
+
 @asynccontextmanager
 async def start_ws_server(app: FastAPI):
-    with IOWebsockets.run_server_in_thread(on_connect=on_connect, port=WS_PORT) as uri:
-        print(f"WebSocket server is running on {uri}")
-        yield
+    stop = threading.Event()
+    server = threading.Thread(target=serve_websockets, args=(stop,), name="ws-server", daemon=True)
+    server.start()
+    yield
+    stop.set()
+    server.join()
 
 app = FastAPI(lifespan=start_ws_server)
+app.get("/health")(health)
 app.post("/chat")(chat)
+app.get("/chat/{job_id}")(chat_status)
+app.get("/chat/{job_id}/stream")(chat_stream)
+app.get("/sessions")(session_stats)
+app.get("/cluster")(cluster_stats)
+app.get("/flows")(flow_stats)
+app.get("/flows/registry")(flow_registry_stats)
+app.get("/cache")(cache_stats)
+app.get("/history")(compaction_stats)
+app.get("/http")(http_pool_stats)
+app.get("/admission")(admission_stats)
+app.get("/llm/scheduler")(llm_scheduler_stats)
+app.get("/llm/router")(llm_router_stats)
+app.get("/traces")(list_traces)
+app.get("/traces/{run_id}")(get_trace)
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,84 @@
+import threading
+import time
+
+import pytest
+
+from app.core.admission import AdmissionController, Busy
+
+
+def test_full_queue_turns_runs_away():
+    release = threading.Event()
+    admission = AdmissionController(max_active=1, max_pending=1)
+    try:
+        running = admission.submit("chat", release.wait, 5)
+        queued = admission.submit("chat", lambda: None)
+        with pytest.raises(Busy) as busy:
+            admission.submit("chat", lambda: None)
+        assert busy.value.reason == "queue_full"
+        assert busy.value.retry_after >= 1
+        assert admission.rejected == {"queue_full": 1, "wait": 0}
+        release.set()
+        running.result(5)
+        queued.result(5)
+        # room again once the queue has drained
+        admission.submit("chat", lambda: None).result(5)
+    finally:
+        release.set()
+        admission.shutdown()
+
+
+def test_projected_wait_over_max_wait_turns_runs_away():
+    release = threading.Event()
+    admission = AdmissionController(max_active=1, max_wait=0.5)
+    try:
+        # the average run time comes from finished runs
+        admission.submit("research", time.sleep, 0.4).result(5)
+        running = admission.submit("research", release.wait, 5)
+        # one run ahead: about 0.4 s
+        queued = admission.submit("research", lambda: None)
+        # two runs ahead: about 0.8 s, over max_wait
+        assert admission.projected_wait("research") > 0.5
+        with pytest.raises(Busy) as busy:
+            admission.submit("research", lambda: None)
+        assert busy.value.reason == "wait"
+        assert busy.value.retry_after == 1
+        release.set()
+        running.result(5)
+        queued.result(5)
+    finally:
+        release.set()
+        admission.shutdown()
+
+
+def test_flow_at_its_limit_does_not_hold_up_other_flows():
+    release = threading.Event()
+    admission = AdmissionController(max_active=2, flow_limits={"research": 1})
+    try:
+        admission.submit("research", release.wait, 5)
+        waiting = admission.submit("research", lambda: "research")
+        chat = admission.submit("chat", lambda: "chat")
+        assert chat.result(5) == "chat"
+        assert not waiting.done()
+        release.set()
+        assert waiting.result(5) == "research"
+    finally:
+        release.set()
+        admission.shutdown()
+
+
+def test_cancelled_queued_run_leaves_the_queue():
+    release = threading.Event()
+    ran = []
+    admission = AdmissionController(max_active=1)
+    try:
+        admission.submit("chat", release.wait, 5)
+        queued = admission.submit("chat", ran.append, "queued")
+        assert admission.stats()["flows"]["chat"]["pending"] == 1
+        assert queued.cancel()
+        assert admission.stats()["flows"]["chat"]["pending"] == 0
+        release.set()
+        admission.submit("chat", ran.append, "next").result(5)
+        assert ran == ["next"]
+    finally:
+        release.set()
+        admission.shutdown()
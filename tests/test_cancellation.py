@@ -0,0 +1,111 @@
+import json
+import time
+
+from app.core.cancellation import check_current
+from app.core.sessions import SessionEngine, SessionStream
+
+
+class FakeSocket:
+    def __init__(self):
+        self.sent = []
+
+    def send(self, data):
+        self.sent.append(data)
+
+
+class FakeIOStream:
+    def __init__(self):
+        self.websocket = FakeSocket()
+
+    def send(self, event):
+        self.websocket.send(event.model_dump_json())
+
+
+def asks_for_input(session):
+    session.flow = "ask"
+    session.run = lambda message: SessionStream(session).input("Anything else? ")
+    return session
+
+
+def keeps_working(session):
+    # a run that checks its token between turns, as agents do
+    def run(message):
+        while True:
+            check_current()
+            time.sleep(0.01)
+
+    session.flow = "work"
+    session.run = run
+    return session
+
+
+def wait_until(condition, seconds=5):
+    until = time.monotonic() + seconds
+    while not condition():
+        if time.monotonic() > until:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+def cancelled_events(session):
+    events = [json.loads(data) for data in session.iostream.websocket.sent if data.startswith("{")]
+    return [event["content"]["reason"] for event in events if event["type"] == "cancelled"]
+
+
+def test_client_cancel_wakes_a_run_waiting_for_input():
+    engine = SessionEngine(max_active_runs=1)
+    session = asks_for_input(engine.open(FakeIOStream()))
+    engine.deliver(session, "hello")
+    assert wait_until(lambda: engine.stats()["running"] == 1)
+    assert engine.cancel(session, "client")
+    assert wait_until(lambda: engine.stats()["running"] == 0)
+    assert engine.cancellation_stats()["cancelled_runs"] == {"client": 1}
+    assert wait_until(lambda: cancelled_events(session) == ["client"])
+    assert not engine.cancel(session, "client")
+
+
+def test_client_cancel_drops_a_queued_run():
+    engine = SessionEngine(max_active_runs=1)
+    first = asks_for_input(engine.open(FakeIOStream()))
+    second = asks_for_input(engine.open(FakeIOStream()))
+    engine.deliver(first, "hello")
+    engine.deliver(second, "hello")
+    assert wait_until(lambda: engine.stats()["queued"] == 1)
+    assert engine.cancel(second, "client")
+    assert engine.cancellation_stats()["cancelled_queued"] == 1
+    assert cancelled_events(second) == ["client"]
+    engine.cancel(first, "client")
+    assert wait_until(lambda: engine.stats()["running"] == 0)
+    time.sleep(0.1)
+    assert engine.stats()["running"] == 0 and engine.stats()["queued"] == 0
+
+
+def test_disconnect_stops_the_run():
+    engine = SessionEngine(max_active_runs=1)
+    session = keeps_working(engine.open(FakeIOStream()))
+    engine.deliver(session, "hello")
+    assert wait_until(lambda: engine.stats()["running"] == 1)
+    engine.close(session)
+    assert wait_until(lambda: engine.cancellation_stats()["cancelled_runs"] == {"closed": 1})
+    # nobody is left to tell
+    assert cancelled_events(session) == []
+
+
+def test_deadline_stops_a_working_run():
+    engine = SessionEngine(max_active_runs=1, run_deadline=0.2)
+    session = keeps_working(engine.open(FakeIOStream()))
+    started = time.monotonic()
+    engine.deliver(session, "hello")
+    assert wait_until(lambda: engine.cancellation_stats()["cancelled_runs"] == {"deadline": 1})
+    assert time.monotonic() - started < 2
+    assert wait_until(lambda: cancelled_events(session) == ["deadline"])
+
+
+def test_deadline_wakes_a_run_waiting_for_input():
+    engine = SessionEngine(max_active_runs=1)
+    session = asks_for_input(engine.open(FakeIOStream()))
+    session.deadline = 0.2
+    engine.deliver(session, "hello")
+    assert wait_until(lambda: engine.cancellation_stats()["cancelled_runs"] == {"deadline": 1})
+    assert engine.stats()["running"] == 0
@@ -0,0 +1,90 @@
+import time
+
+from app.core.broker import LocalBroker
+from app.core.cluster import SessionGateway, SessionNode
+from app.core.sessions import SessionEngine, SessionStream
+
+
+def report(broker, node_id, active_runs=0, capacity=2, sessions=0, number=1):
+    broker.report_load(node_id, {"sessions": sessions, "active_runs": active_runs, "capacity": capacity, "report": number})
+
+
+def wait_until(condition, seconds=5):
+    until = time.monotonic() + seconds
+    while not condition():
+        if time.monotonic() > until:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+def asks_for_input(session):
+    # a flow whose run waits for the client, as a human input prompt does
+    session.flow = "ask"
+    session.run = lambda message: SessionStream(session).input("Anything else? ")
+
+
+def test_new_sessions_go_to_the_node_with_free_slots():
+    broker = LocalBroker()
+    gateway = SessionGateway(broker)
+    report(broker, "a", active_runs=1)
+    report(broker, "b")
+    assert gateway.place() == "b"
+
+
+def test_a_burst_of_sessions_is_spread_before_the_next_report():
+    broker = LocalBroker()
+    gateway = SessionGateway(broker)
+    report(broker, "a", active_runs=2)
+    report(broker, "b")
+    # b has room for two, then both nodes are full and a has fewer sessions
+    assert [gateway.place() for _ in range(3)] == ["b", "b", "a"]
+
+
+def test_silent_nodes_get_no_sessions():
+    broker = LocalBroker()
+    gateway = SessionGateway(broker, node_ttl=0.1)
+    report(broker, "a")
+    time.sleep(0.2)
+    report(broker, "b", active_runs=2)
+    assert gateway.place() == "b"
+
+
+def test_detached_session_keeps_its_output_for_the_reconnect():
+    broker = LocalBroker()
+    engine = SessionEngine(max_active_runs=1)
+    node = SessionNode("a", broker, engine, asks_for_input, engine.deliver, heartbeat=0.05, detach_seconds=60).start()
+    frames = []
+    subscription = broker.subscribe("session.s1", frames.append)
+    try:
+        node._command(("open", "s1", "c1"))
+        node._command(("detach", "s1", "c1"))
+        node._command(("input", "s1", "hello"))
+        assert wait_until(lambda: node.stats()["backlog_frames"] == 1)
+        assert frames == []
+        node._command(("attach", "s1", "c2"))
+        assert wait_until(lambda: frames == ["Anything else? "])
+        assert node.stats()["reaped"] == 0
+    finally:
+        subscription.close()
+        node.close()
+
+
+def test_detached_session_waiting_for_input_is_cancelled_and_reaped():
+    broker = LocalBroker()
+    engine = SessionEngine(max_active_runs=1)
+    node = SessionNode("a", broker, engine, asks_for_input, engine.deliver, heartbeat=0.05, detach_seconds=0.3).start()
+    try:
+        node._command(("open", "s1", "c1"))
+        node._command(("input", "s1", "hello"))
+        assert wait_until(lambda: engine.stats()["running"] == 1)
+        node._command(("detach", "s1", "c1"))
+        assert wait_until(lambda: node.stats()["reaped"] == 1)
+        assert engine.cancellation_stats()["cancelled_runs"] == {"detached": 1}
+        assert broker.route("s1") is None
+        # its run slot is free for the next session
+        node._command(("open", "s2", "c2"))
+        node._command(("input", "s2", "hello"))
+        assert wait_until(lambda: engine.stats()["running"] == 1)
+    finally:
+        node.close()
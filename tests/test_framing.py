@@ -0,0 +1,81 @@
+import json
+import threading
+import time
+
+import pytest
+
+from app.core.framing import FrameWriter
+
+
+class FakeSocket:
+    def __init__(self):
+        self.sent = []
+        self.frame = threading.Event()
+
+    def send(self, data):
+        self.sent.append(data)
+        self.frame.set()
+
+
+def test_unbatched_events_are_frames_of_their_own():
+    socket = FakeSocket()
+    writer = FrameWriter(socket)
+    writer.write({"type": "text", "content": 1})
+    writer.write({"type": "text", "content": 2})
+    assert [json.loads(data) for data in socket.sent] == [{"type": "text", "content": 1}, {"type": "text", "content": 2}]
+
+
+def test_batched_events_are_flushed_together_after_max_delay():
+    socket = FakeSocket()
+    writer = FrameWriter(socket, batch=True, max_delay=0.05)
+    for i in range(3):
+        writer.write({"type": "text", "content": i})
+    assert socket.sent == []
+    assert socket.frame.wait(2)
+    assert [json.loads(data) for data in socket.sent] == [[{"type": "text", "content": i} for i in range(3)]]
+    assert writer.stats()["events_per_frame"] == 3
+
+
+def test_batch_is_sent_once_max_bytes_are_pending():
+    socket = FakeSocket()
+    writer = FrameWriter(socket, batch=True, max_delay=60, max_bytes=64)
+    writer.write({"type": "text", "content": "x" * 20})
+    assert socket.sent == []
+    writer.write({"type": "text", "content": "y" * 20})
+    assert len(socket.sent) == 1 and len(json.loads(socket.sent[0])) == 2
+
+
+def test_input_prompt_comes_after_the_pending_batch():
+    socket = FakeSocket()
+    writer = FrameWriter(socket, batch=True, max_delay=60)
+    writer.write({"type": "text", "content": "question"})
+    writer.write_text("Your answer: ")
+    assert len(socket.sent) == 2
+    assert json.loads(socket.sent[0]) == [{"type": "text", "content": "question"}]
+    assert socket.sent[1] == "Your answer: "
+
+
+@pytest.mark.parametrize("max_delay", [float("inf"), float("nan")])
+def test_bad_max_delay_does_not_stop_other_writers_flushing(max_delay):
+    FrameWriter(FakeSocket(), batch=True, max_delay=max_delay).write({"type": "text", "content": "stuck"})
+    socket = FakeSocket()
+    FrameWriter(socket, batch=True, max_delay=0.05).write({"type": "text", "content": "on time"})
+    started = time.monotonic()
+    assert socket.frame.wait(2)
+    assert time.monotonic() - started < 1
+    assert json.loads(socket.sent[0]) == [{"type": "text", "content": "on time"}]
+
+
+def test_msgpack_interns_agent_names():
+    msgpack = pytest.importorskip("msgpack")
+    socket = FakeSocket()
+    writer = FrameWriter(socket, encoding="msgpack")
+    event = {"type": "text", "content": {"sender": "tech_agent", "recipient": "user", "content": "hi"}}
+    writer.write(event)
+    writer.write(event)
+    frames = [msgpack.unpackb(data) for data in socket.sent]
+    assert frames[:2] == [
+        {"type": "name", "content": {"i": 1, "x": "tech_agent"}},
+        {"type": "name", "content": {"i": 2, "x": "user"}},
+    ]
+    assert frames[2] == frames[3] == {"type": "text", "content": {"sender": 1, "recipient": 2, "content": "hi"}}
@@ -0,0 +1,30 @@
+import json
+
+from app.core.llm_cache import ResponseCache
+
+PARAMS = {
+    "model": "gpt-4o-mini",
+    "messages": [{"role": "user", "content": "My laptop won't start."}],
+    "tools": [{"type": "function", "function": {"name": "classify_query"}}],
+    "temperature": 0,
+}
+
+
+def test_string_keys_ignore_other_create_params():
+    # what ag2's get_key() passes on releases that serialize the params
+    agent = ResponseCache().for_agent("triage_agent")
+    agent.set(json.dumps({**PARAMS, "stream": False, "user": "a"}), {"reply": "restart it"})
+    assert agent.get(json.dumps({**PARAMS, "stream": True, "user": "b"})) == {"reply": "restart it"}
+
+
+def test_dict_keys_ignore_other_create_params():
+    agent = ResponseCache().for_agent("triage_agent")
+    agent.set({**PARAMS, "stream": False}, {"reply": "restart it"})
+    assert agent.get({**PARAMS, "stream": True}) == {"reply": "restart it"}
+
+
+def test_key_fields_still_miss():
+    agent = ResponseCache().for_agent("triage_agent")
+    agent.set(json.dumps(PARAMS), {"reply": "restart it"})
+    assert agent.get(json.dumps({**PARAMS, "temperature": 1})) is None
+    assert agent.get(json.dumps({**PARAMS, "messages": [{"role": "user", "content": "Hi"}]})) is None
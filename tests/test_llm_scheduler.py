@@ -0,0 +1,38 @@
+import threading
+import time
+
+from app.core.llm_scheduler import LLMScheduler
+
+
+def acquire_within(scheduler, tokens, seconds):
+    # acquire() blocks; run it on a thread so a bucket that never fills fails the test instead of hanging it
+    done = threading.Event()
+    thread = threading.Thread(target=lambda: (scheduler.acquire(tokens), done.set()), daemon=True)
+    thread.start()
+    return done.wait(seconds)
+
+
+def test_rpm_below_60_still_sends():
+    scheduler = LLMScheduler(rpm=30)
+    assert acquire_within(scheduler, 10, 1)
+
+
+def test_rpm_below_60_keeps_the_rate():
+    scheduler = LLMScheduler(rpm=30)
+    assert acquire_within(scheduler, 10, 1)
+    started = time.monotonic()
+    # the second request waits for the bucket to refill one request at 0.5 a second
+    assert acquire_within(scheduler, 10, 5)
+    assert time.monotonic() - started > 1.5
+
+
+def test_scaled_share_below_60_still_sends():
+    # LLM_RPM=120 over four worker processes
+    scheduler = LLMScheduler(rpm=120)
+    scheduler.scale(1 / 4)
+    assert acquire_within(scheduler, 10, 1)
+
+
+def test_tpm_below_60_still_sends():
+    scheduler = LLMScheduler(tpm=30)
+    assert acquire_within(scheduler, 500, 1)
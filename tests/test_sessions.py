@@ -0,0 +1,95 @@
+import threading
+import time
+
+from app.core.sessions import SessionEngine
+
+
+class FakeSocket:
+    def __init__(self):
+        self.sent = []
+
+    def send(self, data):
+        self.sent.append(data)
+
+
+class FakeIOStream:
+    def __init__(self):
+        self.websocket = FakeSocket()
+
+    def send(self, event):
+        self.websocket.send(event.model_dump_json())
+
+
+class Gate:
+    # runs that block until released, counting how many run at once
+    def __init__(self):
+        self.release = threading.Event()
+        self.started = []
+        self.running = 0
+        self.peak = 0
+        self._lock = threading.Lock()
+
+    def run(self, message):
+        with self._lock:
+            self.started.append(message)
+            self.running += 1
+            self.peak = max(self.peak, self.running)
+        self.release.wait(5)
+        with self._lock:
+            self.running -= 1
+
+
+def open_session(engine, run):
+    session = engine.open(FakeIOStream())
+    session.flow, session.run = "chat", run
+    return session
+
+
+def wait_until(condition, seconds=5):
+    until = time.monotonic() + seconds
+    while not condition():
+        if time.monotonic() > until:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+def test_runs_beyond_max_active_runs_queue():
+    engine = SessionEngine(max_active_runs=2)
+    gate = Gate()
+    sessions = [open_session(engine, gate.run) for _ in range(4)]
+    for i, session in enumerate(sessions):
+        engine.deliver(session, f"message {i}")
+    assert wait_until(lambda: len(gate.started) == 2)
+    time.sleep(0.1)
+    stats = engine.stats()
+    assert (stats["running"], stats["queued"]) == (2, 2)
+    gate.release.set()
+    assert wait_until(lambda: engine.stats()["completed_runs"] == 4)
+    assert gate.peak == 2
+    assert engine.stats()["idle"] == 4
+
+
+def test_idle_sessions_hold_no_run_slot():
+    engine = SessionEngine(max_active_runs=1)
+    idle = [open_session(engine, None) for _ in range(10)]
+    done = []
+    session = open_session(engine, done.append)
+    engine.deliver(session, "hello")
+    assert wait_until(lambda: done == ["hello"])
+    assert engine.stats()["sessions"] == len(idle) + 1
+
+
+def test_message_to_a_busy_session_starts_its_next_run():
+    engine = SessionEngine(max_active_runs=4)
+    gate = Gate()
+    session = open_session(engine, gate.run)
+    engine.deliver(session, "first")
+    assert wait_until(lambda: gate.started == ["first"])
+    # nobody asks for input: the message waits in the inbox for the next run of the flow
+    engine.deliver(session, "second")
+    assert session.inbox.qsize() == 1
+    gate.release.set()
+    assert wait_until(lambda: engine.stats()["completed_runs"] == 2)
+    assert gate.started == ["first", "second"]
+    assert gate.peak == 1
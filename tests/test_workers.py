@@ -0,0 +1,106 @@
+import os
+import signal
+import socket
+import threading
+import time
+
+import pytest
+
+from app.core.sessions import SessionEngine
+from app.core.workers import WorkerCrashed, WorkerPool
+
+
+class FakeSocket:
+    def __init__(self):
+        self.sent = []
+
+    def send(self, data):
+        self.sent.append(data)
+
+
+class FakeIOStream:
+    def __init__(self):
+        self.websocket = FakeSocket()
+
+    def send(self, event):
+        self.websocket.send(event.model_dump_json())
+
+
+class SilentLLM:
+    # accepts the LLM calls of the worker and never answers, so a run stays in flight
+    def __init__(self):
+        self.server = socket.create_server(("127.0.0.1", 0))
+        self.port = self.server.getsockname()[1]
+        self.connected = threading.Event()
+        self.connections = []
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def _accept(self):
+        while True:
+            try:
+                connection, _ = self.server.accept()
+            except OSError:
+                return
+            self.connections.append(connection)
+            self.connected.set()
+
+    def close(self):
+        self.server.close()
+        for connection in self.connections:
+            connection.close()
+
+
+def wait_until(condition, seconds):
+    until = time.monotonic() + seconds
+    while not condition():
+        if time.monotonic() > until:
+            return False
+        time.sleep(0.05)
+    return True
+
+
+@pytest.fixture
+def llm(monkeypatch):
+    # spawned workers read the LLM endpoint from the environment they inherit
+    llm = SilentLLM()
+    monkeypatch.setenv("LLM_BACKEND", "mock")
+    monkeypatch.setenv("MOCK_LLM_URL", f"http://127.0.0.1:{llm.port}/v1")
+    monkeypatch.setenv("OPENAI_API_KEY", "mock")
+    monkeypatch.setenv("TRACE_DIR", "")
+    monkeypatch.setenv("CHECKPOINT_DIR", "")
+    yield llm
+    llm.close()
+
+
+def test_crashed_worker_fails_its_run_and_is_replaced(llm):
+    pool = WorkerPool(1, flows=["tech_support"])
+    try:
+        pool.start()
+        assert pool.wait_ready(120)
+        pid = pool.stats()["workers"][0]["pid"]
+        session = SessionEngine().open(FakeIOStream())
+        session.flow = "tech_support"
+        failed = []
+
+        def run():
+            try:
+                pool.run(session, "My laptop won't start.")
+            except Exception as e:
+                failed.append(e)
+
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        assert llm.connected.wait(60)
+        os.kill(pid, signal.SIGKILL)
+        thread.join(10)
+        assert len(failed) == 1 and isinstance(failed[0], WorkerCrashed)
+        assert any("crashed" in str(data) for data in session.iostream.websocket.sent)
+        # a new worker takes the dead one's place, and is ready for the next run
+        assert wait_until(lambda: pool.stats()["crashes"] == 1 and len(pool.stats()["workers"]) == 1, 10)
+        assert pool.wait_ready(120)
+        worker = pool.stats()["workers"][0]
+        assert worker["pid"] != pid and worker["alive"]
+    finally:
+        pool.close()
+    # stopping the pool is not a crash
+    assert pool.stats()["crashes"] == 1